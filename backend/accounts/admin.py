@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Currency, Account, ExchangeRate
+from .models import Currency, Account, ExchangeRate, BalanceCheckpoint
 
 @admin.register(Currency)
 class CurrencyAdmin(admin.ModelAdmin):
@@ -23,3 +23,11 @@ class ExchangeRateAdmin(admin.ModelAdmin):
     search_fields = ('user__email', 'from_currency__code', 'to_currency__code')
     raw_id_fields = ('user', 'from_currency', 'to_currency')
     ordering = ('-date',)
+
+@admin.register(BalanceCheckpoint)
+class BalanceCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('account', 'date', 'balance', 'created_at')
+    list_filter = ('date',)
+    search_fields = ('account__name', 'account__user__email')
+    raw_id_fields = ('account',)
+    ordering = ('-date',)
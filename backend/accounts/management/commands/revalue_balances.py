@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from accounts.revaluation import REVALUATION_BATCH_SIZE, revalue_accounts
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Revalue the base-currency balance of foreign-currency accounts at the rates of a date.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Use the rates in effect on this date (YYYY-MM-DD). Defaults to today.',
+        )
+        parser.add_argument(
+            '--email',
+            action='append',
+            dest='emails',
+            help='Only revalue accounts of the user with this email address (can be repeated).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=REVALUATION_BATCH_SIZE,
+            help='Accounts loaded and written per batch.',
+        )
+
+    def handle(self, *args, **options):
+        on_date = timezone.localdate()
+        if options['date']:
+            on_date = parse_date(options['date'])
+            if on_date is None:
+                raise CommandError('--date must be a date in YYYY-MM-DD format')
+
+        if options['emails']:
+            user_ids = list(User.objects.filter(email__in=options['emails']).values_list('id', flat=True))
+        else:
+            user_ids = [None]
+        timings = []
+        for user_id in user_ids:
+            timings.extend(revalue_accounts(on_date, user_id=user_id, batch_size=max(1, options['batch_size'])))
+
+        if options['verbosity'] >= 1:
+            for timing in timings:
+                self.stdout.write(
+                    f"Batch {timing.batch}: revalued {timing.revalued}/{timing.accounts} accounts "
+                    f"(load {timing.load_seconds:.3f}s, compute {timing.compute_seconds:.3f}s, "
+                    f"write {timing.write_seconds:.3f}s)"
+                )
+            total = sum(timing.revalued for timing in timings)
+            self.stdout.write(f"Revalued {total} accounts at the rates of {on_date}")
@@ -65,3 +65,23 @@ class ExchangeRate(UUIDModel):
 
     def __str__(self):
         return f"{self.from_currency.code}/{self.to_currency.code} - {self.date}"
+
+class BalanceCheckpoint(models.Model):
+    """
+    Net of all non-archived transactions of an account dated on or before
+    ``date`` (the initial balance is not included). Point-in-time balances
+    start from the nearest checkpoint instead of summing the whole history;
+    ``transactions.balances`` keeps existing checkpoints exact on every write.
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    date = models.DateField()
+    balance = models.DecimalField(max_digits=17, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['account', 'date']
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.account.name} @ {self.date}: {self.balance}"
+
@@ -0,0 +1,254 @@
+"""
+Exchange-rate resolution.
+
+A rate for (user, from, to, date) is the user's ``ExchangeRate`` for that
+pair on the latest date on or before the requested one. Pairs without a
+rate of their own are triangulated: the user's rates for the day form a
+graph over currencies (with inverse edges), and the cross rate follows the
+shortest conversion path. The full cross-rate matrix is built once per user
+per day, so callers never search paths per row.
+
+Rate histories and matrices are cached in two layers: a small
+process-local LRU in front of the shared cache. Keys embed a per-user rates
+version that is bumped whenever one of the user's ``ExchangeRate`` rows
+changes, so stale entries are never read again.
+"""
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict, deque
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.db.models import Q
+
+from .models import ExchangeRate
+
+CENT = Decimal('0.01')
+# Precision of stored rates (ExchangeRate.rate, Transaction.exchange_rate)
+RATE_PLACES = Decimal('0.000001')
+
+
+def rates_version_key(user_id):
+    return f'accounts:rates-version:{user_id}'
+
+
+def get_rates_version(user_id):
+    key = rates_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter never repeats an old value
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_rates_version(user_id):
+    key = rates_version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_rates_version_on_commit(user_id):
+    db_transaction.on_commit(lambda: bump_rates_version(user_id))
+
+
+class LRUCache:
+    """A thread-safe, size-bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Holds pair histories, the user's pair lists and cross-rate matrices
+local_histories = LRUCache(settings.EXCHANGE_RATE_LOCAL_CACHE_SIZE)
+
+
+def cross_rates(direct):
+    """
+    Triangulate ``{(from, to): rate}`` into the rate for every reachable
+    pair, following the path with the fewest conversions.
+    """
+    edges = defaultdict(dict)
+    for (from_id, to_id), rate in direct.items():
+        edges[from_id][to_id] = rate
+    # Inverse edges only where there is no rate for that direction
+    for (from_id, to_id), rate in direct.items():
+        edges[to_id].setdefault(from_id, Decimal('1') / rate)
+
+    matrix = {}
+    for source in list(edges):
+        rates = {source: Decimal('1')}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for target, rate in edges[node].items():
+                if target not in rates:
+                    rates[target] = rates[node] * rate
+                    queue.append(target)
+        for target, rate in rates.items():
+            if target != source:
+                matrix[source, target] = rate
+    return matrix
+
+
+class RateResolver:
+    """
+    Resolves and applies exchange rates for one user. Create one per request
+    or batch: it reads the rates version once, and ``prefetch`` loads every
+    missing pair history with at most one cache round trip and one query.
+    """
+
+    def __init__(self, user):
+        self.user_id = user.pk
+        self.base_currency_id = user.base_currency_id
+        self.version = get_rates_version(self.user_id)
+        self.histories = {}
+        self.matrices = {}
+
+    def cache_key(self, pair):
+        return f'accounts:rates:{self.user_id}:{self.version}:{pair[0]}:{pair[1]}'
+
+    def prefetch(self, pairs):
+        missing = set()
+        for from_id, to_id in pairs:
+            pair = (str(from_id), str(to_id))
+            if pair[0] == pair[1] or pair in self.histories:
+                continue
+            history = local_histories.get((self.user_id, self.version, pair))
+            if history is None:
+                missing.add(pair)
+            else:
+                self.histories[pair] = history
+        if not missing:
+            return
+
+        keys = {self.cache_key(pair): pair for pair in missing}
+        for key, history in cache.get_many(keys).items():
+            self.remember(keys[key], history)
+            missing.discard(keys[key])
+        if not missing:
+            return
+
+        loaded = {pair: ([], []) for pair in missing}
+        condition = Q()
+        for from_id, to_id in missing:
+            condition |= Q(from_currency_id=from_id, to_currency_id=to_id)
+        rows = (
+            ExchangeRate.objects.filter(condition, user_id=self.user_id)
+            .order_by('date')
+            .values_list('from_currency_id', 'to_currency_id', 'date', 'rate')
+        )
+        for from_id, to_id, day, rate in rows:
+            dates, rates = loaded[str(from_id), str(to_id)]
+            dates.append(day)
+            rates.append(rate)
+        histories = {pair: (tuple(dates), tuple(rates)) for pair, (dates, rates) in loaded.items()}
+        cache.set_many(
+            {self.cache_key(pair): history for pair, history in histories.items()},
+            timeout=settings.EXCHANGE_RATE_CACHE_TIMEOUT
+        )
+        for pair, history in histories.items():
+            self.remember(pair, history)
+
+    def remember(self, pair, history):
+        self.histories[pair] = history
+        local_histories.set((self.user_id, self.version, pair), history)
+
+    def direct_rate(self, pair, on_date):
+        self.prefetch([pair])
+        dates, rates = self.histories[pair]
+        index = bisect_right(dates, on_date)
+        return rates[index - 1] if index else None
+
+    def rate(self, from_id, to_id, on_date):
+        """
+        The rate from one currency to another on ``on_date``: the pair's own
+        rate if there is one, else the triangulated cross rate, else None.
+        """
+        if str(from_id) == str(to_id):
+            return Decimal('1')
+        pair = (str(from_id), str(to_id))
+        rate = self.direct_rate(pair, on_date)
+        if rate is None:
+            rate = self.matrix(on_date).get(pair)
+        return rate
+
+    def cached(self, name, build):
+        """Read ``name`` through the local and shared caches at this resolver's version."""
+        local_key = (self.user_id, self.version, name)
+        value = local_histories.get(local_key)
+        if value is None:
+            key = f'accounts:{name}:{self.user_id}:{self.version}'
+            value = cache.get(key)
+            if value is None:
+                value = build()
+                cache.set(key, value, timeout=settings.EXCHANGE_RATE_CACHE_TIMEOUT)
+            local_histories.set(local_key, value)
+        return value
+
+    def currency_pairs(self):
+        """Every (from, to) pair the user has entered a rate for."""
+        return self.cached('rate-pairs', lambda: sorted(
+            (str(from_id), str(to_id))
+            for from_id, to_id in ExchangeRate.objects.filter(user_id=self.user_id)
+            .order_by()
+            .values_list('from_currency_id', 'to_currency_id')
+            .distinct()
+        ))
+
+    def matrix(self, on_date):
+        """Map ``(from, to)`` currency id pairs to their rate on ``on_date`` for every reachable pair."""
+        if on_date not in self.matrices:
+            self.matrices[on_date] = self.cached(
+                f'rate-matrix:{on_date}', lambda: self.build_matrix(on_date)
+            )
+        return self.matrices[on_date]
+
+    def build_matrix(self, on_date):
+        pairs = self.currency_pairs()
+        self.prefetch(pairs)
+        direct = {}
+        for pair in pairs:
+            rate = self.direct_rate(pair, on_date)
+            if rate:
+                direct[pair] = rate
+        return cross_rates(direct)
+
+    def to_base(self, amount, currency_id, on_date):
+        """
+        Return ``(exchange_rate, base_amount)`` for an amount in the user's
+        base currency. Without a base currency the amount is taken as is;
+        without a known rate the rate is None and the amount is unconverted.
+        """
+        if self.base_currency_id is None:
+            return Decimal('1'), amount
+        rate = self.rate(currency_id, self.base_currency_id, on_date)
+        if rate is None:
+            return None, amount
+        rate = rate.quantize(RATE_PLACES, rounding=ROUND_HALF_UP)
+        return rate, (Decimal(amount) * rate).quantize(CENT, rounding=ROUND_HALF_UP)
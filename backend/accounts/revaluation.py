@@ -0,0 +1,118 @@
+"""
+Revaluation of foreign-currency account balances.
+
+Transaction writes move ``Account.base_currency_balance`` by each
+transaction's base amount at the rate of its own date. Revaluation marks
+foreign-currency accounts to market instead: the base balance becomes the
+current balance at the rate for the revaluation date, direct or
+triangulated. Accounts are processed in primary-key batches. Each batch
+takes three queries: the accounts, the latest rate of every pair of their
+owners, and one ``bulk_update``.
+"""
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, time as time_of_day
+
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from .models import Account, ExchangeRate
+from .rates import RATE_PLACES, cross_rates
+
+logger = logging.getLogger(__name__)
+
+REVALUATION_BATCH_SIZE = 1000
+
+
+@dataclass
+class BatchTiming:
+    batch: int
+    accounts: int
+    revalued: int
+    load_seconds: float
+    compute_seconds: float
+    write_seconds: float
+
+
+def latest_rates(user_ids, on_date):
+    """Map each user id to ``{(from, to): rate}`` with the latest rate of every pair on or before ``on_date``."""
+    latest = ExchangeRate.objects.filter(
+        user_id=OuterRef('user_id'),
+        from_currency_id=OuterRef('from_currency_id'),
+        to_currency_id=OuterRef('to_currency_id'),
+        date__lte=on_date,
+    ).order_by('-date').values('date')[:1]
+    rows = (
+        ExchangeRate.objects.filter(user_id__in=user_ids, date=Subquery(latest))
+        .values_list('user_id', 'from_currency_id', 'to_currency_id', 'rate')
+    )
+    rates = defaultdict(dict)
+    for user_id, from_id, to_id, rate in rows:
+        rates[user_id][str(from_id), str(to_id)] = rate
+    return rates
+
+
+def revalue_accounts(on_date, user_id=None, batch_size=REVALUATION_BATCH_SIZE):
+    """
+    Revalue every active account held in a currency other than its owner's
+    base currency (optionally for one user) at the rates of ``on_date``.
+    Accounts without a known rate keep their base balance. Returns one
+    ``BatchTiming`` per batch.
+    """
+    accounts = Account.objects.filter(is_active=True, user__base_currency__isnull=False).exclude(
+        currency=F('user__base_currency')
+    )
+    if user_id is not None:
+        accounts = accounts.filter(user_id=user_id)
+    converted_at = timezone.make_aware(datetime.combine(on_date, time_of_day.min))
+
+    timings = []
+    last_pk = None
+    while True:
+        started = time.monotonic()
+        batch = accounts.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        rows = list(batch.values_list('pk', 'user_id', 'currency_id', 'user__base_currency_id')[:batch_size])
+        if not rows:
+            return timings
+        last_pk = rows[-1][0]
+        rates_by_user = latest_rates({row[1] for row in rows}, on_date)
+        loaded = time.monotonic()
+
+        matrices = {user: cross_rates(direct) for user, direct in rates_by_user.items()}
+        revalued = []
+        for pk, owner_id, currency_id, base_currency_id in rows:
+            rate = matrices.get(owner_id, {}).get((str(currency_id), str(base_currency_id)))
+            if rate is None:
+                continue
+            rate = rate.quantize(RATE_PLACES)
+            # Evaluated by the database, so transaction writes that land
+            # between this read and the update are not lost
+            revalued.append(Account(
+                pk=pk,
+                base_currency_balance=Round(F('current_balance') * Value(rate), 2),
+                last_exchange_rate=rate,
+                last_conversion_date=converted_at,
+            ))
+        computed = time.monotonic()
+
+        Account.objects.bulk_update(
+            revalued, ['base_currency_balance', 'last_exchange_rate', 'last_conversion_date'], batch_size=batch_size
+        )
+        written = time.monotonic()
+
+        timing = BatchTiming(
+            batch=len(timings) + 1,
+            accounts=len(rows),
+            revalued=len(revalued),
+            load_seconds=loaded - started,
+            compute_seconds=computed - loaded,
+            write_seconds=written - computed,
+        )
+        logger.info('Revaluation batch %(batch)d: %(revalued)d/%(accounts)d accounts, load %(load_seconds).3fs, '
+                    'compute %(compute_seconds).3fs, write %(write_seconds).3fs', timing.__dict__)
+        timings.append(timing)
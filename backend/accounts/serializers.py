@@ -1,3 +1,5 @@
+from django.db import transaction as db_transaction
+from django.db.models import F
 from rest_framework import serializers
 from .models import Currency, Account, ExchangeRate
 
@@ -30,6 +32,32 @@ class AccountSerializer(serializers.ModelSerializer):
         validated_data['base_currency_balance'] = validated_data['initial_balance']
         return super().create(validated_data)
 
+    def update(self, instance, validated_data):
+        # Balances are moved by transaction writes with F() deltas, so never
+        # save the loaded values back; shift them by the initial balance change
+        shift = validated_data.get('initial_balance', instance.initial_balance) - instance.initial_balance
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        with db_transaction.atomic():
+            instance.save(update_fields=[*validated_data, 'updated_at'])
+            if shift:
+                Account.objects.filter(pk=instance.pk).update(
+                    current_balance=F('current_balance') + shift,
+                    base_currency_balance=F('base_currency_balance') + shift,
+                )
+                instance.refresh_from_db(fields=['current_balance', 'base_currency_balance'])
+        return instance
+
+class AccountBalanceSerializer(serializers.ModelSerializer):
+    currency = CurrencySerializer(read_only=True)
+    balance = serializers.DecimalField(max_digits=17, decimal_places=2, read_only=True)
+    # In the user's base currency; null when no rate (direct or triangulated) is known
+    base_balance = serializers.DecimalField(max_digits=17, decimal_places=2, read_only=True, allow_null=True)
+
+    class Meta:
+        model = Account
+        fields = ['id', 'name', 'type', 'currency', 'balance', 'base_balance']
+
 class ExchangeRateSerializer(serializers.ModelSerializer):
     from_currency = CurrencySerializer(read_only=True)
     to_currency = CurrencySerializer(read_only=True)
@@ -38,7 +66,7 @@ class ExchangeRateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ExchangeRate
-        fields = ['id', 'from_currency', 'to_currency', 'from_currency_id', 'to_currency_id', 'rate', 'created_at', 'updated_at']
+        fields = ['id', 'from_currency', 'to_currency', 'from_currency_id', 'to_currency_id', 'rate', 'date', 'is_manual', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
     def validate(self, data):
@@ -0,0 +1,22 @@
+from django.db import transaction as db_transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from transactions.caching import bump_data_version_on_commit
+from .models import Account, ExchangeRate
+from .rates import bump_rates_version_on_commit
+from .tasks import revalue_account_balances
+
+
+@receiver([post_save, post_delete], sender=ExchangeRate)
+def exchange_rate_changed(sender, instance, **kwargs):
+    # Cached rate histories are keyed by the user's rates version
+    bump_rates_version_on_commit(instance.user_id)
+    # Runs after the version bump, so the job sees the new rate
+    user_id = str(instance.user_id)
+    db_transaction.on_commit(lambda: revalue_account_balances.delay(user_id=user_id))
+
+
+@receiver([post_save, post_delete], sender=Account)
+def account_changed(sender, instance, **kwargs):
+    # Account names appear in reusable exports
+    bump_data_version_on_commit(instance.user_id)
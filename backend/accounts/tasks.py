@@ -0,0 +1,14 @@
+from dataclasses import asdict
+
+from celery import shared_task
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .revaluation import revalue_accounts
+
+
+@shared_task
+def revalue_account_balances(on_date=None, user_id=None):
+    """Revalue foreign-currency accounts at the rates of ``on_date`` (ISO date, default today)."""
+    on_date = parse_date(on_date) if on_date else timezone.localdate()
+    return [asdict(timing) for timing in revalue_accounts(on_date, user_id=user_id)]
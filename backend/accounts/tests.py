@@ -1,3 +1,285 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from .models import Currency, Account, ExchangeRate
+from .rates import RateResolver, local_histories
+from .revaluation import revalue_accounts
+
+User = get_user_model()
+
+
+class AccountQueryBudgetTests(TestCase):
+    """Listing endpoints must run a fixed number of queries regardless of page size"""
+
+    # endpoint name -> maximum number of queries for one request
+    QUERY_BUDGETS = {
+        'account-list': 2,  # count, page with currency joined
+        'exchange-rate-list': 2,  # count, page with both currencies joined
+        'currency-list': 2,
+    }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='test@example.com',
+            password='TestPass123!'
+        )
+        self.client.force_authenticate(user=self.user)
+        currencies = [
+            Currency.objects.create(code=code, name=code, symbol=code[0])
+            for code in ['USD', 'EUR', 'GBP', 'GHS', 'NGN']
+        ]
+        for i, currency in enumerate(currencies):
+            Account.objects.create(
+                user=self.user,
+                name=f'Account {i}',
+                type='BANK',
+                currency=currency,
+                initial_balance=Decimal('100.00'),
+                current_balance=Decimal('100.00'),
+                base_currency_balance=Decimal('100.00'),
+            )
+            for other in currencies:
+                if other != currency:
+                    ExchangeRate.objects.create(
+                        user=self.user,
+                        from_currency=currency,
+                        to_currency=other,
+                        rate=Decimal('1.5'),
+                        date=date(2024, 1, 1),
+                    )
+
+    def test_list_query_budgets(self):
+        """Test each list endpoint stays within its query budget"""
+        for name, budget in self.QUERY_BUDGETS.items():
+            with self.subTest(endpoint=name):
+                with self.assertNumQueries(budget):
+                    response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_balances_resolve_rates_in_one_query(self):
+        """Test base balances look up every currency's rate at once"""
+        self.user.base_currency = Currency.objects.get(code='USD')
+        self.user.save()
+        local_histories.clear()
+        cache.clear()
+        # accounts with checkpoints, transaction tails, rate histories
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('account-balances'), {'as_of': '2024-03-01'})
+        self.assertEqual(response.data['total_base_balance'], '700.00')
+
+
+class ExchangeRateResolutionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        self.eur = Currency.objects.create(code='EUR', name='Euro', symbol='E')
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='test@example.com',
+            password='TestPass123!'
+        )
+        self.user.base_currency = self.usd
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        for day, rate in [(date(2024, 1, 1), '1.10'), (date(2024, 2, 1), '1.20')]:
+            ExchangeRate.objects.create(
+                user=self.user, from_currency=self.eur, to_currency=self.usd, rate=Decimal(rate), date=day
+            )
+
+    def test_nearest_earlier_rate(self):
+        """Test the latest rate on or before the date is used"""
+        resolver = RateResolver(self.user)
+        self.assertEqual(resolver.rate(self.eur.id, self.usd.id, date(2024, 1, 15)), Decimal('1.10'))
+        self.assertEqual(resolver.rate(self.eur.id, self.usd.id, date(2024, 2, 1)), Decimal('1.20'))
+        self.assertIsNone(resolver.rate(self.eur.id, self.usd.id, date(2023, 12, 31)))
+        self.assertEqual(resolver.rate(self.usd.id, self.usd.id, date(2023, 12, 31)), Decimal('1'))
+        self.assertEqual(
+            resolver.to_base(Decimal('10.00'), self.eur.id, date(2024, 3, 1)),
+            (Decimal('1.20'), Decimal('12.00'))
+        )
+
+    def test_histories_are_cached(self):
+        """Test later resolvers read histories from the local and shared caches"""
+        RateResolver(self.user).rate(self.eur.id, self.usd.id, date(2024, 1, 15))
+        with self.assertNumQueries(0):
+            RateResolver(self.user).rate(self.eur.id, self.usd.id, date(2024, 1, 15))
+        local_histories.clear()
+        with self.assertNumQueries(0):
+            RateResolver(self.user).rate(self.eur.id, self.usd.id, date(2024, 1, 15))
+
+    def test_rate_changes_invalidate_the_cache(self):
+        """Test a committed exchange-rate write is visible to the next resolver"""
+        RateResolver(self.user).rate(self.eur.id, self.usd.id, date(2024, 1, 15))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('exchange-rate-list'), {
+                'from_currency_id': str(self.eur.id),
+                'to_currency_id': str(self.usd.id),
+                'rate': '1.15',
+                'date': '2024-01-10',
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        resolver = RateResolver(self.user)
+        self.assertEqual(resolver.rate(self.eur.id, self.usd.id, date(2024, 1, 15)), Decimal('1.15'))
+
+
+class CrossRateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='test@example.com',
+            password='TestPass123!'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.ghs, self.usd, self.eur, self.gbp = [
+            Currency.objects.create(code=code, name=code, symbol=code[0]) for code in ['GHS', 'USD', 'EUR', 'GBP']
+        ]
+        self.user.base_currency = self.eur
+        self.user.save()
+        self.add_rate(self.ghs, self.usd, '0.08')
+        self.add_rate(self.usd, self.eur, '0.9')
+        self.day = date(2024, 3, 1)
+
+    def add_rate(self, from_currency, to_currency, rate, day=date(2024, 1, 1)):
+        return ExchangeRate.objects.create(
+            user=self.user, from_currency=from_currency, to_currency=to_currency, rate=Decimal(rate), date=day
+        )
+
+    def test_triangulated_and_inverse_rates(self):
+        """Test pairs without a rate follow the shortest path, including inverse edges"""
+        resolver = RateResolver(self.user)
+        self.assertEqual(resolver.rate(self.ghs.id, self.eur.id, self.day), Decimal('0.072'))
+        self.assertAlmostEqual(resolver.rate(self.eur.id, self.ghs.id, self.day), Decimal(1) / Decimal('0.072'))
+        self.assertIsNone(resolver.rate(self.gbp.id, self.eur.id, self.day))
+        self.assertEqual(
+            resolver.to_base(Decimal('100.00'), self.ghs.id, self.day), (Decimal('0.072000'), Decimal('7.20'))
+        )
+
+    def test_direct_rate_wins_over_path(self):
+        """Test a rate the user entered for the pair is used as is"""
+        self.add_rate(self.ghs, self.eur, '0.07')
+        self.assertEqual(RateResolver(self.user).rate(self.ghs.id, self.eur.id, self.day), Decimal('0.07'))
+
+    def test_matrix_is_memoized_per_day(self):
+        """Test the matrix for a day is built once and then served from cache"""
+        RateResolver(self.user).matrix(self.day)
+        with self.assertNumQueries(0):
+            matrix = RateResolver(self.user).matrix(self.day)
+        self.assertEqual(len(matrix), 6)
+        self.assertEqual(RateResolver(self.user).matrix(date(2023, 12, 31)), {})
+
+    def test_matrix_endpoint_and_base_totals(self):
+        """Test the matrix endpoint and balances in the base currency"""
+        response = self.client.get(reverse('exchange-rate-matrix'), {'date': '2024-03-01'})
+        self.assertIn({'from': 'GHS', 'to': 'EUR', 'rate': '0.072000'}, response.data['rates'])
+
+        for currency, balance in [(self.ghs, '1000.00'), (self.gbp, '10.00')]:
+            Account.objects.create(
+                user=self.user, name=currency.code, type='BANK', currency=currency,
+                initial_balance=Decimal(balance), current_balance=Decimal(balance),
+                base_currency_balance=Decimal(balance),
+            )
+        response = self.client.get(reverse('account-balances'), {'as_of': '2024-03-01'})
+        base_balances = {item['name']: item['base_balance'] for item in response.data['accounts']}
+        self.assertEqual(base_balances, {'GHS': '72.00', 'GBP': None})
+        self.assertEqual(response.data['total_base_balance'], '72.00')
+
+    def test_base_balances_use_the_rounded_rate(self):
+        """Test balances convert with the same rounded rate as transactions"""
+        self.add_rate(self.eur, self.gbp, '3')
+        Account.objects.create(
+            user=self.user, name='GBP', type='BANK', currency=self.gbp, initial_balance=Decimal('1000000.00'),
+            current_balance=Decimal('1000000.00'), base_currency_balance=Decimal('1000000.00'),
+        )
+        response = self.client.get(reverse('account-balances'), {'as_of': '2024-03-01'})
+        _, expected = RateResolver(self.user).to_base(Decimal('1000000.00'), self.gbp.id, self.day)
+        self.assertEqual(expected, Decimal('333333.00'))
+        self.assertEqual(response.data['accounts'][0]['base_balance'], '333333.00')
+
+
+class RevaluationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='test@example.com',
+            password='TestPass123!'
+        )
+        self.usd, self.ghs, self.eur, self.gbp = [
+            Currency.objects.create(code=code, name=code, symbol=code[0]) for code in ['USD', 'GHS', 'EUR', 'GBP']
+        ]
+        self.user.base_currency = self.usd
+        self.user.save()
+        ExchangeRate.objects.create(
+            user=self.user, from_currency=self.ghs, to_currency=self.usd, rate=Decimal('0.08'), date=date(2024, 1, 1)
+        )
+        ExchangeRate.objects.create(
+            user=self.user, from_currency=self.usd, to_currency=self.eur, rate=Decimal('0.9'), date=date(2024, 1, 1)
+        )
+
+    def create_account(self, name, currency, balance, is_active=True):
+        return Account.objects.create(
+            user=self.user, name=name, type='BANK', currency=currency, is_active=is_active,
+            initial_balance=Decimal(balance), current_balance=Decimal(balance),
+            base_currency_balance=Decimal(balance),
+        )
+
+    def test_foreign_accounts_are_marked_to_market(self):
+        """Test foreign-currency accounts get the base balance at the date's direct or triangulated rate"""
+        cedis = self.create_account('Cedis', self.ghs, '1000.00')
+        euros = self.create_account('Euros', self.eur, '90.00')
+        dollars = self.create_account('Dollars', self.usd, '50.00')
+        pounds = self.create_account('Pounds', self.gbp, '10.00')
+        closed = self.create_account('Closed', self.ghs, '500.00', is_active=False)
+
+        timings = revalue_accounts(date(2024, 3, 1))
+        self.assertEqual(sum(timing.revalued for timing in timings), 2)
+        for account, balance in [(cedis, '80.00'), (euros, '100.00'), (dollars, '50.00'),
+                                 (pounds, '10.00'), (closed, '500.00')]:
+            account.refresh_from_db()
+            self.assertEqual(account.base_currency_balance, Decimal(balance))
+        self.assertEqual(cedis.last_exchange_rate, Decimal('0.08'))
+        self.assertEqual(cedis.last_conversion_date.date(), date(2024, 3, 1))
+        self.assertIsNone(dollars.last_conversion_date)
+
+    def test_queries_do_not_grow_with_accounts(self):
+        """Test a batch takes the same number of queries however many accounts it holds"""
+        def run(count):
+            for i in range(count):
+                self.create_account(f'Cedis {i}', self.ghs, '100.00')
+            with CaptureQueriesContext(connection) as queries:
+                revalue_accounts(date(2024, 3, 1))
+            return len(queries)
+
+        self.assertEqual(run(2), run(20))
+
+    def test_rate_change_revalues_the_user(self):
+        """Test a committed rate change revalues the owner's accounts"""
+        cedis = self.create_account('Cedis', self.ghs, '1000.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            ExchangeRate.objects.create(
+                user=self.user, from_currency=self.ghs, to_currency=self.usd,
+                rate=Decimal('0.07'), date=date(2024, 2, 1)
+            )
+        cedis.refresh_from_db()
+        self.assertEqual(cedis.base_currency_balance, Decimal('70.00'))
+
+    def test_command_reports_batch_timings(self):
+        """Test the command revalues in batches and prints a line per batch"""
+        for i in range(3):
+            self.create_account(f'Cedis {i}', self.ghs, '100.00')
+        out = StringIO()
+        call_command('revalue_balances', date='2024-03-01', batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue().count('Batch '), 2)
+        self.assertIn('Revalued 3 accounts', out.getvalue())
 
-# Create your tests here.
@@ -1,9 +1,15 @@
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiResponse, OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiParameter, OpenApiResponse, OpenApiTypes
+from decimal import Decimal
+from transactions.balances import balances_as_of
+from .rates import RATE_PLACES, RateResolver
 from .models import Currency, Account, ExchangeRate
-from .serializers import CurrencySerializer, AccountSerializer, ExchangeRateSerializer
+from .serializers import CurrencySerializer, AccountSerializer, AccountBalanceSerializer, ExchangeRateSerializer
 
 # Create your views here.
 
@@ -49,7 +55,7 @@ class AccountViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return Account.objects.none()
-        return Account.objects.filter(user=self.request.user)
+        return Account.objects.filter(user=self.request.user).select_related('currency')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -141,6 +147,51 @@ class AccountViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
+    @extend_schema(
+        summary="Account balances as of a date",
+        description="Get the balance of every account of the current user at the end of the given date",
+        parameters=[
+            OpenApiParameter(
+                name='as_of',
+                type=str,
+                description='Date (YYYY-MM-DD) to compute balances for; defaults to today'
+            ),
+        ],
+        responses={200: AccountBalanceSerializer(many=True)},
+    )
+    @action(detail=False, methods=['get'])
+    def balances(self, request):
+        as_of = request.query_params.get('as_of')
+        if as_of:
+            try:
+                as_of = parse_date(as_of)
+            except ValueError:
+                as_of = None
+            if as_of is None:
+                return Response({'as_of': 'Expected a date in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            as_of = timezone.localdate()
+        accounts = balances_as_of(self.get_queryset(), as_of)
+
+        # Convert through the day's cross-rate matrix; balances in a currency
+        # with no known rate are left out of the total
+        resolver = RateResolver(request.user)
+        if resolver.base_currency_id:
+            # One lookup for every pair; to_base then reads the rates from memory
+            resolver.prefetch((account.currency_id, resolver.base_currency_id) for account in accounts)
+        total = None
+        for account in accounts:
+            rate, base_balance = resolver.to_base(account.balance, account.currency_id, as_of) \
+                if resolver.base_currency_id else (None, None)
+            account.base_balance = None if rate is None else base_balance
+            if account.base_balance is not None:
+                total = (total or Decimal('0')) + account.base_balance
+        return Response({
+            'as_of': as_of,
+            'total_base_balance': None if total is None else str(total),
+            'accounts': AccountBalanceSerializer(accounts, many=True).data
+        })
+
 class ExchangeRateViewSet(viewsets.ModelViewSet):
     serializer_class = ExchangeRateSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -149,7 +200,9 @@ class ExchangeRateViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return ExchangeRate.objects.none()
-        return ExchangeRate.objects.filter(user=self.request.user)
+        return ExchangeRate.objects.filter(user=self.request.user).select_related(
+            'from_currency', 'to_currency'
+        )
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -248,3 +301,44 @@ class ExchangeRateViewSet(viewsets.ModelViewSet):
     )
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
+
+    @extend_schema(
+        summary="Cross-rate matrix",
+        description=(
+            "Get the rate between every pair of currencies reachable through the user's exchange "
+            "rates on a date, triangulating pairs without a rate of their own"
+        ),
+        parameters=[
+            OpenApiParameter(
+                name='date',
+                type=str,
+                description='Date (YYYY-MM-DD) to resolve rates for; defaults to today'
+            ),
+        ],
+    )
+    @action(detail=False, methods=['get'])
+    def matrix(self, request):
+        day = request.query_params.get('date')
+        if day:
+            try:
+                day = parse_date(day)
+            except ValueError:
+                day = None
+            if day is None:
+                return Response({'date': 'Expected a date in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            day = timezone.localdate()
+        matrix = RateResolver(request.user).matrix(day)
+        codes = dict(
+            Currency.objects.filter(id__in={currency_id for pair in matrix for currency_id in pair})
+            .values_list('id', 'code')
+        )
+        codes = {str(currency_id): code for currency_id, code in codes.items()}
+        rates = sorted(
+            (
+                {'from': codes[from_id], 'to': codes[to_id], 'rate': str(rate.quantize(RATE_PLACES))}
+                for (from_id, to_id), rate in matrix.items()
+            ),
+            key=lambda item: (item['from'], item['to'])
+        )
+        return Response({'date': day, 'rates': rates})
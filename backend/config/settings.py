@@ -14,6 +14,7 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import timedelta
+from celery.schedules import crontab
 
 # Load environment variables
 load_dotenv()
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     
     # Third party apps
     'rest_framework',
@@ -64,6 +66,7 @@ INSTALLED_APPS = [
     'accounts',
     'transactions',
     'dashboard',
+    'files',
 ]
 
 MIDDLEWARE = [
@@ -276,6 +279,69 @@ CACHES = {
     }
 }
 
+# Seconds that computed transaction statistics stay cached
+STATS_CACHE_TIMEOUT = int(os.getenv('STATS_CACHE_TIMEOUT', 60 * 60))
+
+# Exchange-rate histories: seconds kept in the shared cache, and how many
+# currency pairs each process keeps in memory
+EXCHANGE_RATE_CACHE_TIMEOUT = int(os.getenv('EXCHANGE_RATE_CACHE_TIMEOUT', 24 * 60 * 60))
+EXCHANGE_RATE_LOCAL_CACHE_SIZE = int(os.getenv('EXCHANGE_RATE_LOCAL_CACHE_SIZE', 1024))
+
+# Automatic categorization: how many recent labelled transactions the
+# learned index covers, the score a suggestion needs, and how long an index
+# stays cached (it is also dropped whenever the user's transactions change)
+CATEGORIZATION_HISTORY_SIZE = int(os.getenv('CATEGORIZATION_HISTORY_SIZE', 5000))
+CATEGORIZATION_MIN_CONFIDENCE = float(os.getenv('CATEGORIZATION_MIN_CONFIDENCE', 0.6))
+CATEGORIZATION_CACHE_TIMEOUT = int(os.getenv('CATEGORIZATION_CACHE_TIMEOUT', 24 * 60 * 60))
+
+# Transaction imports: rows written per bulk_create chunk, and how many
+# row errors are kept on the job
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', 100))
+# CSV files of at least IMPORT_PARALLEL_MIN_SIZE bytes are parsed by
+# IMPORT_WORKERS processes in segments of about IMPORT_SEGMENT_SIZE bytes
+IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', 1))
+IMPORT_PARALLEL_MIN_SIZE = int(os.getenv('IMPORT_PARALLEL_MIN_SIZE', 32 * 1024 * 1024))
+IMPORT_SEGMENT_SIZE = int(os.getenv('IMPORT_SEGMENT_SIZE', 4 * 1024 * 1024))
+
+# Chunked uploads: the block size chunks are aligned to (and hashed by),
+# the largest file accepted, and how long an unfinished upload is kept
+UPLOAD_BLOCK_SIZE = int(os.getenv('UPLOAD_BLOCK_SIZE', 4 * 1024 * 1024))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024))
+UPLOAD_EXPIRY_HOURS = int(os.getenv('UPLOAD_EXPIRY_HOURS', 24))
+
+# Transaction exports are read from the database this many rows at a time
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+
+# Rows read or inserted at a time by user backups and restores that cannot
+# use PostgreSQL's COPY (see files.backups)
+BACKUP_CHUNK_SIZE = int(os.getenv('BACKUP_CHUNK_SIZE', 5000))
+
+# How export downloads are sent (see files.delivery): '' streams them from
+# Django, 'x-accel-redirect' hands them to nginx through an internal location
+# at FILE_DELIVERY_ACCEL_PREFIX that maps onto MEDIA_ROOT, and 'x-sendfile'
+# hands them to Apache's mod_xsendfile
+FILE_DELIVERY = os.getenv('FILE_DELIVERY', '')
+FILE_DELIVERY_ACCEL_PREFIX = os.getenv('FILE_DELIVERY_ACCEL_PREFIX', '/protected-media/')
+
+# Import and export jobs handed to workers or running at once, per kind and
+# per user, seconds a job may wait for a worker before it is handed out
+# again, and seconds a running job may go without reporting progress before
+# it is failed as abandoned (see files.scheduling)
+JOB_MAX_RUNNING = int(os.getenv('JOB_MAX_RUNNING', 8))
+JOB_USER_MAX_RUNNING = int(os.getenv('JOB_USER_MAX_RUNNING', 2))
+JOB_DISPATCH_TIMEOUT = int(os.getenv('JOB_DISPATCH_TIMEOUT', 10 * 60))
+JOB_STALE_TIMEOUT = int(os.getenv('JOB_STALE_TIMEOUT', 30 * 60))
+
+# Import and export progress: seconds between copies of the cached counters
+# onto the job row, seconds the counters are kept after a job ends, and how
+# often (and for how many seconds) a progress event stream checks them. A
+# stream holds a worker while open, so it is kept short and clients reconnect
+JOB_PROGRESS_FLUSH_INTERVAL = float(os.getenv('JOB_PROGRESS_FLUSH_INTERVAL', 5))
+JOB_PROGRESS_TIMEOUT = int(os.getenv('JOB_PROGRESS_TIMEOUT', 60 * 60))
+JOB_PROGRESS_POLL_INTERVAL = float(os.getenv('JOB_PROGRESS_POLL_INTERVAL', 1))
+JOB_PROGRESS_STREAM_SECONDS = int(os.getenv('JOB_PROGRESS_STREAM_SECONDS', 25))
+
 # Celery settings
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
@@ -283,5 +349,26 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    # Hourly; generation is idempotent, so reruns only pick up what is due
+    'generate-recurring-transactions': {
+        'task': 'transactions.tasks.generate_recurring_transactions',
+        'schedule': crontab(minute=15),
+    },
+    'revalue-account-balances': {
+        'task': 'accounts.tasks.revalue_account_balances',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    # Catches jobs whose scheduling was missed; creating or finishing a job
+    # schedules at once
+    'schedule-jobs': {
+        'task': 'files.tasks.schedule_jobs',
+        'schedule': crontab(),
+    },
+    'expire-uploads': {
+        'task': 'files.tasks.expire_uploads',
+        'schedule': crontab(minute=45),
+    },
+}
 
 
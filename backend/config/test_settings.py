@@ -19,4 +19,19 @@ ARGON2_MEMORY_COST = 1024  # Default is 65536
 ARGON2_PARALLELISM = 1  # Default is 4
 
 # Disable email sending during tests
-EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend' 
\ No newline at end of file
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+# Use local memory cache instead of Redis for testing
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Run Celery tasks inline
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = True
+
+# SQLite cannot enforce the rollup's NULLS NOT DISTINCT constraint; the
+# rollup code keeps to one row per key without it
+SILENCED_SYSTEM_CHECKS = ['models.W047']
@@ -28,6 +28,7 @@ urlpatterns = [
     path('api/', include('users.urls')),
     path('api/', include('accounts.urls')),
     path('api/transactions/', include('transactions.urls')),
+    path('api/files/', include('files.urls')),
     path('api/auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     
@@ -1,3 +1,35 @@
 from django.contrib import admin
+from .models import ImportJob, ExportJob, ImportTemplate, Upload
 
-# Register your models here.
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'user', 'file_type', 'status', 'processed_records', 'successful_records',
+                    'failed_records', 'duplicate_records', 'categorized_records', 'created_at')
+    list_filter = ('status', 'file_type')
+    search_fields = ('file_name', 'user__email')
+    raw_id_fields = ('user', 'template')
+    ordering = ('-created_at',)
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'user', 'format', 'status', 'total_records', 'created_at')
+    list_filter = ('status', 'format')
+    search_fields = ('file_name', 'user__email')
+    raw_id_fields = ('user',)
+    ordering = ('-created_at',)
+
+@admin.register(ImportTemplate)
+class ImportTemplateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'file_type', 'is_default', 'created_at')
+    list_filter = ('file_type', 'is_default')
+    search_fields = ('name', 'user__email')
+    raw_id_fields = ('user',)
+
+@admin.register(Upload)
+class UploadAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'user', 'size', 'received', 'status', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('file_name', 'content_hash', 'user__email')
+    raw_id_fields = ('user',)
+    readonly_fields = ('block_hashes',)
+    ordering = ('-created_at',)
@@ -0,0 +1,375 @@
+"""
+Full backups of one user's data, and their restore.
+
+A backup is a zip file with a ``manifest.json`` and one deflate-compressed
+member per table in ``TABLES``, written in PostgreSQL's COPY text format:
+one line per row, tab-separated, ``\\N`` for NULL, and backslash escapes.
+On PostgreSQL every member is produced by ``COPY (SELECT ...) TO STDOUT``
+straight into the zip stream. Other databases stream the same format from
+``values_list().iterator()``. Nothing holds more than a chunk of rows, and
+no model instances are built.
+
+Restoring streams each member back through a byte-level rewrite of its
+key columns into ``COPY ... FROM STDIN`` (or batched inserts elsewhere)
+inside one database transaction:
+
+* ids of the backed-up rows, and references to them, become
+  ``uuid5(namespace, old id)`` with a namespace new to each restore. The
+  same backup can therefore be restored next to the original (say, into a
+  support account) without collisions, and no id map is kept in memory.
+  ``keep_ids`` keeps the original ids, for moving a user to a new database.
+* user references become the target user.
+* currency references are matched by currency code, and currencies the
+  target database lacks are created.
+* import job references are cleared; import jobs are not backed up.
+
+Transaction fingerprints hash the account id, so when ids are remapped they
+are recomputed from each rewritten row as it streams past. Other derived
+data (rollups, suggestions, balances and checkpoints) only refers to the
+backed-up rows by id, so it is copied and its references rewritten like
+any other column.
+"""
+import io
+import json
+import re
+import uuid
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, connection, models, transaction as db_transaction
+from django.utils import timezone
+
+from accounts.models import Account, BalanceCheckpoint, Currency, ExchangeRate
+from transactions.caching import bump_data_version_on_commit
+from transactions.fingerprints import fingerprint
+from transactions.models import (
+    CategorizationRule, Category, DailyTransactionSummary, DescriptionSuggestion, Tag, Transaction,
+)
+
+from .models import ImportTemplate
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+NULL = b'\\N'
+# Fast deflate: backups are written and read at COPY speed
+COMPRESS_LEVEL = 1
+CURRENCY_FIELDS = ('id', 'code', 'name', 'symbol', 'decimal_places', 'is_active')
+
+# (model, lookup of the owning user) for every table, in restore order
+TABLES = (
+    (Account, 'user'),
+    (ExchangeRate, 'user'),
+    (BalanceCheckpoint, 'account__user'),
+    (Category, 'user'),
+    (Tag, 'user'),
+    (ImportTemplate, 'user'),
+    (Transaction, 'user'),
+    (Transaction.tags.through, 'transaction__user'),
+    (CategorizationRule, 'user'),
+    (CategorizationRule.tags.through, 'categorizationrule__user'),
+    (DailyTransactionSummary, 'user'),
+    (DescriptionSuggestion, 'user'),
+)
+# Models whose ids are remapped on restore
+REMAPPED = tuple(model for model, _ in TABLES if isinstance(model._meta.pk, models.UUIDField))
+
+ESCAPES = {'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'}
+ESCAPE = re.compile(r'[\\\t\n\r]')
+UNESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+UNESCAPE = re.compile(r'\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|.)')
+
+
+class BackupError(Exception):
+    pass
+
+
+def default_method():
+    return 'copy' if connection.vendor == 'postgresql' else 'orm'
+
+
+def backup_fields(model):
+    """The fields a backup keeps: all but serial ids (the target assigns new ones) and search vectors."""
+    return [
+        field for field in model._meta.concrete_fields
+        if not isinstance(field, SearchVectorField)
+        and not (field.primary_key and not isinstance(field, models.UUIDField))
+    ]
+
+
+def encode_value(value):
+    """A Python value in COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    else:
+        value = str(value)
+    return ESCAPE.sub(lambda match: ESCAPES[match.group()], value)
+
+
+def decode_text(raw):
+    def replace(match):
+        code = match.group(1)
+        if code[0] == 'x':
+            return chr(int(code[1:], 16))
+        if code[0] in '01234567':
+            return chr(int(code, 8))
+        return UNESCAPES.get(code, code)
+    return UNESCAPE.sub(replace, raw.decode())
+
+
+class IteratorReader(io.RawIOBase):
+    """A readable file over an iterator of byte strings, for ``copy_expert``."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def user_rows(model, lookup, user, fields):
+    return model.objects.filter(**{lookup: user}).order_by().values_list(*[field.attname for field in fields])
+
+
+def copy_out(queryset, output):
+    # copy_expert is not wrapped by Django, so its errors are converted here
+    with connection.cursor() as cursor, connection.wrap_database_errors:
+        sql, params = queryset.query.sql_with_params()
+        cursor.copy_expert(f'COPY ({cursor.mogrify(sql, params).decode()}) TO STDOUT', output)
+        return cursor.rowcount
+
+
+def orm_out(queryset, output):
+    count = 0
+    for row in queryset.iterator(chunk_size=settings.BACKUP_CHUNK_SIZE):
+        output.write(('\t'.join(encode_value(value) for value in row) + '\n').encode())
+        count += 1
+    return count
+
+
+def write_backup(user, fileobj, method=None):
+    """Write a backup of ``user``'s data to a binary file object and return its manifest."""
+    method = method or default_method()
+    write_table = copy_out if method == 'copy' else orm_out
+    manifest = {
+        'format': FORMAT_VERSION,
+        'created_at': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'method': method,
+        'user': {'id': str(user.id), 'email': user.email, 'base_currency_id': str(user.base_currency_id or '')},
+        'currencies': [
+            {key: str(value) if key == 'id' else value for key, value in currency.items()}
+            for currency in Currency.objects.values(*CURRENCY_FIELDS)
+        ],
+        'tables': [],
+    }
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as archive:
+        # Read every table from one snapshot (the caller's, inside a transaction)
+        snapshot = connection.vendor == 'postgresql' and not connection.in_atomic_block
+        with db_transaction.atomic():
+            if snapshot:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            for model, lookup in TABLES:
+                fields = backup_fields(model)
+                member = f'{model._meta.db_table}.tsv'
+                with archive.open(member, 'w', force_zip64=True) as output:
+                    rows = write_table(user_rows(model, lookup, user, fields), output)
+                manifest['tables'].append({
+                    'table': model._meta.db_table, 'member': member,
+                    'columns': [field.column for field in fields], 'rows': rows,
+                })
+        archive.writestr(MANIFEST, json.dumps(manifest, indent=2))
+    return manifest
+
+
+class Restore:
+    """Rewrites backup rows for one target user; see the module docstring."""
+
+    def __init__(self, user, manifest, keep_ids=False):
+        self.user = user
+        self.user_id = str(user.id).encode()
+        self.namespace = None if keep_ids else uuid.uuid4()
+        # Every id is hashed once; foreign keys repeat the ids of earlier tables
+        self.ids = {}
+        self.currencies = self.match_currencies(manifest['currencies'], keep_ids)
+
+    @staticmethod
+    def match_currencies(currencies, keep_ids):
+        """Map backed-up currency ids to the target database's, creating missing currencies."""
+        existing = dict(Currency.objects.values_list('code', 'id'))
+        mapping = {}
+        for currency in currencies:
+            target_id = existing.get(currency['code'])
+            if target_id is None:
+                values = {key: currency[key] for key in CURRENCY_FIELDS if key != 'id'}
+                if keep_ids:
+                    values['id'] = currency['id']
+                target_id = Currency.objects.create(**values).id
+            mapping[currency['id'].encode()] = str(target_id).encode()
+        return mapping
+
+    def remap_id(self, value):
+        if value == NULL or self.namespace is None:
+            return value
+        new_id = self.ids.get(value)
+        if new_id is None:
+            new_id = self.ids[value] = str(uuid.uuid5(self.namespace, value.decode())).encode()
+        return new_id
+
+    def transform(self, field):
+        """A function rewriting the field's raw values, or None to keep them."""
+        if field.primary_key:
+            return self.remap_id
+        if not field.is_relation:
+            return None
+        related = field.related_model
+        if related is get_user_model():
+            return lambda value: self.user_id
+        if related is Currency:
+            return lambda value: value if value == NULL else self.currencies[value]
+        if related in REMAPPED:
+            return self.remap_id
+        # Rows the backup does not hold, such as import jobs
+        return lambda value: NULL
+
+    def refingerprint(self, fields):
+        """
+        A function setting a transaction row's fingerprint from its rewritten
+        values, or None when the row keeps its account id (or has no fingerprint).
+        """
+        names = [field.attname for field in fields]
+        if self.namespace is None or fields[0].model is not Transaction or 'fingerprint' not in names:
+            return None
+        target = names.index('fingerprint')
+        sources = [names.index(name) for name in ('account_id', 'date', 'type', 'amount', 'description')]
+
+        def apply(values):
+            account_id, day, transaction_type, amount, description = (values[index] for index in sources)
+            values[target] = fingerprint(
+                account_id.decode(), date.fromisoformat(day.decode()), transaction_type.decode(),
+                Decimal(amount.decode()), None if description == NULL else decode_text(description),
+            ).encode()
+        return apply
+
+    def lines(self, member, fields):
+        transforms = [
+            (index, transform) for index, transform in enumerate(self.transform(field) for field in fields)
+            if transform is not None
+        ]
+        refingerprint = self.refingerprint(fields)
+        for line in member:
+            values = line.rstrip(b'\n').split(b'\t')
+            if len(values) != len(fields):
+                raise BackupError(f'Row with {len(values)} columns instead of {len(fields)}')
+            for index, transform in transforms:
+                values[index] = transform(values[index])
+            if refingerprint:
+                refingerprint(values)
+            yield b'\t'.join(values) + b'\n'
+
+
+def copy_in(model, fields, lines):
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    with connection.cursor() as cursor, connection.wrap_database_errors:
+        cursor.copy_expert(f'COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN', IteratorReader(lines))
+        return cursor.rowcount
+
+
+def orm_in(model, fields, lines):
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table), ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+
+    def value(field, raw):
+        if raw == NULL:
+            return None
+        text = decode_text(raw)
+        python = json.loads(text) if isinstance(field, models.JSONField) else field.to_python(text)
+        return field.get_db_prep_save(python, connection)
+
+    count = 0
+    batch = []
+    with connection.cursor() as cursor:
+        for line in lines:
+            batch.append([value(field, raw) for field, raw in zip(fields, line.rstrip(b'\n').split(b'\t'))])
+            if len(batch) == settings.BACKUP_CHUNK_SIZE:
+                cursor.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+    return count
+
+
+def restore_backup(fileobj, user, method=None, keep_ids=False):
+    """
+    Load a backup into ``user``, who must not have rows in any of the
+    backed-up tables yet. Returns the rows loaded per table.
+    """
+    method = method or default_method()
+    read_table = copy_in if method == 'copy' else orm_in
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise BackupError('Not a backup: the file is not a zip archive')
+    with archive:
+        try:
+            manifest = json.loads(archive.read(MANIFEST))
+        except (KeyError, ValueError):
+            raise BackupError('Not a backup: the manifest is missing or unreadable')
+        if manifest.get('format') != FORMAT_VERSION:
+            raise BackupError(f'Unsupported backup format {manifest.get("format")!r}')
+        if any(model.objects.filter(**{lookup: user}).exists() for model, lookup in TABLES):
+            raise BackupError(f'{user.email} already has data; restore into a new user')
+
+        models_by_table = {model._meta.db_table: model for model, _ in TABLES}
+        counts = {}
+        try:
+            with db_transaction.atomic():
+                restore = Restore(user, manifest, keep_ids)
+                for table in manifest['tables']:
+                    model = models_by_table.get(table['table'])
+                    if model is None:
+                        raise BackupError(f'Unknown table {table["table"]}')
+                    by_column = {field.column: field for field in backup_fields(model)}
+                    unknown = set(table['columns']) - set(by_column)
+                    if unknown:
+                        raise BackupError(f'Unknown columns in {table["table"]}: {", ".join(sorted(unknown))}')
+                    fields = [by_column[column] for column in table['columns']]
+                    with archive.open(table['member']) as member:
+                        counts[table['table']] = read_table(model, fields, restore.lines(member, fields))
+                base_currency = manifest['user'].get('base_currency_id')
+                if base_currency and user.base_currency_id is None:
+                    user.base_currency_id = restore.currencies[base_currency.encode()].decode()
+                    user.save(update_fields=['base_currency'])
+                bump_data_version_on_commit(user.id)
+        except IntegrityError as exc:
+            # E.g. --keep-ids into the database the backup came from
+            raise BackupError(f'The backup clashes with existing rows: {exc}')
+    return counts
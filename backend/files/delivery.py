@@ -0,0 +1,130 @@
+"""
+Delivery of stored files to authenticated users.
+
+``file_response`` answers conditional requests (``If-None-Match``,
+``If-Modified-Since``) and single byte ranges, so an interrupted download of
+a large export resumes where it stopped. It then hands the transfer to the
+front-end server when ``FILE_DELIVERY`` says one is configured:
+
+* ``'x-accel-redirect'``: nginx serves the file from an ``internal``
+  location mapping ``FILE_DELIVERY_ACCEL_PREFIX`` onto ``MEDIA_ROOT``.
+* ``'x-sendfile'``: Apache's mod_xsendfile (or lighttpd) serves the path.
+
+Both servers handle ``Range`` themselves, and the Django worker is free as
+soon as the headers are sent. Without one, a whole file goes out through
+``FileResponse``; servers such as gunicorn pass it to ``sendfile()`` so it
+is never copied through Python. Ranges are streamed in blocks from a
+reader that stops at the range's end.
+"""
+import hashlib
+import mimetypes
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeReader:
+    """Reads ``length`` bytes of ``fileobj`` from ``start``, for ``FileResponse``."""
+
+    def __init__(self, fileobj, start, length):
+        self.fileobj = fileobj
+        self.remaining = length
+        fileobj.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fileobj.close()
+
+
+def file_etag(name, size, modified):
+    digest = hashlib.sha1(f'{name}:{size}:{modified}'.encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) for a single byte range, None to send the
+    whole file (no range, several ranges, or a header that cannot be
+    read), or ``()`` when the range lies outside the file.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # The last ``last`` bytes
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length and size else ()
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return ()
+    return start, end
+
+
+def range_applies(request, etag, modified):
+    """Whether ``If-Range``, if sent, still matches the file."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Only strong validators may pick a range
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(modified) <= since
+
+
+def file_response(request, fieldfile, file_name, content_type=None):
+    """A download of a stored file (a ``FieldFile``) named ``file_name``."""
+    storage = fieldfile.storage
+    size = fieldfile.size
+    modified = storage.get_modified_time(fieldfile.name).timestamp()
+    etag = file_etag(fieldfile.name, size, modified)
+    content_type = content_type or mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(modified))
+    if response is not None:
+        return response
+
+    delivery = settings.FILE_DELIVERY
+    byte_range = None
+    if delivery not in ('x-accel-redirect', 'x-sendfile') and request.headers.get('Range') \
+            and range_applies(request, etag, modified):
+        byte_range = parse_range(request.headers['Range'], size)
+
+    if delivery == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.FILE_DELIVERY_ACCEL_PREFIX.rstrip('/') + '/' + fieldfile.name
+    elif delivery == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fieldfile.path
+    elif byte_range == ():
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range:
+        start, end = byte_range
+        response = FileResponse(
+            RangeReader(fieldfile.open('rb'), start, end - start + 1), status=206, content_type=content_type
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        response = FileResponse(fieldfile.open('rb'), content_type=content_type)
+        response['Content-Length'] = size
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    response['Content-Disposition'] = content_disposition_header(True, file_name)
+    return response
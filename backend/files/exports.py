@@ -0,0 +1,371 @@
+"""
+Transaction exports.
+
+``export_rows`` reads a transaction queryset with ``iterator()`` (a
+server-side cursor on PostgreSQL) as plain value tuples, ``EXPORT_CHUNK_SIZE``
+rows at a time, and adds each chunk's tag names with one more query. No
+model instances are built and no more than a chunk is held in memory, so
+exporting a million rows costs the same memory as exporting a thousand.
+
+``csv_stream`` turns the rows into CSV text for a ``StreamingHttpResponse``,
+which starts sending as soon as the first chunk is read. ``ExportJob``s
+render CSV, XLSX or PDF files in a background worker with writers that also
+keep no more than a chunk (or a PDF page) in memory, and store the file.
+An export is tagged with the owner's data version from before its rows were
+read. Requesting the same format, filters and date range again while the
+version is unchanged returns the stored job instead of rendering again.
+"""
+import csv
+import hashlib
+import json
+import logging
+import tempfile
+from collections import defaultdict
+from datetime import date
+from itertools import islice
+from uuid import UUID
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchRank
+from django.core.files import File
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from transactions.caching import get_data_version
+from transactions.filters import TransactionSearchFilter, search_query, uses_full_text_search
+from transactions.models import DailyTransactionSummary, Transaction
+
+from .models import ExportJob
+from .pdf import PDFTableWriter
+from .progress import JobProgress
+
+logger = logging.getLogger(__name__)
+
+# (header, queryset field) in column order; the headers can be mapped back
+# onto transaction fields by an import
+EXPORT_COLUMNS = (
+    ('Date', 'date'),
+    ('Type', 'type'),
+    ('Amount', 'amount'),
+    ('Currency', 'currency__code'),
+    ('Base Amount', 'base_currency_amount'),
+    ('Exchange Rate', 'exchange_rate'),
+    ('Description', 'description'),
+    ('Account', 'account__name'),
+    ('Category', 'category__name'),
+    ('Tags', None),
+    ('Reference', 'external_id'),
+    ('Id', 'id'),
+)
+EXPORT_HEADER = [header for header, _ in EXPORT_COLUMNS]
+TAG_SEPARATOR = '; '
+
+# PDF pages are too narrow for every column: (header, width in points, right-aligned)
+PDF_COLUMNS = (
+    ('Date', 55, False),
+    ('Type', 50, False),
+    ('Amount', 65, True),
+    ('Currency', 40, False),
+    ('Description', 230, False),
+    ('Account', 100, False),
+    ('Category', 100, False),
+    ('Tags', 130, False),
+)
+
+# Filter keys an export job accepts; they match the transaction list's query parameters
+EXPORT_FILTERS = ('account_id', 'type', 'category', 'tag_ids', 'is_archived', 'search', 'ordering')
+EXPORT_ORDERINGS = ('date', 'amount', 'created_at')
+DEFAULT_ORDERING = ('-date', '-created_at')
+FILE_EXTENSIONS = {'CSV': 'csv', 'XLSX': 'xlsx', 'PDF': 'pdf'}
+
+
+def tag_names(transaction_ids):
+    """Map each transaction id to its tag names, with one query."""
+    names = defaultdict(list)
+    rows = (
+        Transaction.tags.through.objects.filter(transaction_id__in=transaction_ids)
+        .order_by('tag__name').values_list('transaction_id', 'tag__name')
+    )
+    for transaction_id, name in rows:
+        names[transaction_id].append(name)
+    return names
+
+
+def export_rows(queryset, chunk_size=None):
+    """
+    Yield lists of export rows (values in ``EXPORT_COLUMNS`` order, dates and
+    amounts kept as such) for a transaction queryset, one list per chunk,
+    keeping its filters and ordering.
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    fields = ['id'] + [field for _, field in EXPORT_COLUMNS if field]
+    # Values only: related objects are joined in SQL rather than prefetched
+    rows = queryset.prefetch_related(None).values_list(*fields).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        tags = tag_names([row[0] for row in chunk])
+        exported = []
+        for row in chunk:
+            values = dict(zip(fields, row))
+            exported.append([
+                TAG_SEPARATOR.join(tags.get(row[0], ())) if field is None else values[field]
+                for _, field in EXPORT_COLUMNS
+            ])
+        yield exported
+
+
+def export_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class Echo:
+    """A file-like object whose ``write`` returns what it was given, for ``csv.writer``."""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(queryset, chunk_size=None):
+    """Yield ``(text, row_count)`` for the CSV header and then each chunk of rows."""
+    writer = csv.writer(Echo())
+    # A byte order mark makes spreadsheet programs read the file as UTF-8
+    yield '\ufeff' + writer.writerow(EXPORT_HEADER), 0
+    for rows in export_rows(queryset, chunk_size):
+        yield ''.join(writer.writerow([export_value(value) for value in row]) for row in rows), len(rows)
+
+
+def csv_stream(queryset, chunk_size=None):
+    """Yield a CSV export of a transaction queryset, one string per chunk."""
+    return (text for text, _ in csv_chunks(queryset, chunk_size))
+
+
+def validate_export(filters, date_range):
+    """Raise ValueError unless an export job's filters and date range can be applied."""
+    if not isinstance(filters, dict) or not isinstance(date_range, dict):
+        raise ValueError('filters and date_range must be objects')
+    unknown = set(filters) - set(EXPORT_FILTERS)
+    if unknown:
+        raise ValueError(f'Unknown filters: {", ".join(sorted(unknown))}')
+    unknown = set(date_range) - {'start_date', 'end_date'}
+    if unknown:
+        raise ValueError(f'Unknown date_range keys: {", ".join(sorted(unknown))}')
+    for key in ('start_date', 'end_date'):
+        if date_range.get(key):
+            try:
+                date.fromisoformat(date_range[key])
+            except (TypeError, ValueError):
+                raise ValueError(f'{key} must be a date in YYYY-MM-DD format')
+    for key in ('account_id', 'category'):
+        if filters.get(key):
+            try:
+                UUID(str(filters[key]))
+            except ValueError:
+                raise ValueError(f'{key} must be an id')
+    tag_ids = filters.get('tag_ids') or []
+    if not isinstance(tag_ids, list):
+        raise ValueError('tag_ids must be a list')
+    for tag_id in tag_ids:
+        try:
+            UUID(str(tag_id))
+        except ValueError:
+            raise ValueError('tag_ids must be ids')
+    if filters.get('type') and filters['type'] not in dict(Transaction.TRANSACTION_TYPES):
+        raise ValueError(f'Unknown type: {filters["type"]}')
+    if 'is_archived' in filters and not isinstance(filters['is_archived'], bool):
+        raise ValueError('is_archived must be true or false')
+    if not isinstance(filters.get('search') or '', str):
+        raise ValueError('search must be a string')
+    ordering = filters.get('ordering')
+    if ordering and (not isinstance(ordering, str) or ordering.lstrip('-') not in EXPORT_ORDERINGS):
+        raise ValueError(f'ordering must be one of {", ".join(EXPORT_ORDERINGS)}, optionally with a leading -')
+
+
+def export_queryset(user, filters=None, date_range=None):
+    """The user's transactions matching an export job's filters and date range, in export order."""
+    filters, date_range = filters or {}, date_range or {}
+    queryset = Transaction.objects.filter(user=user)
+    if filters.get('account_id'):
+        queryset = queryset.filter(account_id=filters['account_id'])
+    if filters.get('type'):
+        queryset = queryset.filter(type=filters['type'])
+    if filters.get('category'):
+        queryset = queryset.filter(category_id=filters['category'])
+    if 'is_archived' in filters:
+        queryset = queryset.filter(is_archived=filters['is_archived'])
+    if date_range.get('start_date'):
+        queryset = queryset.filter(date__gte=date_range['start_date'])
+    if date_range.get('end_date'):
+        queryset = queryset.filter(date__lte=date_range['end_date'])
+    if filters.get('tag_ids'):
+        queryset = queryset.filter(tags__id__in=filters['tag_ids']).distinct()
+
+    ordering = [filters['ordering']] if filters.get('ordering') else list(DEFAULT_ORDERING)
+    term = filters.get('search') or ''
+    if term and uses_full_text_search(queryset):
+        query = search_query(term)
+        if query is not None:
+            rank = TransactionSearchFilter.rank_annotation
+            queryset = queryset.filter(search_vector=query).annotate(**{rank: SearchRank(F('search_vector'), query)})
+            if not filters.get('ordering'):
+                ordering.insert(0, f'-{rank}')
+    else:
+        for word in term.replace(',', ' ').split():
+            queryset = queryset.filter(description__icontains=word)
+    return queryset.order_by(*ordering)
+
+
+def estimate_export_size(user, filters=None, date_range=None):
+    """
+    A cheap estimate of an export's row count for the scheduler, read from
+    the daily rollups: the rows in its date range, account, type and
+    category. Search and tag filters are not applied, and archived rows
+    are never counted.
+    """
+    filters, date_range = filters or {}, date_range or {}
+    rollups = DailyTransactionSummary.objects.filter(user=user)
+    if filters.get('account_id'):
+        rollups = rollups.filter(account_id=filters['account_id'])
+    if filters.get('type'):
+        rollups = rollups.filter(type=filters['type'])
+    if filters.get('category'):
+        rollups = rollups.filter(category_id=filters['category'])
+    if date_range.get('start_date'):
+        rollups = rollups.filter(date__gte=date_range['start_date'])
+    if date_range.get('end_date'):
+        rollups = rollups.filter(date__lte=date_range['end_date'])
+    return rollups.aggregate(rows=Sum('count'))['rows'] or 0
+
+
+def export_key(export_format, filters, date_range):
+    """Identifies exports that would produce the same file from the same data."""
+    # List filters (tag_ids) match as sets
+    filters = {
+        name: sorted({str(item) for item in value}) if isinstance(value, (list, tuple)) else value
+        for name, value in (filters or {}).items()
+    }
+    params = {'format': export_format, 'filters': filters, 'date_range': date_range or {}}
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def find_reusable_export(user, key):
+    """
+    The user's newest export with ``key`` that is done or under way at their
+    current data version, or None.
+    """
+    return ExportJob.objects.filter(
+        user=user, export_key=key, data_version=get_data_version(user.id),
+        status__in=['PENDING', 'PROCESSING', 'COMPLETED'],
+    ).exclude(status='COMPLETED', file='').order_by('-created_at').first()
+
+
+def write_csv(queryset, output, progress=None):
+    count = 0
+    for text, rows in csv_chunks(queryset):
+        output.write(text.encode())
+        count += rows
+        if progress:
+            progress(rows)
+    return count
+
+
+def write_xlsx(queryset, output, progress=None):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    # Write-only workbooks stream rows to disk instead of keeping them
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Transactions')
+    for letter, width in zip('ABCDEFGHIJKL', (12, 10, 14, 9, 14, 14, 40, 20, 20, 24, 20, 38)):
+        sheet.column_dimensions[letter].width = width
+    header = []
+    for name in EXPORT_HEADER:
+        cell = WriteOnlyCell(sheet, value=name)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+
+    count = 0
+    date_column = EXPORT_HEADER.index('Date')
+    for rows in export_rows(queryset):
+        for row in rows:
+            row = [str(value) if isinstance(value, UUID) else value for value in row]
+            cell = WriteOnlyCell(sheet, value=row[date_column])
+            cell.number_format = 'yyyy-mm-dd'
+            row[date_column] = cell
+            sheet.append(row)
+        count += len(rows)
+        if progress:
+            progress(len(rows))
+    workbook.save(output)
+    return count
+
+
+def write_pdf(queryset, output, progress=None):
+    writer = PDFTableWriter(output, f'Transactions exported {timezone.localdate():%Y-%m-%d}', PDF_COLUMNS)
+    positions = [EXPORT_HEADER.index(header) for header, _, _ in PDF_COLUMNS]
+    count = 0
+    for rows in export_rows(queryset):
+        for row in rows:
+            writer.add_row([export_value(row[position]) for position in positions])
+        count += len(rows)
+        if progress:
+            progress(len(rows))
+    writer.close()
+    return count
+
+
+# Format -> writer taking (queryset, binary file, optional callback given
+# each chunk's row count) and returning the row count
+RENDERERS = {
+    'CSV': write_csv,
+    'XLSX': write_xlsx,
+    'PDF': write_pdf,
+}
+
+
+def run_export_job(job_id):
+    """
+    Claim a pending export job, render its file and store it. Returns False
+    if the job was not pending (already claimed, finished or deleted).
+    """
+    now = timezone.now()
+    claimed = ExportJob.objects.filter(pk=job_id, status='PENDING').update(
+        status='PROCESSING', started_at=now, updated_at=now
+    )
+    if not claimed:
+        return False
+    job = ExportJob.objects.select_related('user').get(pk=job_id)
+    # Read before the rows: a write committed meanwhile makes the file stale
+    version = get_data_version(job.user_id)
+    progress = JobProgress(job)
+    progress.start()
+
+    def rendered(rows):
+        progress.add(total_records=rows)
+        if progress.flush_due:
+            progress.flush()
+
+    try:
+        queryset = export_queryset(job.user, job.filters, job.date_range)
+        with tempfile.TemporaryFile() as output:
+            count = RENDERERS[job.format](queryset, output, rendered)
+            output.seek(0)
+            job.file.save(job.file_name, File(output), save=False)
+    except Exception:
+        logger.exception('Export job %s failed', job_id)
+        progress.flush(status='FAILED', error_message='The export stopped because of an unexpected error')
+        progress.finish('FAILED')
+        raise
+    ExportJob.objects.filter(pk=job_id).update(
+        status='COMPLETED', file=job.file.name, total_records=count, data_version=version,
+        updated_at=timezone.now()
+    )
+    progress.finish('COMPLETED')
+    return True
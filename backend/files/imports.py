@@ -0,0 +1,585 @@
+"""
+Streaming import of transactions from uploaded files.
+
+An ``ImportJob``'s file is read one row at a time and never held in memory
+as a whole. Its column mapping (``{"date": "Posting Date", "amount":
+"Amount", ...}``) says which column feeds each transaction field, and its
+default values fill the fields no column provides (``{"account": "Checking",
+"currency": "USD"}``). Default values also carry the parse options in
+``OPTION_KEYS``. Rows are parsed, then written in chunks. Each chunk
+resolves its accounts, currencies and categories with one query per model
+for the names not seen in earlier chunks. Its transactions and their
+derived data are written in one database transaction. Once it commits, the
+chunk is added to the job's progress counters (see ``files.progress``),
+which reach the job's row periodically and when the import ends. Rows the file leaves
+uncategorized are categorized by the user's rules and learned index (see
+``transactions.categorization``) unless the ``categorize`` option is false.
+"""
+import codecs
+import logging
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from uuid import UUID
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from accounts.models import Account, Currency
+from accounts.rates import RateResolver
+from transactions.categorization import Categorizer
+from transactions.derived import transactions_changed
+from transactions.fingerprints import apply_fingerprint
+from transactions.models import Category, Transaction
+
+from .models import ImportJob
+from .progress import JobProgress
+from .readers import READERS, STATEMENT_MAPPING, STATEMENT_TYPES, ImportFileError
+from .parallel import can_parse_in_parallel, parse_in_parallel
+
+logger = logging.getLogger(__name__)
+
+# Transaction fields a column can be mapped to. ``debit`` and ``credit``
+# are amount columns whose side gives the type.
+MAPPED_FIELDS = (
+    'date', 'amount', 'debit', 'credit', 'type', 'description', 'account', 'currency', 'category', 'external_id',
+)
+# Fields a default value can be given for
+DEFAULT_FIELDS = ('type', 'description', 'account', 'currency', 'category')
+OPTION_KEYS = ('date_format', 'delimiter', 'decimal_separator', 'encoding', 'sheet', 'duplicates', 'categorize')
+# What happens to a row that matches an existing transaction: left out,
+# imported with ``duplicate_of`` set, or merged into the existing one
+# (which gains the row's statement id and category if it has none)
+DUPLICATE_MODES = ('skip', 'mark', 'merge')
+
+TYPE_ALIASES = {
+    'INCOME': 'INCOME', 'CREDIT': 'INCOME', 'CR': 'INCOME', 'DEPOSIT': 'INCOME',
+    'EXPENSE': 'EXPENSE', 'DEBIT': 'EXPENSE', 'DR': 'EXPENSE', 'WITHDRAWAL': 'EXPENSE',
+    'TRANSFER': 'TRANSFER',
+}
+
+DESCRIPTION_LENGTH = Transaction._meta.get_field('description').max_length
+EXTERNAL_ID_LENGTH = Transaction._meta.get_field('external_id').max_length
+MAX_AMOUNT = Decimal(10) ** 13
+
+
+class RowError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def resolve_mapping(column_mapping, default_values, file_type):
+    """The column mapping and default values an import of ``file_type`` runs with."""
+    if file_type in STATEMENT_TYPES:
+        column_mapping = {**STATEMENT_MAPPING, **column_mapping}
+    return column_mapping, default_values
+
+
+def validate_mapping(column_mapping, default_values, file_type='CSV'):
+    """Raise ValueError unless a column mapping and default values can drive an import."""
+    if file_type not in READERS:
+        raise ValueError(f'Unsupported file type: {file_type}')
+    if not isinstance(column_mapping, dict) or not isinstance(default_values, dict):
+        raise ValueError('column_mapping and default_values must be objects')
+    column_mapping, default_values = resolve_mapping(column_mapping, default_values, file_type)
+    unknown = set(column_mapping) - set(MAPPED_FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown mapped fields: {", ".join(sorted(unknown))}')
+    unknown = set(default_values) - set(DEFAULT_FIELDS) - set(OPTION_KEYS)
+    if unknown:
+        raise ValueError(f'Unknown default values: {", ".join(sorted(unknown))}')
+    if not all(isinstance(column, str) and column for column in column_mapping.values()):
+        raise ValueError('Mapped columns must be non-empty strings')
+    if 'date' not in column_mapping:
+        raise ValueError('A column must be mapped to date')
+    if not {'amount', 'debit', 'credit'} & set(column_mapping):
+        raise ValueError('A column must be mapped to amount, or to debit and credit')
+    if 'account' not in column_mapping and not default_values.get('account'):
+        raise ValueError('Map a column to account or give a default account')
+    if default_values.get('type') and default_values['type'].upper() not in TYPE_ALIASES:
+        raise ValueError(f'Unknown default type: {default_values["type"]}')
+    if default_values.get('duplicates', 'skip') not in DUPLICATE_MODES:
+        raise ValueError(f'duplicates must be one of {", ".join(DUPLICATE_MODES)}')
+    if not isinstance(default_values.get('categorize', True), bool):
+        raise ValueError('categorize must be true or false')
+    delimiter = default_values.get('delimiter', ',')
+    if not isinstance(delimiter, str) or len(delimiter) != 1:
+        raise ValueError('delimiter must be a single character')
+    if default_values.get('encoding'):
+        try:
+            codecs.lookup(default_values['encoding'])
+        except LookupError:
+            raise ValueError(f'Unknown encoding: {default_values["encoding"]}')
+
+
+@dataclass
+class ImportRecord:
+    line: int
+    date: object
+    amount: Decimal
+    type: str
+    description: str
+    account: str
+    currency: str
+    category: str
+    external_id: str = ''
+
+
+class RowParser:
+    """Turns one mapped row into an ``ImportRecord``."""
+
+    def __init__(self, column_mapping, default_values):
+        self.columns = column_mapping
+        self.defaults = default_values
+        self.date_format = default_values.get('date_format')
+        self.decimal_separator = default_values.get('decimal_separator', '.')
+
+    def check_header(self, header):
+        missing = sorted(set(self.columns.values()) - set(header))
+        if missing:
+            raise ImportFileError(f'Missing columns: {", ".join(missing)}')
+
+    def value(self, row, field):
+        """The row's value for a field, else its default, else ''. Spreadsheet cells keep their type."""
+        column = self.columns.get(field)
+        value = row.get(column, '') if column else ''
+        if isinstance(value, str):
+            value = value.strip()
+        if value == '':
+            value = self.defaults.get(field) or ''
+        return value
+
+    def text(self, row, field):
+        return str(self.value(row, field))
+
+    def parse_date(self, value):
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        if value == '':
+            raise ValueError('This field is required')
+        value = str(value)
+        try:
+            if self.date_format:
+                return datetime.strptime(value, self.date_format).date()
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValueError(f'Expected a date in {self.date_format or "YYYY-MM-DD"} format')
+        return parsed
+
+    def parse_amount(self, value):
+        if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+            # Through str() so floats keep their shortest representation
+            return Decimal(str(value))
+        value = str(value)
+        negative = value.startswith('(') and value.endswith(')')
+        cleaned = re.sub(r'[^\d,.\-+]', '', value)
+        if self.decimal_separator == ',':
+            cleaned = cleaned.replace('.', '').replace(',', '.')
+        else:
+            cleaned = cleaned.replace(',', '')
+        try:
+            amount = Decimal(cleaned)
+        except InvalidOperation:
+            raise ValueError(f'Not a number: {value}')
+        if not amount.is_finite():
+            raise ValueError(f'Not a number: {value}')
+        return -amount if negative else amount
+
+    def parse(self, line, row):
+        errors = {}
+        try:
+            day = self.parse_date(self.value(row, 'date'))
+        except ValueError as exc:
+            errors['date'] = str(exc)
+            day = None
+
+        amount, row_type = None, None
+        try:
+            debit, credit = self.value(row, 'debit'), self.value(row, 'credit')
+            if debit != '' or credit != '':
+                # Some banks sign their debit column, some do not
+                amount = (abs(self.parse_amount(credit)) if credit != '' else 0) - \
+                    (abs(self.parse_amount(debit)) if debit != '' else 0)
+            elif self.value(row, 'amount') != '':
+                amount = self.parse_amount(self.value(row, 'amount'))
+            else:
+                errors['amount'] = 'This field is required'
+            if amount is not None and abs(amount) >= MAX_AMOUNT:
+                errors['amount'] = 'The amount is too large'
+        except ValueError as exc:
+            errors['amount'] = str(exc)
+
+        type_value = self.text(row, 'type')
+        if type_value:
+            row_type = TYPE_ALIASES.get(type_value.upper())
+            if row_type is None:
+                errors['type'] = f'Unknown type: {type_value}'
+        elif amount is not None:
+            # Without a type column the sign of the amount decides
+            row_type = 'EXPENSE' if amount < 0 else 'INCOME'
+
+        account = self.text(row, 'account')
+        if not account:
+            errors['account'] = 'This field is required'
+        if errors:
+            raise RowError(errors)
+        return ImportRecord(
+            line=line,
+            date=day,
+            amount=abs(amount).quantize(Decimal('0.01')),
+            type=row_type,
+            description=self.text(row, 'description')[:DESCRIPTION_LENGTH],
+            account=account,
+            currency=self.text(row, 'currency'),
+            category=self.text(row, 'category'),
+            external_id=self.text(row, 'external_id')[:EXTERNAL_ID_LENGTH],
+        )
+
+
+def parse_rows(parser, rows):
+    """Parse ``(line_number, row)`` pairs into ``(line_number, record, None)`` or ``(line_number, None, errors)``."""
+    items = []
+    for line, row in rows:
+        try:
+            items.append((line, parser.parse(line, row), None))
+        except RowError as exc:
+            items.append((line, None, exc.errors))
+    return items
+
+
+def as_uuid(value):
+    try:
+        return str(UUID(value))
+    except ValueError:
+        return None
+
+
+class ReferenceCache:
+    """
+    The user's accounts, categories and currencies by id or name
+    (case-insensitive; currencies by code). Each ``load`` queries only the
+    names not seen before, once per model; names that matched nothing are
+    remembered as None.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.accounts = {}
+        self.currencies = {}
+        self.categories = {}
+
+    @staticmethod
+    def key(value):
+        return as_uuid(value) or value.lower()
+
+    def lookup(self, found, queryset, name_field, values):
+        missing = {self.key(value) for value in values if value} - found.keys()
+        if not missing:
+            return
+        ids = [key for key in missing if as_uuid(key)]
+        names = [key for key in missing if not as_uuid(key)]
+        rows = queryset.annotate(lookup_name=Lower(name_field)).filter(
+            Q(id__in=ids) | Q(lookup_name__in=names)
+        )
+        found.update(dict.fromkeys(missing))
+        for row in rows:
+            found[str(row.id)] = row
+            if found.get(row.lookup_name) is None:
+                found[row.lookup_name] = row
+
+    def load(self, records):
+        self.lookup(self.accounts, Account.objects.filter(user=self.user), 'name',
+                    {record.account for record in records})
+        self.lookup(self.currencies, Currency.objects.all(), 'code',
+                    {record.currency for record in records})
+        self.lookup(self.categories, Category.objects.filter(user=self.user).order_by('name'), 'name',
+                    {record.category for record in records})
+
+    def get(self, found, value):
+        return found.get(self.key(value)) if value else None
+
+
+class TransactionImporter:
+    """
+    Imports an ``ImportJob``'s rows. ``run`` takes an iterable of
+    ``(line_number, row)`` pairs whose first item is ``(0, header)``, so any
+    streaming reader can feed it.
+    """
+
+    def __init__(self, job, chunk_size=None, progress=None):
+        self.job = job
+        self.progress = progress or JobProgress(job)
+        self.user = job.user
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.mapping = resolve_mapping(*job.mapping, job.file_type)
+        self.parser = RowParser(*self.mapping)
+        self.references = ReferenceCache(self.user)
+        self.resolver = RateResolver(self.user)
+        self.errors = list(job.errors or [])
+        self.duplicate_mode = self.mapping[1].get('duplicates', 'skip')
+        # Existing transactions already matched by a row of this file
+        self.matched = set()
+        self.categorizer = Categorizer(self.user) if self.mapping[1].get('categorize', True) else None
+
+    def add_errors(self, errors):
+        room = settings.IMPORT_MAX_ERRORS - len(self.errors)
+        if room > 0:
+            self.errors.extend(
+                {'row': line, 'errors': row_errors} for line, row_errors in sorted(errors.items())[:room]
+            )
+
+    def rows(self):
+        _, default_values = self.mapping
+        with self.job.file.open('rb') as fileobj:
+            yield from READERS[self.job.file_type](fileobj, default_values)
+
+    def run(self, rows=None):
+        rows = iter(self.rows() if rows is None else rows)
+        _, header = next(rows)
+        self.parser.check_header(header)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            self.import_chunk(chunk)
+
+    def run_parallel(self, workers):
+        """
+        Import the job's file with the parsing spread over ``workers``
+        processes. Segments are written in file order as their rows are parsed.
+        """
+        for segment in parse_in_parallel(self.job.file.path, *self.mapping, workers=workers):
+            for start in range(0, len(segment.items), self.chunk_size):
+                self.write_chunk(segment.items[start:start + self.chunk_size])
+
+    def import_chunk(self, rows):
+        self.write_chunk(parse_rows(self.parser, rows))
+
+    def write_chunk(self, items):
+        """Write one chunk of ``parse_rows`` output and count it on the job."""
+        errors = {line: row_errors for line, _, row_errors in items if row_errors}
+        records = [record for _, record, _ in items if record]
+        self.references.load(records)
+
+        transactions = []
+        for record in records:
+            try:
+                transactions.append(self.build(record))
+            except RowError as exc:
+                errors[record.line] = exc.errors
+        self.add_errors(errors)
+        self.resolver.prefetch(
+            (transaction.currency_id, self.resolver.base_currency_id)
+            for transaction in transactions if self.resolver.base_currency_id
+        )
+        for transaction in transactions:
+            transaction.apply_exchange_rate(self.resolver)
+        tag_ids, categorized = self.categorize(transactions)
+
+        with db_transaction.atomic():
+            duplicates = self.find_duplicates(transactions)
+            changes = []
+            if self.duplicate_mode == 'mark':
+                for transaction in transactions:
+                    transaction.duplicate_of_id = duplicates.get(transaction.id)
+                new = transactions
+            else:
+                new = [transaction for transaction in transactions if transaction.id not in duplicates]
+            if self.duplicate_mode == 'merge':
+                changes = self.merge(transactions, duplicates)
+            Transaction.objects.bulk_create(new)
+            Transaction.tags.through.objects.bulk_create([
+                Transaction.tags.through(transaction_id=transaction.id, tag_id=tag_id)
+                for transaction in new for tag_id in tag_ids.get(transaction.id, ())
+            ])
+            transactions_changed(changes + [(None, transaction.current_values) for transaction in new])
+        # Counted once the chunk is committed
+        self.progress.add(
+            processed_records=len(items),
+            successful_records=len(new),
+            failed_records=len(items) - len(transactions),
+            duplicate_records=len(duplicates),
+            categorized_records=sum(1 for transaction in new if transaction.id in categorized),
+        )
+        if self.progress.flush_due:
+            self.flush()
+
+    def flush(self):
+        """Copy the progress counters and row errors onto the job."""
+        self.progress.flush(errors=self.errors)
+
+    def categorize(self, transactions):
+        """
+        Give uncategorized rows the category their rule or the learned index
+        suggests, and return ``({transaction id: tag ids}, {ids of the rows
+        categorized})``. The tags apply to every row with a suggestion.
+        """
+        tag_ids, categorized = {}, set()
+        if self.categorizer is None:
+            return tag_ids, categorized
+        for transaction, suggestion in zip(transactions, self.categorizer.classify(transactions)):
+            if suggestion is None:
+                continue
+            category_id, tags = suggestion
+            if category_id and transaction.category_id is None:
+                transaction.category_id = category_id
+                categorized.add(transaction.id)
+            if tags:
+                tag_ids[transaction.id] = tags
+        return tag_ids, categorized
+
+    def find_duplicates(self, transactions):
+        """
+        Map the id of each new transaction that matches an existing one to the
+        existing transaction's id, with one query for the whole chunk. A
+        statement id match wins; otherwise each existing transaction absorbs
+        at most one row with its fingerprint, so identical rows in the file
+        beyond those already stored are still imported.
+        """
+        if not transactions:
+            return {}
+        external = {(t.account_id, t.external_id) for t in transactions if t.external_id}
+        condition = Q(fingerprint__in={transaction.fingerprint for transaction in transactions})
+        if external:
+            condition |= Q(
+                account_id__in={account_id for account_id, _ in external},
+                external_id__in={external_id for _, external_id in external},
+            )
+        candidates = (
+            Transaction.objects.filter(condition, user=self.user, duplicate_of__isnull=True)
+            .exclude(import_job=self.job)
+            .order_by('date', 'created_at', 'id')
+            .values_list('id', 'account_id', 'fingerprint', 'external_id')
+        )
+        by_external = {}
+        by_fingerprint = defaultdict(list)
+        for pk, account_id, fingerprint, external_id in candidates:
+            if external_id:
+                by_external[account_id, external_id] = pk
+            by_fingerprint[fingerprint].append((pk, external_id))
+
+        duplicates = {}
+        for transaction in transactions:
+            match = by_external.get((transaction.account_id, transaction.external_id)) \
+                if transaction.external_id else None
+            if match is None:
+                for pk, external_id in by_fingerprint.get(transaction.fingerprint, ()):
+                    # Different statement ids mean different transactions
+                    conflict = external_id and transaction.external_id and external_id != transaction.external_id
+                    if pk not in self.matched and not conflict:
+                        match = pk
+                        break
+            if match is not None:
+                self.matched.add(match)
+                duplicates[transaction.id] = match
+        return duplicates
+
+    def merge(self, transactions, duplicates):
+        """Fill in the statement id and category of matched transactions that lack them."""
+        imported = {duplicates[t.id]: t for t in transactions if t.id in duplicates}
+        existing = Transaction.objects.select_for_update(of=('self',)).filter(id__in=list(imported))
+        changed = []
+        for transaction in existing:
+            row = imported[transaction.id]
+            updated = False
+            if not transaction.external_id and row.external_id:
+                transaction.external_id = row.external_id
+                updated = True
+            if transaction.category_id is None and row.category_id:
+                transaction.category_id = row.category_id
+                updated = True
+            if updated:
+                transaction.updated_at = timezone.now()
+                changed.append(transaction)
+        Transaction.objects.bulk_update(changed, ['external_id', 'category', 'updated_at'])
+        return [(transaction.loaded_values, transaction.current_values) for transaction in changed]
+
+    def build(self, record):
+        errors = {}
+        account = self.references.get(self.references.accounts, record.account)
+        if account is None:
+            errors['account'] = f'Account not found: {record.account}'
+        currency_id = account.currency_id if account else None
+        if record.currency:
+            currency = self.references.get(self.references.currencies, record.currency)
+            if currency is None:
+                errors['currency'] = f'Currency not found: {record.currency}'
+            else:
+                currency_id = currency.id
+        category = None
+        if record.category:
+            category = self.references.get(self.references.categories, record.category)
+            if category is None:
+                errors['category'] = f'Category not found: {record.category}'
+        if errors:
+            raise RowError(errors)
+        transaction = Transaction(
+            user=self.user,
+            account=account,
+            currency_id=currency_id,
+            category=category,
+            type=record.type,
+            amount=record.amount,
+            description=record.description,
+            date=record.date,
+            external_id=record.external_id or None,
+            import_job=self.job,
+        )
+        apply_fingerprint(transaction)
+        return transaction
+
+
+def run_import_job(job_id, chunk_size=None, workers=None):
+    """
+    Claim a pending job and import its file, parsing large files in
+    ``workers`` processes (default ``IMPORT_WORKERS``). Returns False if the
+    job was not pending (already claimed by another worker, finished or
+    deleted).
+    """
+    now = timezone.now()
+    claimed = ImportJob.objects.filter(pk=job_id, status='PENDING').update(
+        status='PROCESSING', started_at=now, updated_at=now
+    )
+    if not claimed:
+        return False
+    job = ImportJob.objects.select_related('user', 'template').get(pk=job_id)
+    workers = workers or settings.IMPORT_WORKERS
+    progress = JobProgress(job)
+    progress.start()
+    importer = None
+
+    def finish(status, **fields):
+        if importer is not None:
+            importer.flush()
+        ImportJob.objects.filter(pk=job_id).update(
+            status=status, total_records=F('processed_records'), updated_at=timezone.now(), **fields
+        )
+        progress.finish(status)
+
+    try:
+        importer = TransactionImporter(job, chunk_size, progress)
+        if workers > 1 and can_parse_in_parallel(job):
+            importer.run_parallel(workers)
+        else:
+            importer.run()
+    except ImportFileError as exc:
+        finish('FAILED', error_message=str(exc))
+    except Exception:
+        logger.exception('Import job %s failed', job_id)
+        finish('FAILED', error_message='The import stopped because of an unexpected error')
+        raise
+    else:
+        finish('COMPLETED')
+    return True
@@ -0,0 +1,36 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from files.backups import write_backup
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Write a backup of one user's accounts, transactions, categories, tags, exchange rates, rules and "
+            "import templates to a zip file, using COPY on PostgreSQL.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email address of the user to back up.')
+        parser.add_argument('output', help='Path of the backup file to write.')
+        parser.add_argument(
+            '--method', choices=['copy', 'orm'],
+            help='Read tables with COPY (PostgreSQL only) or the ORM. Defaults to COPY where available.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options['email'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user with email {options["email"]}')
+        started = time.monotonic()
+        with open(options['output'], 'wb') as output:
+            manifest = write_backup(user, output, options['method'])
+        if options['verbosity'] >= 1:
+            rows = sum(table['rows'] for table in manifest['tables'])
+            self.stdout.write(
+                f'Backed up {rows} rows from {len(manifest["tables"])} tables '
+                f'in {time.monotonic() - started:.2f}s ({manifest["method"]})'
+            )
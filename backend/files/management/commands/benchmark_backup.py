@@ -0,0 +1,88 @@
+import io
+import random
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction as db_transaction
+
+from accounts.models import Account, Currency
+from files.backups import restore_backup, write_backup
+from transactions.models import Category, Tag, Transaction
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Time backing up and restoring a generated user with COPY and with the ORM fallback. Everything '
+            'runs in one transaction that is rolled back, so nothing is kept.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=200_000, help='Transactions of the generated user.')
+
+    def handle(self, *args, **options):
+        methods = ['copy', 'orm'] if connection.vendor == 'postgresql' else ['orm']
+        try:
+            with db_transaction.atomic():
+                source = self.generate(options['transactions'])
+                for method in methods:
+                    self.run(source, method)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, source, method):
+        backup = io.BytesIO()
+        started = time.monotonic()
+        manifest = write_backup(source, backup, method)
+        elapsed = time.monotonic() - started
+        rows = sum(table['rows'] for table in manifest['tables'])
+        self.stdout.write(
+            f'{method} backup: {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s), '
+            f'{backup.tell() / 1024 / 1024:.1f} MiB'
+        )
+        target = User.objects.create_user(email=f'restore-{uuid.uuid4().hex}@example.com',
+                                          username=uuid.uuid4().hex, password=None)
+        backup.seek(0)
+        started = time.monotonic()
+        rows = sum(restore_backup(backup, target, method).values())
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'{method} restore: {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)')
+
+    def generate(self, count):
+        randomizer = random.Random(0)
+        currency = Currency.objects.filter(code='USD').first() or Currency.objects.create(
+            code='USD', name='US Dollar', symbol='$'
+        )
+        user = User.objects.create_user(email=f'benchmark-{uuid.uuid4().hex}@example.com',
+                                        username=uuid.uuid4().hex, password=None, base_currency=currency)
+        account = Account.objects.create(
+            user=user, name='Checking', type='BANK', currency=currency, initial_balance=0, current_balance=0,
+            base_currency_balance=0,
+        )
+        categories = [Category.objects.create(user=user, name=f'Category {i}', type='EXPENSE') for i in range(20)]
+        tags = [Tag.objects.create(user=user, name=f'Tag {i}') for i in range(10)]
+        start = date(2015, 1, 1)
+        through = Transaction.tags.through
+        for offset in range(0, count, 10_000):
+            batch = []
+            for i in range(offset, min(offset + 10_000, count)):
+                amount = Decimal(randomizer.randint(1, 50000)) / 100
+                batch.append(Transaction(
+                    user=user, account=account, type='EXPENSE', amount=amount, currency=currency,
+                    base_currency_amount=amount, description=f'Payment {i}\tref {randomizer.randint(0, 99999)}',
+                    date=start + timedelta(days=i % 3650), category=randomizer.choice(categories),
+                ))
+            Transaction.objects.bulk_create(batch)
+            through.objects.bulk_create([
+                through(transaction_id=transaction.id, tag_id=randomizer.choice(tags).id)
+                for transaction in batch[::3]
+            ])
+        return user
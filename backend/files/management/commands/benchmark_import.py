@@ -0,0 +1,85 @@
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from files.imports import RowParser, parse_rows
+from files.parallel import parse_in_parallel
+from files.readers import csv_rows
+
+COLUMN_MAPPING = {'date': 'Date', 'description': 'Description', 'amount': 'Amount', 'category': 'Category'}
+DEFAULT_VALUES = {'account': 'Checking'}
+
+
+class Command(BaseCommand):
+    help = ('Time parsing a generated statement sequentially and with parallel workers. Nothing is written '
+            'to the database; this measures the parse stage that the worker processes take over.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Rows in the generated file.')
+        parser.add_argument(
+            '--workers',
+            default=','.join(str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1})),
+            help='Comma-separated worker counts to time. 1 runs the sequential parser.',
+        )
+        parser.add_argument('--segment-size', type=int, default=None, help='Bytes per segment.')
+        parser.add_argument('--file', help='Benchmark this CSV file (Date, Description, Amount, Category).')
+
+    def handle(self, *args, **options):
+        try:
+            worker_counts = [max(1, int(value)) for value in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('--workers must be a comma-separated list of numbers')
+
+        path = options['file']
+        generated = path is None
+        if generated:
+            path = self.generate(options['rows'])
+        try:
+            self.stdout.write(f'{os.path.getsize(path) / 1024 / 1024:.1f} MiB, {os.cpu_count()} CPUs')
+            baseline = None
+            for workers in worker_counts:
+                started = time.monotonic()
+                rows = self.parse(path, workers, options['segment_size'])
+                elapsed = time.monotonic() - started
+                if workers == 1 and baseline is None:
+                    baseline = elapsed
+                speedup = f', {baseline / elapsed:.2f}x' if baseline else ''
+                self.stdout.write(
+                    f'{workers} worker(s): {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s{speedup})'
+                )
+        finally:
+            if generated:
+                os.remove(path)
+
+    def generate(self, count):
+        randomizer = random.Random(0)
+        start = date(2015, 1, 1)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, newline='') as out:
+            out.write('Date,Description,Amount,Category\n')
+            for i in range(count):
+                day = start + timedelta(days=i % 3650)
+                amount = randomizer.randint(-50000, 50000) / 100
+                out.write(f'{day.isoformat()},"Payment {i}, ref {randomizer.randint(0, 99999)}",{amount},Food\n')
+        return out.name
+
+    def parse(self, path, workers, segment_size):
+        if workers == 1:
+            parser = RowParser(COLUMN_MAPPING, DEFAULT_VALUES)
+            rows = 0
+            with open(path, 'rb') as fileobj:
+                reader = csv_rows(fileobj)
+                next(reader)
+                while True:
+                    chunk = list(islice(reader, 10000))
+                    if not chunk:
+                        return rows
+                    rows += len(parse_rows(parser, chunk))
+        return sum(
+            len(result.items)
+            for result in parse_in_parallel(path, COLUMN_MAPPING, DEFAULT_VALUES, workers, segment_size)
+        )
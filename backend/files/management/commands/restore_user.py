@@ -0,0 +1,42 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from files.backups import BackupError, restore_backup
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Load a backup written by backup_user into a user without data, giving the restored rows new ids '
+            'unless --keep-ids is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email address of the user to restore into.')
+        parser.add_argument('input', help='Path of the backup file.')
+        parser.add_argument(
+            '--method', choices=['copy', 'orm'],
+            help='Load tables with COPY (PostgreSQL only) or batched inserts. Defaults to COPY where available.',
+        )
+        parser.add_argument(
+            '--keep-ids',
+            action='store_true',
+            help='Keep the backed-up ids, e.g. when moving a user to another database.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options['email'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user with email {options["email"]}')
+        started = time.monotonic()
+        try:
+            with open(options['input'], 'rb') as backup:
+                counts = restore_backup(backup, user, options['method'], options['keep_ids'])
+        except BackupError as exc:
+            raise CommandError(str(exc))
+        if options['verbosity'] >= 1:
+            for table, rows in counts.items():
+                self.stdout.write(f'{table}: {rows}')
+            self.stdout.write(f'Restored {sum(counts.values())} rows in {time.monotonic() - started:.2f}s')
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_importjob_duplicate_records'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='categorized_records',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.14 on 2026-10-17 01:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0003_importjob_categorized_records'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='data_version',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='export_key',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='file',
+            field=models.FileField(blank=True, null=True, upload_to='exports/%Y/%m/%d/'),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='total_records',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='exportjob',
+            index=models.Index(fields=['user', 'export_key'], name='files_expor_user_id_8aa753_idx'),
+        ),
+    ]
@@ -18,8 +18,20 @@ class ImportJob(models.Model):
     processed_records = models.PositiveIntegerField(default=0)
     successful_records = models.PositiveIntegerField(default=0)
     failed_records = models.PositiveIntegerField(default=0)
+    duplicate_records = models.PositiveIntegerField(default=0)
+    categorized_records = models.PositiveIntegerField(default=0)  # Categorized by rules or the learned index
     error_message = models.TextField(null=True, blank=True)
     column_mapping = models.JSONField(null=True, blank=True)  # Store column mappings
+    default_values = models.JSONField(null=True, blank=True)  # Override the template's defaults
+    template = models.ForeignKey('ImportTemplate', on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='import_jobs')
+    file = models.FileField(upload_to='imports/%Y/%m/%d/', max_length=255, null=True, blank=True)
+    errors = models.JSONField(default=list, blank=True)  # Row-level errors, capped
+    # Scheduling (see files.scheduling): file size in bytes, when the job
+    # was handed to a worker, and when a worker started it
+    size = models.BigIntegerField(default=0)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -28,11 +40,21 @@ class ImportJob(models.Model):
         indexes = [
             models.Index(fields=['user', 'status']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'dispatched_at']),
         ]
 
     def __str__(self):
         return f"Import {self.file_name} - {self.status}"
 
+    @property
+    def mapping(self):
+        """The template's column mapping and defaults with the job's own values on top."""
+        column_mapping = dict(self.template.column_mapping or {}) if self.template else {}
+        default_values = dict(self.template.default_values or {}) if self.template else {}
+        column_mapping.update(self.column_mapping or {})
+        default_values.update(self.default_values or {})
+        return column_mapping, default_values
+
 class ExportJob(models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
@@ -54,6 +76,17 @@ class ExportJob(models.Model):
     filters = models.JSONField(null=True, blank=True)  # Store export filters
     date_range = models.JSONField(null=True, blank=True)  # Store date range
     error_message = models.TextField(null=True, blank=True)
+    file = models.FileField(upload_to='exports/%Y/%m/%d/', null=True, blank=True)
+    total_records = models.PositiveIntegerField(default=0)
+    # Hash of the format, filters and date range, and the owner's data
+    # version the file was rendered at; together they decide reuse
+    export_key = models.CharField(max_length=40, blank=True, default='')
+    data_version = models.BigIntegerField(null=True, blank=True)
+    # Scheduling (see files.scheduling): estimated row count, when the job
+    # was handed to a worker, and when a worker started it
+    size = models.BigIntegerField(default=0)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -62,6 +95,8 @@ class ExportJob(models.Model):
         indexes = [
             models.Index(fields=['user', 'status']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['user', 'export_key']),
+            models.Index(fields=['status', 'dispatched_at']),
         ]
 
     def __str__(self):
@@ -87,3 +122,37 @@ class ImportTemplate(models.Model):
 
     def __str__(self):
         return self.name
+
+class Upload(models.Model):
+    """A file uploaded in chunks and stored under its content hash (see ``files.uploads``)."""
+    STATUS_CHOICES = [
+        ('UPLOADING', 'Uploading'),
+        ('COMPLETED', 'Completed'),
+    ]
+
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='uploads')
+    file_name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)  # Bytes stored, always a whole number of blocks
+    block_hashes = models.JSONField(default=list, blank=True)  # SHA-256 of each block received
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='UPLOADING')
+    file = models.FileField(max_length=255, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+        constraints = [
+            # One stored copy of each file per user
+            models.UniqueConstraint(
+                fields=['user', 'content_hash'], name='upload_unique_content',
+                condition=models.Q(status='COMPLETED')
+            ),
+        ]
+
+    def __str__(self):
+        return f"Upload {self.file_name} - {self.status}"
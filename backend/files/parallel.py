@@ -0,0 +1,194 @@
+"""
+Parallel parsing of large CSV imports.
+
+The uploaded file is memory-mapped and cut into segments of about
+``IMPORT_SEGMENT_SIZE`` bytes, each ending on a row boundary: a newline
+outside quotes, found by tracking quote parity, so quoted fields that span
+lines are never split. Worker processes parse and normalize segments
+independently; the caller receives the results strictly in file order and
+writes them while later segments are still being parsed. At most two
+segments per worker are in flight, so memory stays flat however large the
+file is.
+
+Segments are cut on ``\\n`` bytes, which only works for encodings where
+every ASCII byte stands for itself; other files are parsed sequentially.
+This module imports no models at load time, so spawned workers can set
+Django up before touching the import code.
+"""
+import codecs
+import csv
+import io
+import mmap
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+
+from .readers import csv_rows
+
+# Byte-oriented encodings in which b'\n' and b'"' only ever mean themselves
+ASCII_COMPATIBLE_ENCODINGS = {'utf-8', 'utf-8-sig', 'ascii', 'latin-1', 'iso8859-1', 'iso8859-15', 'cp1252'}
+
+
+@dataclass
+class Segment:
+    start: int
+    end: int
+    first_line: int
+
+
+@dataclass
+class SegmentResult:
+    first_line: int
+    items: list = field(default_factory=list)  # parse_rows() output
+
+
+def is_ascii_compatible(encoding):
+    try:
+        return codecs.lookup(encoding).name in ASCII_COMPATIBLE_ENCODINGS
+    except LookupError:
+        return False
+
+
+def can_parse_in_parallel(job):
+    """Whether the job's file is large enough and in a form that can be split into segments."""
+    _, default_values = job.mapping
+    if job.file_type != 'CSV' or not is_ascii_compatible(default_values.get('encoding', 'utf-8-sig')):
+        return False
+    try:
+        path = job.file.path
+    except NotImplementedError:
+        # Storage without local files; mmap needs one
+        return False
+    return os.path.getsize(path) >= settings.IMPORT_PARALLEL_MIN_SIZE
+
+
+def count(data, sub, start, end):
+    # mmap has find() but no count()
+    return data[start:end].count(sub)
+
+
+def row_boundary(data, start, quoted):
+    """
+    The offset just past the first newline at or after ``start`` that is
+    outside quotes, given whether ``start`` is inside a quoted field, or
+    ``len(data)``.
+    """
+    position = start
+    while True:
+        newline = data.find(b'\n', position)
+        if newline == -1:
+            return len(data)
+        quoted ^= count(data, b'"', position, newline) % 2 == 1
+        if not quoted:
+            return newline + 1
+        position = newline + 1
+
+
+def split_rows(data, start, segment_size):
+    """Cut ``data[start:]`` into ``Segment``s of about ``segment_size`` bytes that end on row boundaries."""
+    line = count(data, b'\n', 0, start) + 1
+    while start < len(data):
+        target = min(start + segment_size, len(data))
+        # Quote parity at the target tells whether it falls inside a field
+        quoted = count(data, b'"', start, target) % 2 == 1
+        end = len(data) if target == len(data) else row_boundary(data, target, quoted)
+        yield Segment(start, end, line)
+        line += count(data, b'\n', start, end)
+        start = end
+
+
+def pack(items):
+    # Dates and decimals pickle several times slower than ints and strings
+    return [
+        (line, record and (record.date.toordinal(), str(record.amount), record.type, record.description,
+                           record.account, record.currency, record.category, record.external_id), errors)
+        for line, record, errors in items
+    ]
+
+
+def unpack(items):
+    from .imports import ImportRecord
+
+    return [
+        (line, values and ImportRecord(line, date.fromordinal(values[0]), Decimal(values[1]), *values[2:]), errors)
+        for line, values, errors in items
+    ]
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+def segment_rows(reader, first_line, header, unreadable):
+    """
+    Yield ``(line_number, row)`` for the segment's non-blank rows. Lines the
+    reader rejects are added to ``unreadable`` as row errors, as the reader
+    carries on with the next line.
+    """
+    while True:
+        try:
+            values = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            unreadable.append((first_line - 1 + reader.line_num, None, {'file': str(exc)}))
+            continue
+        if any(value.strip() for value in values):
+            yield first_line - 1 + reader.line_num, dict(zip(header, values))
+
+
+def parse_segment(path, segment, header, column_mapping, default_values):
+    """Parse one segment of the file in a worker process."""
+    from .imports import RowParser, parse_rows
+
+    with open(path, 'rb') as fileobj, mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[segment.start:segment.end].decode(default_values.get('encoding', 'utf-8-sig'), errors='replace')
+    reader = csv.reader(io.StringIO(text, newline=''), delimiter=default_values.get('delimiter', ','))
+    unreadable = []
+    rows = segment_rows(reader, segment.first_line, header, unreadable)
+    items = parse_rows(RowParser(column_mapping, default_values), rows)
+    if unreadable:
+        items = sorted(items + unreadable, key=lambda item: item[0])
+    return SegmentResult(segment.first_line, pack(items))
+
+
+def received(future):
+    result = future.result()
+    result.items = unpack(result.items)
+    return result
+
+
+def parse_in_parallel(path, column_mapping, default_values, workers, segment_size=None):
+    """
+    Parse a CSV file in ``workers`` processes, yielding a ``SegmentResult``
+    per segment in file order. Lines the CSV reader rejects come back as row
+    errors.
+    """
+    from .imports import RowParser
+
+    segment_size = segment_size or settings.IMPORT_SEGMENT_SIZE
+    encoding = default_values.get('encoding', 'utf-8-sig')
+    delimiter = default_values.get('delimiter', ',')
+    with open(path, 'rb') as fileobj, mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        header_end = row_boundary(data, 0, False)
+        _, header = next(csv_rows(io.BytesIO(data[:header_end]), delimiter=delimiter, encoding=encoding))
+        RowParser(column_mapping, default_values).check_header(header)
+
+        # Spawned rather than forked: the parent may hold threads and connections
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as pool:
+            pending = deque()
+            for segment in split_rows(data, header_end, segment_size):
+                pending.append(pool.submit(parse_segment, path, segment, header, column_mapping, default_values))
+                if len(pending) >= workers * 2:
+                    yield received(pending.popleft())
+            while pending:
+                yield received(pending.popleft())
+
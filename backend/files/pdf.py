@@ -0,0 +1,129 @@
+"""
+A minimal streaming PDF writer for tabular reports.
+
+Each page is written to the output as soon as it is full, so memory does
+not grow with the number of rows beyond one byte offset per PDF object.
+Text is set in the standard Helvetica fonts, which every reader has and
+which need no embedding; they cover Windows-1252, and other characters are
+replaced. Cells are cut to their column width using an average glyph
+width, which is close enough for statement-style tables.
+"""
+
+PAGE_WIDTH, PAGE_HEIGHT = 842, 595  # A4 landscape, in points
+MARGIN = 36
+FONT_SIZE = 8
+LINE_HEIGHT = 11
+# Average Helvetica glyph width, as a fraction of the font size
+CHAR_WIDTH = 0.5
+DIGIT_WIDTH = 0.556
+
+CATALOG, PAGES, FONT, BOLD_FONT = 1, 2, 3, 4
+# Resource names (/F1, /F2) of the fonts on every page
+REGULAR, BOLD = 1, 2
+
+
+def pdf_text(value):
+    data = str(value).encode('cp1252', 'replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def fit(value, width):
+    """Cut ``value`` to what fits in ``width`` points."""
+    limit = max(int(width / (FONT_SIZE * CHAR_WIDTH)), 1)
+    return value if len(value) <= limit else value[:limit - 1] + '…'
+
+
+class PDFTableWriter:
+    """
+    Writes a table to a binary file object, page by page. ``columns`` is a
+    list of ``(header, width_in_points, right_aligned)``. Call ``add_row``
+    for every row, then ``close``.
+    """
+
+    def __init__(self, output, title, columns):
+        self.output = output
+        self.title = title
+        self.columns = columns
+        self.position = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = BOLD_FONT + 1
+        self.rows = []
+        # Title and header lines, with a blank line under each
+        self.rows_per_page = (PAGE_HEIGHT - 2 * MARGIN) // LINE_HEIGHT - 4
+        self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self.write_object(FONT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+        self.write_object(
+            BOLD_FONT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>'
+        )
+
+    def write(self, data):
+        self.output.write(data)
+        self.position += len(data)
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.position
+        self.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    def allocate(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def add_row(self, values):
+        self.rows.append(['' if value is None else str(value) for value in values])
+        if len(self.rows) == self.rows_per_page:
+            self.write_page()
+
+    def text(self, font, x, y, value):
+        # ``font`` is a resource number: REGULAR or BOLD
+        return b'BT /F%d %d Tf %.2f %.2f Td (%s) Tj ET\n' % (font, FONT_SIZE, x, y, pdf_text(value))
+
+    def line(self, font, y, values):
+        commands = []
+        x = MARGIN
+        for value, (_, width, right_aligned) in zip(values, self.columns):
+            value = fit(value, width - 4)
+            if right_aligned:
+                offset = width - 4 - len(value) * FONT_SIZE * DIGIT_WIDTH
+                commands.append(self.text(font, x + max(offset, 0), y, value))
+            else:
+                commands.append(self.text(font, x, y, value))
+            x += width
+        return b''.join(commands)
+
+    def write_page(self):
+        number = len(self.page_ids) + 1
+        y = PAGE_HEIGHT - MARGIN - FONT_SIZE
+        content = [
+            self.text(BOLD, MARGIN, y, self.title),
+            self.text(REGULAR, PAGE_WIDTH - MARGIN - 40, y, f'Page {number}'),
+        ]
+        y -= 2 * LINE_HEIGHT
+        content.append(self.line(BOLD, y, [header for header, _, _ in self.columns]))
+        y -= LINE_HEIGHT / 2
+        content.append(b'%.2f %.2f m %.2f %.2f l 0.5 w S\n' % (MARGIN, y + 2, PAGE_WIDTH - MARGIN, y + 2))
+        for row in self.rows:
+            y -= LINE_HEIGHT
+            content.append(self.line(REGULAR, y, row))
+        self.rows = []
+        stream = b''.join(content)
+
+        contents_id, page_id = self.allocate(), self.allocate()
+        self.write_object(contents_id, b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        self.write_object(page_id, (
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F%d %d 0 R /F%d %d 0 R >> >> /Contents %d 0 R >>'
+        ) % (PAGES, PAGE_WIDTH, PAGE_HEIGHT, REGULAR, FONT, BOLD, BOLD_FONT, contents_id))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        if self.rows or not self.page_ids:
+            self.write_page()
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.page_ids)
+        self.write_object(PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.page_ids)))
+        self.write_object(CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES)
+        xref = self.position
+        self.write(b'xref\n0 %d\n0000000000 65535 f \n' % self.next_id)
+        for number in range(1, self.next_id):
+            self.write(b'%010d 00000 n \n' % self.offsets[number])
+        self.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (self.next_id, CATALOG, xref))
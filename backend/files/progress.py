@@ -0,0 +1,142 @@
+"""
+Live progress of import and export jobs.
+
+A running job counts its progress in the cache (Redis in production) with
+atomic ``incr`` calls instead of updating its row for every chunk, which
+would contend with the job's own writes. The counters are copied onto the
+job's row at most every ``JOB_PROGRESS_FLUSH_INTERVAL`` seconds and when
+the job ends. The progress endpoint and the server-sent event stream read
+the cache alone while the job runs. They only fall back to the row for jobs
+that have not started or finished more than ``JOB_PROGRESS_TIMEOUT``
+seconds ago.
+
+While a job runs its keys have no expiry, so a cache that evicts only keys
+with a timeout keeps them; they expire ``JOB_PROGRESS_TIMEOUT`` seconds
+after the job ends.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+# Counters kept for each job model, named after the row's fields
+PROGRESS_FIELDS = {
+    'importjob': ('processed_records', 'successful_records', 'failed_records', 'duplicate_records',
+                  'categorized_records'),
+    'exportjob': ('total_records',),
+}
+FINISHED = ('COMPLETED', 'FAILED')
+
+
+def progress_prefix(model, job_id):
+    return f'files:progress:{model._meta.model_name}:{job_id}'
+
+
+def read_progress(model, job_id, user_id):
+    """
+    The job's status and counters from the cache, or None when they are not
+    there or belong to another user.
+    """
+    prefix = progress_prefix(model, job_id)
+    fields = PROGRESS_FIELDS[model._meta.model_name]
+    values = cache.get_many([f'{prefix}:{name}' for name in ('user', 'status') + fields])
+    if values.get(f'{prefix}:user') != str(user_id):
+        return None
+    progress = {'status': values.get(f'{prefix}:status')}
+    progress.update({name: values.get(f'{prefix}:{name}', 0) for name in fields})
+    return progress
+
+
+def job_progress(job):
+    """The same snapshot as ``read_progress``, taken from the job's row."""
+    progress = {'status': job.status}
+    progress.update({name: getattr(job, name) for name in PROGRESS_FIELDS[job._meta.model_name]})
+    return progress
+
+
+class JobProgress:
+    """The cache counters of one running job, and their flushes to its row."""
+
+    def __init__(self, job):
+        self.model = type(job)
+        self.job_id = job.pk
+        self.user_id = job.user_id
+        self.prefix = progress_prefix(self.model, job.pk)
+        self.fields = PROGRESS_FIELDS[job._meta.model_name]
+        self.flushed_at = time.monotonic()
+
+    def key(self, name):
+        return f'{self.prefix}:{name}'
+
+    def start(self):
+        values = {self.key(name): 0 for name in self.fields}
+        values[self.key('user')] = str(self.user_id)
+        values[self.key('status')] = 'PROCESSING'
+        cache.set_many(values, timeout=None)
+
+    def add(self, **counts):
+        for name, count in counts.items():
+            if not count:
+                continue
+            try:
+                cache.incr(self.key(name), count)
+            except ValueError:
+                # Lost from the cache; start again from the row
+                cache.add(self.key(name), getattr(self.model.objects.get(pk=self.job_id), name), timeout=None)
+                cache.incr(self.key(name), count)
+
+    def counts(self):
+        values = cache.get_many([self.key(name) for name in self.fields])
+        return {name: values[self.key(name)] for name in self.fields if self.key(name) in values}
+
+    @property
+    def flush_due(self):
+        return time.monotonic() - self.flushed_at >= settings.JOB_PROGRESS_FLUSH_INTERVAL
+
+    def flush(self, **fields):
+        """Copy the counters, and any other ``fields``, onto the job's row."""
+        self.model.objects.filter(pk=self.job_id).update(**self.counts(), **fields, updated_at=timezone.now())
+        self.flushed_at = time.monotonic()
+
+    def finish(self, status):
+        cache.set(self.key('status'), status, timeout=None)
+        for name in ('user', 'status') + self.fields:
+            cache.touch(self.key(name), settings.JOB_PROGRESS_TIMEOUT)
+
+
+def event_id(data):
+    return hashlib.sha1(data.encode()).hexdigest()[:16]
+
+
+def progress_events(model, job_id, user_id, progress, last_event_id=None):
+    """
+    Yield server-sent events carrying the job's progress as JSON, starting
+    with ``progress``, whenever it changes and until the job ends. Each
+    event's id identifies its snapshot, so a client reconnecting with
+    ``Last-Event-ID`` is not sent the snapshot it already has. The stream
+    is synchronous and holds a worker while open, so it closes after
+    ``JOB_PROGRESS_STREAM_SECONDS`` (under half a minute by default) and the
+    client reconnects after ``retry``. Comments keep idle connections open.
+    """
+    interval = settings.JOB_PROGRESS_POLL_INTERVAL
+    started = sent_at = time.monotonic()
+    yield f'retry: {int(interval * 1000) or 1000}\n\n'
+    last_id = last_event_id
+    while True:
+        now = time.monotonic()
+        data = json.dumps(progress)
+        if event_id(data) != last_id:
+            last_id = event_id(data)
+            yield f'id: {last_id}\ndata: {data}\n\n'
+            sent_at = now
+        elif now - sent_at >= 15:
+            yield ': keep-alive\n\n'
+            sent_at = now
+        if progress['status'] in FINISHED or now - started >= settings.JOB_PROGRESS_STREAM_SECONDS:
+            return
+        time.sleep(interval)
+        # Until a pending job starts there is nothing in the cache yet
+        progress = read_progress(model, job_id, user_id) or progress
@@ -0,0 +1,278 @@
+"""
+Streaming readers for import files.
+
+Every reader takes a file opened in binary mode plus the job's default
+values (for parse options), and yields ``(0, header)`` followed by
+``(row_number, {column: value})`` for each record, holding no more than a
+buffer of the file in memory. Spreadsheet rows come as they are in the
+sheet. Bank statements come as rows with the columns in
+``STATEMENT_COLUMNS``, which ``STATEMENT_MAPPING`` maps onto transaction
+fields. This module imports no models, so worker processes can load it
+before Django is set up.
+"""
+import csv
+import html
+import io
+import re
+from datetime import datetime
+
+STATEMENT_COLUMNS = ['date', 'amount', 'description', 'currency', 'reference', 'account_number']
+# Column mapping used for statement formats unless the job maps a field itself
+STATEMENT_MAPPING = {
+    'date': 'date', 'amount': 'amount', 'description': 'description', 'currency': 'currency',
+    'external_id': 'reference',
+}
+
+# Statements are read in blocks of this many characters
+READ_SIZE = 64 * 1024
+
+
+class ImportFileError(Exception):
+    """A problem with the file as a whole; the job fails without importing further rows."""
+
+
+def text_stream(fileobj, encoding):
+    return io.TextIOWrapper(fileobj, encoding=encoding, errors='replace', newline='')
+
+
+def csv_rows(fileobj, delimiter=',', encoding='utf-8-sig'):
+    """
+    Yield ``(line_number, {column: value})`` for each non-blank row of a CSV
+    file opened in binary mode. Header names are stripped of whitespace.
+    """
+    text = text_stream(fileobj, encoding)
+    try:
+        reader = csv.reader(text, delimiter=delimiter)
+        try:
+            header = [name.strip() for name in next(reader)]
+        except StopIteration:
+            raise ImportFileError('The file is empty')
+        except csv.Error as exc:
+            raise ImportFileError(f'Could not read the header: {exc}')
+        yield 0, header
+        while True:
+            try:
+                values = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as exc:
+                raise ImportFileError(f'Line {reader.line_num}: {exc}')
+            if any(value.strip() for value in values):
+                yield reader.line_num, dict(zip(header, values))
+    finally:
+        # Leave closing the file to the caller
+        text.detach()
+
+
+def xlsx_rows(fileobj, sheet=None):
+    """
+    Yield the rows of a worksheet (the first one unless ``sheet`` names
+    another), with the first row as the header. The workbook is opened in
+    read-only mode, which streams the sheet instead of loading it.
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError('XLSX imports need the openpyxl package')
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as exc:
+        raise ImportFileError(f'Could not open the workbook: {exc}')
+    try:
+        if sheet:
+            if sheet not in workbook.sheetnames:
+                raise ImportFileError(f'No sheet named {sheet}')
+            worksheet = workbook[sheet]
+        else:
+            worksheet = workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ImportFileError('The sheet is empty')
+        header = ['' if name is None else str(name).strip() for name in header]
+        yield 0, header
+        for number, values in enumerate(rows, start=(worksheet.min_row or 1) + 1):
+            if any(value not in (None, '') for value in values):
+                yield number, {
+                    name: cell_value(value) for name, value in zip(header, values)
+                }
+    finally:
+        workbook.close()
+
+
+def cell_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def ofx_tokens(text):
+    """Yield ``(closing, tag, text)`` for each element of an OFX document, SGML (1.x) or XML (2.x)."""
+    token = re.compile(r'<(/?)([A-Za-z0-9.]+)[^>]*>([^<]*)')
+    buffer = ''
+    while True:
+        block = text.read(READ_SIZE)
+        buffer += block
+        # A token's text runs up to the next '<', so the last one is only
+        # complete at the end of the file
+        end = len(buffer) if not block else buffer.rfind('<')
+        if end > 0:
+            for match in token.finditer(buffer, 0, end):
+                yield match.group(1) == '/', match.group(2).upper(), html.unescape(match.group(3).strip())
+            buffer = buffer[end:]
+        if not block:
+            return
+
+
+def ofx_date(value):
+    # YYYYMMDD[HHMMSS[.XXX]][TZ]; the time and zone are irrelevant for a date
+    try:
+        return datetime.strptime(value[:8], '%Y%m%d').date()
+    except ValueError:
+        return value
+
+
+def ofx_rows(fileobj, encoding='utf-8-sig'):
+    """Yield the transactions (``STMTTRN``) of an OFX or QFX statement."""
+    text = text_stream(fileobj, encoding)
+    try:
+        yield 0, STATEMENT_COLUMNS
+        currency = account_number = ''
+        transaction = None
+        number = 0
+        seen_ofx = original_currency = False
+        for closing, tag, value in ofx_tokens(text):
+            if tag == 'OFX':
+                seen_ofx = True
+            elif tag == 'ORIGCURRENCY':
+                # Amounts were already converted from this currency
+                original_currency = not closing
+            elif tag == 'STMTTRN':
+                if closing and transaction is not None:
+                    number += 1
+                    yield number, {
+                        'date': ofx_date(transaction.get('DTPOSTED', '')),
+                        'amount': transaction.get('TRNAMT', '').replace(',', '.'),
+                        'description': transaction.get('NAME') or transaction.get('MEMO', ''),
+                        'currency': transaction.get('CURSYM') or currency,
+                        'reference': transaction.get('FITID', ''),
+                        'account_number': account_number,
+                    }
+                transaction = None if closing else {}
+            elif closing or not value:
+                continue
+            elif transaction is not None:
+                if tag != 'CURSYM' or not original_currency:
+                    transaction.setdefault(tag, value)
+            elif tag == 'CURDEF':
+                currency = value
+            elif tag == 'ACCTID':
+                account_number = value
+        if not seen_ofx:
+            raise ImportFileError('Not an OFX statement')
+    finally:
+        text.detach()
+
+
+MT940_FIELD = re.compile(r'^:(\d{2}[A-Z]?):')
+MT940_STATEMENT_LINE = re.compile(r'^(\d{6})(\d{4})?(R?[CD])[A-Z]?(\d+,\d*)')
+MT940_SUBFIELD = re.compile(r'\?(\d{2})')
+
+
+def mt940_fields(text):
+    """Yield ``(line_number, tag, value)`` for each field of an MT940 file; continuation lines are joined."""
+    tag = value = None
+    start = 0
+    for number, line in enumerate(text, start=1):
+        line = line.rstrip('\r\n')
+        match = MT940_FIELD.match(line)
+        if match or line.startswith('-'):
+            if tag:
+                yield start, tag, value
+            tag = value = None
+            if match:
+                tag, value, start = match.group(1), line[match.end():], number
+        elif tag:
+            value += '\n' + line
+    if tag:
+        yield start, tag, value
+
+
+def mt940_description(value):
+    # Structured :86: fields ("166?00SEPA?20text?21more?32name") carry the
+    # purpose in subfields 20-29 and the counterparty in 32-33
+    if not MT940_SUBFIELD.search(value):
+        return ' '.join(line.strip() for line in value.split('\n') if line.strip())
+    value = value.replace('\n', '')
+    parts = MT940_SUBFIELD.split(value)
+    subfields = dict(zip(parts[1::2], parts[2::2]))
+    purpose = ''.join(subfields.get(str(code), '') for code in range(20, 30))
+    name = ''.join(subfields.get(str(code), '') for code in (32, 33))
+    return ' '.join(part.strip() for part in (purpose, name) if part.strip())
+
+
+def mt940_rows(fileobj, encoding='utf-8-sig'):
+    """Yield the statement lines (``:61:``, described by ``:86:``) of an MT940 file."""
+    text = text_stream(fileobj, encoding)
+    try:
+        yield 0, STATEMENT_COLUMNS
+        currency = account_number = ''
+        pending = None
+        seen_statement = False
+        for number, tag, value in mt940_fields(text):
+            seen_statement = seen_statement or tag == '20'
+            if tag == '86' and pending is not None:
+                pending[1]['description'] = mt940_description(value)
+                continue
+            if pending is not None:
+                yield pending
+                pending = None
+            if tag == '25':
+                account_number = value.strip()
+            elif tag in ('60F', '60M'):
+                # [C|D]YYMMDD then the currency code
+                currency = value[7:10]
+            elif tag == '61':
+                pending = number, mt940_statement_line(value, currency, account_number)
+        if pending is not None:
+            yield pending
+        if not seen_statement:
+            raise ImportFileError('Not an MT940 statement')
+    finally:
+        text.detach()
+
+
+def mt940_statement_line(value, currency, account_number):
+    match = MT940_STATEMENT_LINE.match(value)
+    if match is None:
+        # Left for the row parser to report
+        return {'date': '', 'amount': '', 'description': '', 'currency': currency,
+                'reference': '', 'account_number': account_number}
+    value_date, _, mark, amount = match.groups()
+    try:
+        day = datetime.strptime(value_date, '%y%m%d').date()
+    except ValueError:
+        day = value_date
+    # Debits and reversed credits take money out
+    amount = amount.replace(',', '.').rstrip('.')
+    if mark in ('D', 'RC'):
+        amount = '-' + amount
+    # N plus a three-letter transaction code, then the customer reference
+    reference = value[match.end():].split('\n')[0].split('//')[0][4:].strip()
+    return {'date': day, 'amount': amount, 'description': '', 'currency': currency,
+            'reference': reference, 'account_number': account_number}
+
+
+# File type -> reader taking (fileobj, default_values)
+READERS = {
+    'CSV': lambda fileobj, options: csv_rows(
+        fileobj, delimiter=options.get('delimiter', ','), encoding=options.get('encoding', 'utf-8-sig')
+    ),
+    'XLSX': lambda fileobj, options: xlsx_rows(fileobj, sheet=options.get('sheet')),
+    'OFX': lambda fileobj, options: ofx_rows(fileobj, encoding=options.get('encoding', 'utf-8-sig')),
+    'QFX': lambda fileobj, options: ofx_rows(fileobj, encoding=options.get('encoding', 'utf-8-sig')),
+    'MT940': lambda fileobj, options: mt940_rows(fileobj, encoding=options.get('encoding', 'utf-8-sig')),
+}
+STATEMENT_TYPES = {'OFX', 'QFX', 'MT940'}
@@ -0,0 +1,158 @@
+"""
+Fair-share scheduling of import and export jobs.
+
+New jobs are not sent to the workers directly. ``schedule_jobs`` decides
+which pending jobs to hand out. It runs when a job is created, after a job
+ends and once a minute. Imports and exports are scheduled separately, each
+with at most ``JOB_MAX_RUNNING`` jobs handed out or running at once, and no
+more than ``JOB_USER_MAX_RUNNING`` of those for one user. Free slots go
+round-robin to the users with waiting jobs: the user with the fewest running
+jobs goes first, and ties go to whoever has waited longest. Each user's
+smallest job goes first (imports by file size, exports by estimated rows),
+so one user's ten large files cannot hold up anyone else's small ones.
+
+A job handed to a worker that has not started within
+``JOB_DISPATCH_TIMEOUT`` seconds (a lost message) is handed out again; the
+status check when a worker claims a job keeps it from running twice. A
+running job refreshes its row's ``updated_at`` whenever it flushes its
+progress. One whose row has not changed for ``JOB_STALE_TIMEOUT`` seconds
+lost its worker; it is marked failed so it stops holding a slot.
+"""
+import heapq
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Min, Q
+from django.utils import timezone
+
+from .models import ExportJob, ImportJob
+from .progress import JobProgress
+
+LOCK_KEY = 'files:scheduler-lock'
+RERUN_KEY = 'files:scheduler-rerun'
+LOCK_TIMEOUT = 60
+# Window for the wait-time metrics, in seconds
+METRICS_WINDOW = 60 * 60
+
+
+def job_kinds():
+    from .tasks import process_export_job, process_import_job
+
+    return {'imports': (ImportJob, process_import_job), 'exports': (ExportJob, process_export_job)}
+
+
+def running_jobs(model):
+    """Jobs handed to a worker or running."""
+    return model.objects.filter(Q(status='PROCESSING') | Q(status='PENDING', dispatched_at__isnull=False))
+
+
+def pick_jobs(model, limit=None, user_limit=None):
+    """The ids of the queued jobs to start now, in order."""
+    limit = limit or settings.JOB_MAX_RUNNING
+    user_limit = user_limit or settings.JOB_USER_MAX_RUNNING
+    running = Counter(running_jobs(model).values_list('user_id', flat=True))
+    free = limit - sum(running.values())
+    if free <= 0:
+        return []
+
+    queued = defaultdict(list)
+    rows = model.objects.filter(status='PENDING', dispatched_at__isnull=True).order_by('size', 'created_at')
+    for pk, user_id, created_at in rows.values_list('pk', 'user_id', 'created_at'):
+        queued[user_id].append((pk, created_at))
+    # (running jobs, oldest queued job, user)
+    users = [
+        (running[user_id], min(created_at for _, created_at in jobs), user_id)
+        for user_id, jobs in queued.items() if running[user_id] < user_limit
+    ]
+    heapq.heapify(users)
+
+    picked = []
+    while users and len(picked) < free:
+        count, _, user_id = heapq.heappop(users)
+        jobs = queued[user_id]
+        picked.append(jobs.pop(0)[0])
+        if jobs and count + 1 < user_limit:
+            heapq.heappush(users, (count + 1, min(created_at for _, created_at in jobs), user_id))
+    return picked
+
+
+def fail_stale_jobs(model, now=None):
+    """Fail running jobs whose worker stopped reporting progress; returns how many."""
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.JOB_STALE_TIMEOUT)
+    stale = model.objects.filter(status='PROCESSING', updated_at__lt=cutoff)
+    failed = 0
+    for pk, user_id in stale.values_list('pk', 'user_id'):
+        if stale.filter(pk=pk).update(
+            status='FAILED', error_message='The job stopped responding and was abandoned', updated_at=now
+        ):
+            JobProgress(model(pk=pk, user_id=user_id)).finish('FAILED')
+            failed += 1
+    return failed
+
+
+def dispatch_jobs(model, task):
+    """Hand out the jobs ``pick_jobs`` chooses; returns how many were sent."""
+    now = timezone.now()
+    fail_stale_jobs(model, now)
+    model.objects.filter(
+        status='PENDING', dispatched_at__lt=now - timedelta(seconds=settings.JOB_DISPATCH_TIMEOUT)
+    ).update(dispatched_at=None)
+    sent = 0
+    for pk in pick_jobs(model):
+        if model.objects.filter(pk=pk, status='PENDING', dispatched_at__isnull=True).update(dispatched_at=now):
+            task.delay(pk)
+            sent += 1
+    return sent
+
+
+def schedule_jobs():
+    """
+    Start the queued jobs there is room for and return how many were sent.
+    One run at a time; a call made during a run makes that run go again.
+    """
+    if not cache.add(LOCK_KEY, True, timeout=LOCK_TIMEOUT):
+        cache.set(RERUN_KEY, True, timeout=LOCK_TIMEOUT)
+        return 0
+    sent = 0
+    try:
+        while True:
+            cache.delete(RERUN_KEY)
+            for model, task in job_kinds().values():
+                sent += dispatch_jobs(model, task)
+            if not cache.get(RERUN_KEY):
+                return sent
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def queue_stats():
+    """Queue depth and wait times (in seconds) for imports and exports."""
+    now = timezone.now()
+    wait = ExpressionWrapper(F('started_at') - F('created_at'), output_field=DurationField())
+    stats = {}
+    for name, (model, _) in job_kinds().items():
+        queued = Q(status='PENDING', dispatched_at__isnull=True)
+        counts = model.objects.aggregate(
+            queued=Count('pk', filter=queued),
+            waiting_users=Count('user', filter=queued, distinct=True),
+            oldest=Min('created_at', filter=queued),
+            dispatched=Count('pk', filter=Q(status='PENDING', dispatched_at__isnull=False)),
+            running=Count('pk', filter=Q(status='PROCESSING')),
+        )
+        waits = model.objects.filter(started_at__gte=now - timedelta(seconds=METRICS_WINDOW)).aggregate(
+            started=Count('pk'), average=Avg(wait), longest=Max(wait)
+        )
+        stats[name] = {
+            'queued': counts['queued'],
+            'waiting_users': counts['waiting_users'],
+            'dispatched': counts['dispatched'],
+            'running': counts['running'],
+            'oldest_wait_seconds': (now - counts['oldest']).total_seconds() if counts['oldest'] else 0,
+            'started_last_hour': waits['started'],
+            'average_wait_seconds': waits['average'].total_seconds() if waits['average'] is not None else 0,
+            'longest_wait_seconds': waits['longest'].total_seconds() if waits['longest'] is not None else 0,
+        }
+    return stats
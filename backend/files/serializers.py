@@ -0,0 +1,174 @@
+import os
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import serializers
+
+from .exports import FILE_EXTENSIONS, validate_export
+from .imports import validate_mapping
+from .models import ExportJob, ImportJob, ImportTemplate, Upload
+
+# Upload extensions and the file type they are imported as
+IMPORT_FILE_TYPES = {
+    '.csv': 'CSV',
+    '.xlsx': 'XLSX',
+    '.ofx': 'OFX',
+    '.qfx': 'QFX',
+    '.mt940': 'MT940',
+    '.sta': 'MT940',
+}
+
+
+def file_type_of(name):
+    return IMPORT_FILE_TYPES.get(os.path.splitext(name)[1].lower())
+
+
+class ImportTemplateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportTemplate
+        fields = [
+            'id', 'name', 'description', 'file_type', 'column_mapping', 'default_values', 'is_default',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+    def validate(self, data):
+        column_mapping = data.get('column_mapping', getattr(self.instance, 'column_mapping', None))
+        default_values = data.get('default_values', getattr(self.instance, 'default_values', None))
+        file_type = data.get('file_type', getattr(self.instance, 'file_type', None))
+        try:
+            validate_mapping(column_mapping, default_values or {}, file_type)
+        except ValueError as exc:
+            raise serializers.ValidationError({'column_mapping': str(exc)})
+        return data
+
+    def create(self, validated_data):
+        validated_data['user'] = self.context['request'].user
+        return super().create(validated_data)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    file = serializers.FileField(write_only=True, required=False)
+    upload_id = serializers.PrimaryKeyRelatedField(
+        source='upload', queryset=Upload.objects.none(), write_only=True, required=False
+    )
+    template_id = serializers.PrimaryKeyRelatedField(
+        source='template', queryset=ImportTemplate.objects.none(), required=False, allow_null=True
+    )
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'file', 'upload_id', 'file_name', 'file_type', 'status', 'template_id', 'column_mapping', 'default_values',
+            'total_records', 'processed_records', 'successful_records', 'failed_records', 'duplicate_records',
+            'categorized_records', 'error_message', 'errors', 'created_at', 'updated_at'
+        ]
+        read_only_fields = [
+            'id', 'file_name', 'file_type', 'status', 'total_records', 'processed_records',
+            'successful_records', 'failed_records', 'duplicate_records', 'categorized_records', 'error_message',
+            'errors', 'created_at', 'updated_at'
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is not None and request.user.is_authenticated:
+            self.fields['template_id'].queryset = ImportTemplate.objects.filter(user=request.user)
+            self.fields['upload_id'].queryset = Upload.objects.filter(user=request.user, status='COMPLETED')
+
+    def validate(self, data):
+        if ('file' in data) == ('upload' in data):
+            raise serializers.ValidationError({'file': 'Send either a file or the id of a completed upload'})
+        name = data['file'].name if 'file' in data else data['upload'].file_name
+        file_type = file_type_of(name)
+        if file_type is None:
+            raise serializers.ValidationError({'file': (
+                f'Unsupported file type; expected one of {", ".join(sorted(IMPORT_FILE_TYPES))}'
+            )})
+        job = ImportJob(
+            template=data.get('template'),
+            column_mapping=data.get('column_mapping'),
+            default_values=data.get('default_values'),
+        )
+        try:
+            validate_mapping(*job.mapping, file_type)
+        except ValueError as exc:
+            raise serializers.ValidationError({'column_mapping': str(exc)})
+        return data
+
+    def create(self, validated_data):
+        upload = validated_data.pop('upload', None)
+        if upload is not None:
+            # The job reads the stored upload in place
+            validated_data['file'] = upload.file.name
+            validated_data['file_name'] = upload.file_name
+            validated_data['size'] = upload.size
+        else:
+            validated_data['file_name'] = os.path.basename(validated_data['file'].name)[:255]
+            validated_data['size'] = validated_data['file'].size
+        validated_data['user'] = self.context['request'].user
+        validated_data['file_type'] = file_type_of(validated_data['file_name'])
+        return super().create(validated_data)
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = [
+            'id', 'file_name', 'format', 'status', 'filters', 'date_range', 'total_records', 'error_message',
+            'download_url', 'created_at', 'updated_at'
+        ]
+        read_only_fields = [
+            'id', 'file_name', 'status', 'total_records', 'error_message', 'download_url', 'created_at', 'updated_at'
+        ]
+
+    def get_download_url(self, obj):
+        if obj.status != 'COMPLETED' or not obj.file:
+            return None
+        url = reverse('export-job-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def validate(self, data):
+        try:
+            validate_export(data.get('filters') or {}, data.get('date_range') or {})
+        except ValueError as exc:
+            raise serializers.ValidationError({'filters': str(exc)})
+        return data
+
+    def create(self, validated_data):
+        validated_data['user'] = self.context['request'].user
+        extension = FILE_EXTENSIONS[validated_data['format']]
+        validated_data['file_name'] = f'transactions-{timezone.localtime():%Y%m%d-%H%M%S}.{extension}'
+        return super().create(validated_data)
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    block_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Upload
+        fields = [
+            'id', 'file_name', 'size', 'received', 'block_size', 'content_hash', 'status', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'received', 'block_size', 'status', 'created_at', 'updated_at']
+        extra_kwargs = {'content_hash': {'required': False}}
+
+    def get_block_size(self, obj):
+        return settings.UPLOAD_BLOCK_SIZE
+
+    def validate_file_name(self, value):
+        return os.path.basename(value)
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'Uploads must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes')
+        return value
+
+    def validate_content_hash(self, value):
+        if value and (len(value) != 64 or any(char not in '0123456789abcdef' for char in value)):
+            raise serializers.ValidationError('Expected a lowercase hex SHA-256 block hash')
+        return value
@@ -0,0 +1,37 @@
+from celery import shared_task
+
+from .exports import run_export_job
+from .imports import run_import_job
+from .scheduling import schedule_jobs as schedule_queued_jobs
+from .uploads import expire_uploads as expire_stale_uploads
+
+
+@shared_task
+def process_import_job(job_id, chunk_size=None, workers=None):
+    """Import a pending ``ImportJob``'s file; returns False if the job was not pending."""
+    try:
+        return run_import_job(job_id, chunk_size=chunk_size, workers=workers)
+    finally:
+        # The job's slot is free
+        schedule_jobs.delay()
+
+
+@shared_task
+def process_export_job(job_id):
+    """Render a pending ``ExportJob``'s file; returns False if the job was not pending."""
+    try:
+        return run_export_job(job_id)
+    finally:
+        schedule_jobs.delay()
+
+
+@shared_task
+def schedule_jobs():
+    """Hand queued import and export jobs to the workers, fairly across users; returns how many were sent."""
+    return schedule_queued_jobs()
+
+
+@shared_task
+def expire_uploads():
+    """Delete chunked uploads left unfinished for ``UPLOAD_EXPIRY_HOURS``; returns the count."""
+    return expire_stale_uploads()
@@ -1,3 +1,1229 @@
-from django.test import TestCase
+import csv
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from accounts.models import Account, BalanceCheckpoint, Currency, ExchangeRate
+from transactions.fingerprints import fingerprint
+from transactions.models import (
+    CategorizationRule, Category, DailyTransactionSummary, DescriptionSuggestion, Tag, Transaction,
+)
+
+from .backups import BackupError, restore_backup, write_backup
+from .exports import run_export_job
+from .imports import run_import_job
+from .parallel import Segment, parse_segment, split_rows
+from .readers import ImportFileError, csv_rows, mt940_rows, ofx_rows, xlsx_rows
+from .models import ExportJob, ImportJob, ImportTemplate, Upload
+from .progress import JobProgress, read_progress
+from .scheduling import fail_stale_jobs, pick_jobs, schedule_jobs
+from .uploads import UploadConflict, content_hash, expire_uploads, write_chunk
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+User = get_user_model()
+
+
+class ImportTestMixin:
+    """Shared fixtures for import tests; uploads go to a temporary media root"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='test@example.com',
+            password='TestPass123!'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        self.euro = Currency.objects.create(code='EUR', name='Euro', symbol='€')
+        self.user.base_currency = self.currency
+        self.user.save()
+        self.account = Account.objects.create(
+            user=self.user, name='Checking', type='BANK', currency=self.currency,
+            initial_balance=Decimal('0.00'), current_balance=Decimal('0.00'), base_currency_balance=Decimal('0.00'),
+        )
+        self.category = Category.objects.create(user=self.user, name='Food', type='EXPENSE')
+        self.list_url = reverse('import-job-list')
+
+    def create_job(self, content, column_mapping=None, default_values=None, template=None):
+        job = ImportJob(
+            user=self.user, file_name='statement.csv', file_type='CSV', template=template,
+            column_mapping=column_mapping, default_values=default_values,
+        )
+        job.file.save('statement.csv', ContentFile(content.encode()), save=False)
+        job.save()
+        return job
+
+
+class ImportUploadTests(ImportTestMixin, TestCase):
+    """Tests for the import upload endpoint"""
+
+    def upload(self, content, name='statement.csv', **data):
+        data['file'] = SimpleUploadedFile(name, content.encode(), content_type='text/csv')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.list_url, data, format='multipart')
+
+    def test_upload_imports_rows_in_background(self):
+        """Test uploading a CSV creates a job that imports its rows"""
+        response = self.upload(
+            'Date,Description,Amount,Category\n'
+            '2024-01-05,Salary,1000.00,\n'
+            '2024-01-06,Lunch,-12.50,Food\n',
+            column_mapping='{"date": "Date", "description": "Description", "amount": "Amount", '
+                           '"category": "Category"}',
+            default_values='{"account": "Checking"}',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        job = ImportJob.objects.get(id=response.data['id'])
+        self.assertEqual(job.status, 'COMPLETED')
+        self.assertEqual(job.file_name, 'statement.csv')
+        self.assertEqual(
+            (job.total_records, job.processed_records, job.successful_records, job.failed_records), (2, 2, 2, 0)
+        )
+        salary = Transaction.objects.get(description='Salary')
+        self.assertEqual((salary.type, salary.amount, salary.account_id), ('INCOME', Decimal('1000.00'), self.account.id))
+        lunch = Transaction.objects.get(description='Lunch')
+        self.assertEqual((lunch.type, lunch.amount, lunch.category_id), ('EXPENSE', Decimal('12.50'), self.category.id))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.current_balance, Decimal('987.50'))
+
+    def test_upload_rejects_unsupported_file_type(self):
+        """Test uploading a file with an unsupported extension"""
+        response = self.upload('x', name='statement.pdf', column_mapping='{"date": "Date", "amount": "Amount"}',
+                               default_values='{"account": "Checking"}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('file', response.data)
+
+    def test_upload_requires_usable_mapping(self):
+        """Test uploading without a date column mapping"""
+        response = self.upload('Amount\n1\n', column_mapping='{"amount": "Amount"}',
+                               default_values='{"account": "Checking"}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('column_mapping', response.data)
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_upload_rejects_other_users_template(self):
+        """Test uploading with another user's template"""
+        other = User.objects.create_user(email='other@example.com', username='other@example.com', password='x')
+        template = ImportTemplate.objects.create(
+            user=other, name='Bank', file_type='CSV',
+            column_mapping={'date': 'Date', 'amount': 'Amount'}, default_values={'account': 'Checking'},
+        )
+        response = self.upload('Date,Amount\n', template_id=template.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('template_id', response.data)
+
+    def test_list_only_own_jobs(self):
+        """Test listing import jobs only returns the user's own jobs"""
+        other = User.objects.create_user(email='other@example.com', username='other@example.com', password='x')
+        self.create_job('Date,Amount\n')
+        ImportJob.objects.create(user=other, file_name='theirs.csv', file_type='CSV')
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([job['file_name'] for job in response.data['results']], ['statement.csv'])
+
+
+class ImportProcessingTests(ImportTestMixin, TestCase):
+    """Tests for the streaming importer"""
+
+    MAPPING = {'date': 'Date', 'description': 'Description', 'amount': 'Amount', 'category': 'Category'}
+
+    def test_template_mapping_and_defaults(self):
+        """Test a template's mapping, defaults and parse options, with job values on top"""
+        savings = Account.objects.create(
+            user=self.user, name='Savings', type='SAVINGS', currency=self.currency,
+            initial_balance=Decimal('0.00'), current_balance=Decimal('0.00'), base_currency_balance=Decimal('0.00'),
+        )
+        template = ImportTemplate.objects.create(
+            user=self.user, name='EU bank', file_type='CSV',
+            column_mapping={'date': 'Datum', 'description': 'Text', 'debit': 'Soll', 'credit': 'Haben'},
+            default_values={'account': 'checking', 'delimiter': ';', 'date_format': '%d.%m.%Y',
+                            'decimal_separator': ','},
+        )
+        job = self.create_job(
+            'Datum;Text;Soll;Haben\n'
+            '31.01.2024;Miete;1.200,00;\n'
+            '01.02.2024;Gehalt;;2.500,50\n',
+            default_values={'account': str(savings.id)}, template=template,
+        )
+        self.assertTrue(run_import_job(job.id))
+        rent = Transaction.objects.get(description='Miete')
+        self.assertEqual((rent.date, rent.type, rent.amount, rent.account_id),
+                         (date(2024, 1, 31), 'EXPENSE', Decimal('1200.00'), savings.id))
+        pay = Transaction.objects.get(description='Gehalt')
+        self.assertEqual((pay.type, pay.amount), ('INCOME', Decimal('2500.50')))
+
+    def test_row_errors_are_recorded_and_valid_rows_imported(self):
+        """Test invalid rows are counted and reported while the rest are imported"""
+        job = self.create_job(
+            'Date,Description,Amount,Category\n'
+            '2024-01-05,Good,10.00,Food\n'
+            'yesterday,Bad date,10.00,\n'
+            '2024-01-06,Bad category,10.00,Travel\n'
+            '2024-01-07,Bad amount,ten,\n',
+            column_mapping=self.MAPPING, default_values={'account': 'Checking'},
+        )
+        run_import_job(job.id, chunk_size=2)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'COMPLETED')
+        self.assertEqual(
+            (job.total_records, job.processed_records, job.successful_records, job.failed_records), (4, 4, 1, 3)
+        )
+        self.assertEqual([error['row'] for error in job.errors], [3, 4, 5])
+        self.assertIn('date', job.errors[0]['errors'])
+        self.assertEqual(job.errors[1]['errors'], {'category': 'Category not found: Travel'})
+        self.assertIn('amount', job.errors[2]['errors'])
+        self.assertEqual(list(Transaction.objects.values_list('description', flat=True)), ['Good'])
+
+    def test_missing_column_fails_job(self):
+        """Test a file without a mapped column fails the job"""
+        job = self.create_job('Date,Amount\n2024-01-05,1\n', column_mapping=self.MAPPING,
+                              default_values={'account': 'Checking'})
+        run_import_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertEqual(job.error_message, 'Missing columns: Category, Description')
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_job_is_only_processed_once(self):
+        """Test a job that is not pending is not imported again"""
+        job = self.create_job('Date,Description,Amount,Category\n2024-01-05,Lunch,-5,\n',
+                              column_mapping=self.MAPPING, default_values={'account': 'Checking'})
+        self.assertTrue(run_import_job(job.id))
+        self.assertFalse(run_import_job(job.id))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_foreign_currency_rows_are_converted(self):
+        """Test rows in another currency are converted at their date's rate"""
+        ExchangeRate.objects.create(user=self.user, from_currency=self.euro, to_currency=self.currency,
+                                    rate=Decimal('1.1'), date=date(2024, 1, 1))
+        job = self.create_job('Date,Description,Amount,Category\n2024-01-05,Hotel,-100,\n',
+                              column_mapping=self.MAPPING, default_values={'account': 'Checking', 'currency': 'eur'})
+        run_import_job(job.id)
+        hotel = Transaction.objects.get()
+        self.assertEqual(hotel.currency_id, self.euro.id)
+        self.assertEqual((hotel.exchange_rate, hotel.base_currency_amount), (Decimal('1.1'), Decimal('110.00')))
+
+    def test_reference_lookups_do_not_scale_with_rows(self):
+        """Test a chunk resolves its references with one query per model"""
+        for i in range(40):
+            Category.objects.create(user=self.user, name=f'Category {i}', type='EXPENSE')
+
+        def run(count):
+            # Distinct descriptions per run, so no row is a duplicate of an earlier run's
+            content = 'Date,Description,Amount,Category\n' + ''.join(
+                f'2024-01-{i % 28 + 1:02d},Run {count} row {i},-{i + 1},Category {i}\n' for i in range(count)
+            )
+            job = self.create_job(content, column_mapping=self.MAPPING, default_values={'account': 'Checking'})
+            with CaptureQueriesContext(connection) as ctx:
+                run_import_job(job.id, chunk_size=100)
+            job.refresh_from_db()
+            self.assertEqual(job.successful_records, count)
+            # Derived data is written per group of rows; only count the lookups
+            tables = ('FROM "accounts_account"', 'FROM "accounts_currency"', 'FROM "transactions_category"')
+            return sum(1 for query in ctx.captured_queries if any(table in query['sql'] for table in tables))
+
+        self.assertEqual(run(5), run(40))
+
+    def test_csv_rows_streams_quoted_rows(self):
+        """Test the reader yields the header, then rows with their line numbers"""
+        rows = list(csv_rows(BytesIO(b'\xef\xbb\xbfDate , Note\n2024-01-01,"two\nlines"\n\n2024-01-02,x\n')))
+        self.assertEqual(rows, [
+            (0, ['Date', 'Note']),
+            (3, {'Date': '2024-01-01', 'Note': 'two\nlines'}),
+            (5, {'Date': '2024-01-02', 'Note': 'x'}),
+        ])
+
+
+class ImportDeduplicationTests(ImportTestMixin, TestCase):
+    """Tests for skipping, marking and merging rows that were imported before"""
+
+    MAPPING = {'date': 'Date', 'description': 'Description', 'amount': 'Amount', 'category': 'Category',
+               'external_id': 'Id'}
+    FIRST = (
+        'Date,Description,Amount,Category,Id\n'
+        '2024-01-05,Coffee,-3.00,,\n'
+        '2024-01-05,Coffee,-3.00,,\n'
+        '2024-01-06,Rent,-900.00,,R1\n'
+    )
+    # Overlaps the first file: both coffees, and rent with its id and a category
+    SECOND = (
+        'Date,Description,Amount,Category,Id\n'
+        '2024-01-05,COFFEE,-3.00,,\n'
+        '2024-01-05,coffee.,-3.00,,\n'
+        '2024-01-05,Coffee,-3.00,,\n'
+        '2024-01-06,Rent payment,-900.00,Food,R1\n'
+        '2024-01-07,Lunch,-12.00,,\n'
+    )
+
+    def run_file(self, content, duplicates=None):
+        default_values = {'account': 'Checking'}
+        if duplicates:
+            default_values['duplicates'] = duplicates
+        job = self.create_job(content, column_mapping=self.MAPPING, default_values=default_values)
+        run_import_job(job.id)
+        job.refresh_from_db()
+        return job
+
+    def test_skip_duplicates(self):
+        """Test rows already imported are skipped, while repeated rows beyond the stored ones are kept"""
+        self.run_file(self.FIRST)
+        job = self.run_file(self.SECOND)
+        self.assertEqual((job.successful_records, job.duplicate_records, job.failed_records), (2, 3, 0))
+        self.assertEqual(Transaction.objects.filter(date=date(2024, 1, 5)).count(), 3)
+        self.assertEqual(Transaction.objects.filter(external_id='R1').count(), 1)
+        self.assertTrue(Transaction.objects.filter(description='Lunch').exists())
+
+    def test_repeated_rows_in_one_file_are_not_duplicates(self):
+        """Test identical rows within one import are all imported"""
+        job = self.run_file(self.FIRST)
+        self.assertEqual((job.successful_records, job.duplicate_records), (3, 0))
+
+    def test_mark_duplicates(self):
+        """Test marked duplicates are imported and linked to the transaction they match"""
+        self.run_file(self.FIRST)
+        rent = Transaction.objects.get(external_id='R1')
+        job = self.run_file(self.SECOND, duplicates='mark')
+        self.assertEqual((job.successful_records, job.duplicate_records), (5, 3))
+        marked = Transaction.objects.filter(import_job=job, duplicate_of__isnull=False)
+        self.assertEqual(marked.count(), 3)
+        self.assertEqual(marked.get(description='Rent payment').duplicate_of, rent)
+
+    def test_merge_duplicates(self):
+        """Test merging fills in the matched transaction's missing statement id and category"""
+        coffee = Transaction.objects.create(
+            user=self.user, account=self.account, type='EXPENSE', amount=Decimal('3.00'),
+            currency=self.currency, base_currency_amount=Decimal('3.00'), description='Coffee',
+            date=date(2024, 1, 5),
+        )
+        job = self.run_file(
+            'Date,Description,Amount,Category,Id\n2024-01-05,Coffee,-3.00,Food,C1\n', duplicates='merge'
+        )
+        self.assertEqual((job.successful_records, job.duplicate_records), (0, 1))
+        coffee.refresh_from_db()
+        self.assertEqual((coffee.external_id, coffee.category_id), ('C1', self.category.id))
+
+    def test_merge_by_statement_id(self):
+        """Test a row matching by statement id is merged into the stored transaction"""
+        self.run_file(self.FIRST)
+        job = self.run_file(self.SECOND, duplicates='merge')
+        self.assertEqual(job.duplicate_records, 3)
+        rent = Transaction.objects.get(external_id='R1')
+        self.assertEqual((rent.description, rent.category_id), ('Rent', self.category.id))
+        self.assertEqual(
+            DailyTransactionSummary.objects.get(category=self.category, date=date(2024, 1, 6)).total,
+            Decimal('900.00')
+        )
+
+    def test_duplicate_lookup_is_one_query_per_chunk(self):
+        """Test a chunk is checked for duplicates with a single query"""
+        self.run_file(self.FIRST)
+        job = self.create_job(self.SECOND, column_mapping=self.MAPPING, default_values={'account': 'Checking'})
+        with CaptureQueriesContext(connection) as ctx:
+            run_import_job(job.id)
+        lookups = [q for q in ctx.captured_queries if 'fingerprint' in q['sql'] and q['sql'].startswith('SELECT')]
+        self.assertEqual(len(lookups), 1)
+
+
+class ImportCategorizationTests(ImportTestMixin, TestCase):
+    """Tests for categorizing imported rows that have no category"""
+
+    MAPPING = {'date': 'Date', 'description': 'Description', 'amount': 'Amount', 'category': 'Category'}
+    CONTENT = (
+        'Date,Description,Amount,Category\n'
+        '2024-02-01,STARBUCKS 0042,-4.00,\n'
+        '2024-02-02,Shell fuel 17,-40.00,\n'
+        '2024-02-03,Shell fuel 18,-45.00,Food\n'
+        '2024-02-04,Unknown shop,-9.00,\n'
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.transport = Category.objects.create(user=self.user, name='Transport', type='EXPENSE')
+        self.car = Tag.objects.create(user=self.user, name='Car')
+        for day in (1, 2):
+            Transaction.objects.create(
+                user=self.user, account=self.account, type='EXPENSE', amount=Decimal('4.00'),
+                currency=self.currency, base_currency_amount=Decimal('4.00'), description='Starbucks Seattle',
+                date=date(2024, 1, day), category=self.category,
+            )
+        rule = CategorizationRule.objects.create(
+            user=self.user, name='Fuel', match_type='STARTS_WITH', pattern='shell', category=self.transport
+        )
+        rule.tags.add(self.car)
+
+    def run_file(self, **options):
+        job = self.create_job(
+            self.CONTENT, column_mapping=self.MAPPING, default_values={'account': 'Checking', **options}
+        )
+        run_import_job(job.id)
+        job.refresh_from_db()
+        return job
+
+    def test_uncategorized_rows_are_categorized(self):
+        """Test rules and history fill in missing categories, and rule tags are attached"""
+        job = self.run_file()
+        self.assertEqual((job.successful_records, job.categorized_records), (4, 2))
+        imported = {t.description: t for t in Transaction.objects.filter(import_job=job).prefetch_related('tags')}
+        self.assertEqual(imported['STARBUCKS 0042'].category, self.category)
+        self.assertEqual(imported['Shell fuel 17'].category, self.transport)
+        # The file's own category is kept; the rule still tags the row
+        self.assertEqual(imported['Shell fuel 18'].category, self.category)
+        self.assertEqual([tag.name for tag in imported['Shell fuel 18'].tags.all()], ['Car'])
+        self.assertIsNone(imported['Unknown shop'].category)
+        self.assertEqual(
+            DailyTransactionSummary.objects.get(category=self.transport, date=date(2024, 2, 2)).total,
+            Decimal('40.00')
+        )
+
+    def test_categorization_can_be_turned_off(self):
+        """Test the categorize option disables suggestions"""
+        job = self.run_file(categorize=False)
+        self.assertEqual(job.categorized_records, 0)
+        self.assertFalse(Transaction.objects.filter(import_job=job, category=self.transport).exists())
+        self.assertFalse(Transaction.tags.through.objects.exists())
+
+
+class ParallelImportTests(ImportTestMixin, TestCase):
+    """Tests for parsing imports in worker processes"""
+
+    MAPPING = ImportProcessingTests.MAPPING
+    CONTENT = (
+        'Date,Description,Amount,Category\n'
+        + ''.join(f'2024-01-{i % 28 + 1:02d},Row {i},-{i + 1},Food\n' for i in range(20))
+        + '2024-02-01,"Split\nacross lines",-5,Food\n'
+        + 'someday,Bad date,-5,\n'
+        + ''.join(f'2024-03-{i % 28 + 1:02d},Tail {i},{i + 1},\n' for i in range(20))
+    )
+
+    def test_split_rows_ends_segments_outside_quotes(self):
+        """Test segments end on row boundaries and never inside a quoted field"""
+        data = b'h\n1,a\n2,"b\nc\nd"\n3,e\n'
+        segments = list(split_rows(data, 2, 6))
+        self.assertEqual(b''.join(data[s.start:s.end] for s in segments), data[2:])
+        self.assertEqual([data[s.start:s.end] for s in segments], [b'1,a\n2,"b\nc\nd"\n', b'3,e\n'])
+        self.assertEqual([s.first_line for s in segments], [2, 6])
+
+    def test_unreadable_line_fails_only_that_row(self):
+        """Test a line the CSV reader rejects is a row error and the rest of its segment is kept"""
+        job = self.create_job(self.CONTENT, column_mapping=self.MAPPING, default_values={'account': 'Checking'})
+        header = ['Date', 'Description', 'Amount', 'Category']
+        limit = csv.field_size_limit(12)
+        try:
+            result = parse_segment(job.file.path, Segment(33, len(self.CONTENT), 2), header, *job.mapping)
+        finally:
+            csv.field_size_limit(limit)
+        lines = [(line, record is not None) for line, record, _ in result.items]
+        self.assertEqual(lines[:3], [(2, True), (3, True), (4, True)])
+        self.assertEqual(len(lines), 42)
+        self.assertEqual(result.items[20], (23, None, {'file': 'field larger than field limit (12)'}))
+
+    @override_settings(IMPORT_PARALLEL_MIN_SIZE=0, IMPORT_SEGMENT_SIZE=64)
+    def test_parallel_import_matches_sequential(self):
+        """Test a parallel import writes the same rows and errors as a sequential one"""
+        sequential = self.create_job(self.CONTENT, column_mapping=self.MAPPING, default_values={'account': 'Checking'})
+        run_import_job(sequential.id, workers=1)
+        expected = list(Transaction.objects.order_by('description').values_list(
+            'date', 'description', 'type', 'amount'))
+        Transaction.objects.all().delete()
+
+        parallel = self.create_job(self.CONTENT, column_mapping=self.MAPPING, default_values={'account': 'Checking'})
+        run_import_job(parallel.id, chunk_size=7, workers=2)
+        parallel.refresh_from_db()
+        sequential.refresh_from_db()
+        self.assertEqual(parallel.status, 'COMPLETED')
+        self.assertEqual(
+            (parallel.processed_records, parallel.successful_records, parallel.failed_records), (42, 41, 1)
+        )
+        self.assertEqual(parallel.errors, sequential.errors)
+        self.assertEqual(parallel.errors[0]['row'], 24)
+        self.assertEqual(list(Transaction.objects.order_by('description').values_list(
+            'date', 'description', 'type', 'amount')), expected)
+
+
+OFX_SGML = b"""OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+CHARSET:1252
+
+<OFX>
+<BANKMSGSRSV1><STMTTRNRS><STMTRS>
+<CURDEF>USD
+<BANKACCTFROM><BANKID>123<ACCTID>000111<ACCTTYPE>CHECKING</BANKACCTFROM>
+<BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20240105120000[-5:EST]
+<TRNAMT>-42.10
+<FITID>A1
+<NAME>Corner Store &amp; Deli
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>CREDIT
+<DTPOSTED>20240106
+<TRNAMT>1500.00
+<FITID>A2
+<MEMO>Payroll
+<CURRENCY><CURRATE>1.1<CURSYM>EUR</CURRENCY>
+</STMTTRN>
+</BANKTRANLIST>
+</STMTRS></STMTTRNRS></BANKMSGSRSV1>
+</OFX>
+"""
+
+OFX_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<?OFX OFXHEADER="200" VERSION="220"?>
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><CURDEF>USD</CURDEF>
+<BANKTRANLIST><STMTTRN><TRNTYPE>POS</TRNTYPE><DTPOSTED>20240107</DTPOSTED><TRNAMT>-9.99</TRNAMT>
+<FITID>B1</FITID><NAME>Books</NAME><ORIGCURRENCY><CURRATE>0.9</CURRATE><CURSYM>GBP</CURSYM></ORIGCURRENCY>
+</STMTTRN></BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+MT940 = """:20:STARTUMSE
+:25:10020030/1234567
+:28C:00001/001
+:60F:C240101EUR1000,00
+:61:2401050105D12,50NTRFNONREF//8327000090031789
+:86:166?00SEPA-UEBERWEISUNG?20Rent Januar?21y 2024?32LANDLORD GMBH
+:61:240106C250,NTRF12345
+:86:Salary
+ January
+:62F:C240106EUR1237,50
+-
+""".encode()
+
+
+class ImportReaderTests(TestCase):
+    """Tests for the streaming file readers"""
+
+    def test_ofx_sgml(self):
+        """Test reading an OFX 1.x statement with unclosed leaf elements"""
+        rows = list(ofx_rows(BytesIO(OFX_SGML)))
+        self.assertEqual(rows[0], (0, ['date', 'amount', 'description', 'currency', 'reference', 'account_number']))
+        self.assertEqual(rows[1:], [
+            (1, {'date': date(2024, 1, 5), 'amount': '-42.10', 'description': 'Corner Store & Deli',
+                 'currency': 'USD', 'reference': 'A1', 'account_number': '000111'}),
+            (2, {'date': date(2024, 1, 6), 'amount': '1500.00', 'description': 'Payroll',
+                 'currency': 'EUR', 'reference': 'A2', 'account_number': '000111'}),
+        ])
+
+    def test_ofx_xml_keeps_statement_currency_for_converted_amounts(self):
+        """Test an OFX 2.x transaction with ORIGCURRENCY stays in the statement currency"""
+        rows = list(ofx_rows(BytesIO(OFX_XML)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual((rows[1][1]['description'], rows[1][1]['currency']), ('Books', 'USD'))
+
+    def test_ofx_rejects_other_files(self):
+        """Test a file that is not OFX fails"""
+        with self.assertRaises(ImportFileError):
+            list(ofx_rows(BytesIO(b'Date,Amount\n')))
+
+    def test_mt940(self):
+        """Test reading MT940 statement lines with their structured and free-text descriptions"""
+        rows = list(mt940_rows(BytesIO(MT940)))
+        self.assertEqual(rows[1:], [
+            (5, {'date': date(2024, 1, 5), 'amount': '-12.50', 'description': 'Rent January 2024 LANDLORD GMBH',
+                 'currency': 'EUR', 'reference': 'NONREF', 'account_number': '10020030/1234567'}),
+            (7, {'date': date(2024, 1, 6), 'amount': '250', 'description': 'Salary January',
+                 'currency': 'EUR', 'reference': '12345', 'account_number': '10020030/1234567'}),
+        ])
+
+    @skipUnless(openpyxl, 'openpyxl is not installed')
+    def test_xlsx(self):
+        """Test reading a worksheet keeps cell types and skips blank rows"""
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['Date ', 'Amount', 'Description'])
+        sheet.append([date(2024, 1, 5), -12.5, 'Lunch'])
+        sheet.append([None, None, None])
+        sheet.append([date(2024, 1, 6), 100, None])
+        content = BytesIO()
+        workbook.save(content)
+        content.seek(0)
+        self.assertEqual(list(xlsx_rows(content)), [
+            (0, ['Date', 'Amount', 'Description']),
+            (2, {'Date': date(2024, 1, 5), 'Amount': -12.5, 'Description': 'Lunch'}),
+            (4, {'Date': date(2024, 1, 6), 'Amount': 100, 'Description': ''}),
+        ])
+
+
+class StatementImportTests(ImportTestMixin, TestCase):
+    """Tests for importing spreadsheets and bank statements"""
+
+    def create_file_job(self, name, content, file_type, **kwargs):
+        job = ImportJob(user=self.user, file_name=name, file_type=file_type, **kwargs)
+        job.file.save(name, ContentFile(content), save=False)
+        job.save()
+        return job
+
+    def test_ofx_import(self):
+        """Test an OFX statement is imported into the default account with the statement mapping"""
+        ExchangeRate.objects.create(user=self.user, from_currency=self.euro, to_currency=self.currency,
+                                    rate=Decimal('1.1'), date=date(2024, 1, 1))
+        job = self.create_file_job('statement.ofx', OFX_SGML, 'OFX', default_values={'account': 'Checking'})
+        run_import_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.successful_records), ('COMPLETED', 2))
+        store = Transaction.objects.get(description='Corner Store & Deli')
+        self.assertEqual((store.type, store.amount, store.currency_id), ('EXPENSE', Decimal('42.10'), self.currency.id))
+        payroll = Transaction.objects.get(description='Payroll')
+        self.assertEqual((payroll.type, payroll.currency_id, payroll.base_currency_amount),
+                         ('INCOME', self.euro.id, Decimal('1650.00')))
+
+    def test_mt940_import(self):
+        """Test an MT940 statement is imported"""
+        euro_account = Account.objects.create(
+            user=self.user, name='Euro', type='BANK', currency=self.euro,
+            initial_balance=Decimal('0.00'), current_balance=Decimal('0.00'), base_currency_balance=Decimal('0.00'),
+        )
+        job = self.create_file_job('statement.sta', MT940, 'MT940', default_values={'account': 'Euro'})
+        run_import_job(job.id)
+        euro_account.refresh_from_db()
+        self.assertEqual(euro_account.current_balance, Decimal('237.50'))
+
+    @skipUnless(openpyxl, 'openpyxl is not installed')
+    def test_xlsx_import(self):
+        """Test a spreadsheet is imported with typed date and amount cells"""
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['When', 'What', 'How much'])
+        workbook.active.append([date(2024, 1, 5), 'Lunch', -12.5])
+        content = BytesIO()
+        workbook.save(content)
+        job = self.create_file_job(
+            'statement.xlsx', content.getvalue(), 'XLSX',
+            column_mapping={'date': 'When', 'description': 'What', 'amount': 'How much'},
+            default_values={'account': 'Checking', 'date_format': '%d/%m/%Y'},
+        )
+        run_import_job(job.id)
+        lunch = Transaction.objects.get()
+        self.assertEqual((lunch.date, lunch.type, lunch.amount), (date(2024, 1, 5), 'EXPENSE', Decimal('12.50')))
+
+    def test_upload_statement(self):
+        """Test uploading an OFX file needs no column mapping"""
+        upload = SimpleUploadedFile('statement.qfx', OFX_SGML, content_type='application/x-ofx')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.list_url, {'file': upload, 'default_values': '{"account": "Checking"}'},
+                                        format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['file_type'], 'QFX')
+        self.assertEqual(Transaction.objects.count(), 2)
+
+
+class ExportJobTests(ImportTestMixin, TestCase):
+    """Tests for background XLSX/PDF exports and reuse of their files"""
+
+    def setUp(self):
+        super().setUp()
+        self.export_url = reverse('export-job-list')
+        for day, description, amount in ((5, 'Lunch', '12.50'), (20, 'Dinner', '30.00'), (40, 'Rent', '900.00')):
+            Transaction.objects.create(
+                user=self.user, account=self.account, type='EXPENSE', amount=Decimal(amount),
+                currency=self.currency, base_currency_amount=Decimal(amount), description=description,
+                date=date(2024, 1, 1) + timedelta(days=day - 1), category=self.category,
+            )
+        self.january = {'start_date': '2024-01-01', 'end_date': '2024-01-31'}
+
+    def request_export(self, export_format, filters=None, date_range=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.export_url, {
+                'format': export_format, 'filters': filters or {}, 'date_range': date_range or {},
+            }, format='json')
+
+    def download(self, job_id):
+        response = self.client.get(reverse('export-job-download', args=[job_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content)
+
+    @skipUnless(openpyxl, 'openpyxl is not installed')
+    def test_xlsx_export(self):
+        """Test an XLSX export is rendered in the background with typed cells"""
+        response = self.request_export('XLSX', date_range=self.january)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        job = ExportJob.objects.get(id=response.data['id'])
+        self.assertEqual((job.status, job.total_records), ('COMPLETED', 2))
+        self.assertTrue(job.file_name.endswith('.xlsx'))
+
+        workbook = openpyxl.load_workbook(BytesIO(self.download(job.id)))
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(rows[0][:4], ('Date', 'Type', 'Amount', 'Currency'))
+        self.assertEqual([row[6] for row in rows[1:]], ['Dinner', 'Lunch'])
+        self.assertEqual(rows[1][0].date(), date(2024, 1, 20))
+        self.assertEqual(rows[1][2], 30)
+
+    def test_pdf_export(self):
+        """Test a PDF export has a page per screenful of rows and well-formed cross references"""
+        for i in range(60):
+            Transaction.objects.create(
+                user=self.user, account=self.account, type='EXPENSE', amount=Decimal('1.00'),
+                currency=self.currency, base_currency_amount=Decimal('1.00'), description=f'Snack (#{i})',
+                date=date(2024, 3, 1),
+            )
+        response = self.request_export('PDF')
+        content = self.download(response.data['id'])
+        self.assertTrue(content.startswith(b'%PDF-1.4'))
+        self.assertTrue(content.endswith(b'%%EOF\n'))
+        self.assertIn(b'/Count 2', content)
+        self.assertIn(b'(Snack \\(#59\\))', content)
+        # "xref", "0 <size>", the free entry, then one offset per object
+        xref = content[int(content.rsplit(b'startxref\n', 1)[1].split()[0]):].split(b'\n')
+        for number in range(1, int(xref[1].split()[1])):
+            offset = int(xref[2 + number][:10])
+            self.assertTrue(content[offset:].startswith(b'%d 0 obj' % number))
+
+    def test_filters_apply(self):
+        """Test filters and the date range select the exported rows"""
+        response = self.request_export('CSV', filters={'search': 'rent'})
+        self.assertEqual(ExportJob.objects.get(id=response.data['id']).total_records, 1)
+        content = self.download(response.data['id']).decode('utf-8-sig')
+        self.assertIn('Rent', content)
+        self.assertNotIn('Lunch', content)
+
+    def test_identical_export_is_reused_until_data_changes(self):
+        """Test an unchanged export is returned again instead of being rendered"""
+        first = self.request_export('CSV', date_range=self.january)
+        # One lookup, no rendering
+        with self.assertNumQueries(1):
+            again = self.request_export('CSV', date_range=self.january)
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+        self.assertEqual(again.data['id'], first.data['id'])
+        self.assertIsNotNone(again.data['download_url'])
+
+        other = self.request_export('XLSX', date_range=self.january)
+        self.assertEqual(other.status_code, status.HTTP_201_CREATED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.filter(description='Lunch').first().save()
+        fresh = self.request_export('CSV', date_range=self.january)
+        self.assertEqual(fresh.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(fresh.data['id'], first.data['id'])
+
+    def test_reuse_follows_names_and_tag_order(self):
+        """Test tag order does not matter and renaming a tag or account renders a new export"""
+        groceries = Tag.objects.create(user=self.user, name='Groceries')
+        dining = Tag.objects.create(user=self.user, name='Dining')
+        first = self.request_export('CSV', filters={'tag_ids': [str(groceries.id), str(dining.id)]})
+        again = self.request_export('CSV', filters={'tag_ids': [str(dining.id), str(groceries.id)]})
+        self.assertEqual(again.data['id'], first.data['id'])
+
+        for renamed in (dining, self.account):
+            renamed.name = f'{renamed.name} (old)'
+            with self.captureOnCommitCallbacks(execute=True):
+                renamed.save()
+            fresh = self.request_export('CSV', filters={'tag_ids': [str(groceries.id), str(dining.id)]})
+            self.assertEqual(fresh.status_code, status.HTTP_201_CREATED)
+            self.assertNotEqual(fresh.data['id'], first.data['id'])
+            first = fresh
+
+    def test_size_is_estimated_from_rollups(self):
+        """Test creating an export sizes it from the rollups without counting transactions"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.export_url, {
+                'format': 'CSV', 'filters': {'search': 'lunch'}, 'date_range': self.january,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse([query for query in queries if 'FROM "transactions_transaction"' in query['sql']])
+        # Search is not applied to the estimate
+        self.assertEqual(ExportJob.objects.get(id=response.data['id']).size, 2)
+
+    def test_invalid_filters(self):
+        """Test unknown filter keys and malformed dates are rejected"""
+        for filters, date_range in (({'colour': 'red'}, {}), ({}, {'start_date': '01/02/2024'}),
+                                    ({'ordering': 'description'}, {})):
+            response = self.request_export('CSV', filters, date_range)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_download_requires_completed_own_job(self):
+        """Test a pending export cannot be downloaded, nor another user's"""
+        job = ExportJob.objects.create(user=self.user, file_name='x.csv', format='CSV')
+        response = self.client.get(reverse('export-job-download', args=[job.id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertTrue(run_export_job(job.id))
+        self.assertFalse(run_export_job(job.id))
+        other = User.objects.create_user(email='other@example.com', username='other@example.com', password='x')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(reverse('export-job-download', args=[job.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_download_ranges_and_validators(self):
+        """Test downloads resume with byte ranges and answer conditional requests"""
+        job_id = self.request_export('CSV').data['id']
+        url = reverse('export-job-download', args=[job_id])
+        response = self.client.get(url)
+        content = b''.join(response.streaming_content)
+        self.assertEqual((response['Accept-Ranges'], int(response['Content-Length'])), ('bytes', len(content)))
+        self.assertIn('attachment', response['Content-Disposition'])
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(content)}')
+        self.assertEqual(b''.join(response.streaming_content), content[10:20])
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), content[-5:])
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(content)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        # A changed file is sent whole; an unchanged one is not sent again
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(FILE_DELIVERY='x-accel-redirect', FILE_DELIVERY_ACCEL_PREFIX='/protected/')
+    def test_download_offloaded_to_front_end_server(self):
+        """Test nginx is told which file to send and Django sends no body"""
+        job_id = self.request_export('CSV').data['id']
+        response = self.client.get(reverse('export-job-download', args=[job_id]), HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{ExportJob.objects.get(id=job_id).file.name}')
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(UPLOAD_BLOCK_SIZE=16)
+class ChunkedUploadTests(ImportTestMixin, TestCase):
+    """Tests for resumable chunked uploads and their content-addressed storage"""
+
+    content = (
+        'Date,Description,Amount\n'
+        '2024-01-05,Salary,1000.00\n'
+        '2024-01-06,Lunch,-12.50\n'
+    ).encode()
+
+    def start(self, content=None, **data):
+        content = self.content if content is None else content
+        return self.client.post(reverse('upload-list'), {
+            'file_name': 'statement.csv', 'size': len(content), **data,
+        }, format='json')
+
+    def send(self, upload_id, offset, data):
+        return self.client.put(
+            f'{reverse("upload-chunk", args=[upload_id])}?offset={offset}', data,
+            content_type='application/octet-stream'
+        )
+
+    def upload(self, content=None, chunk_size=32):
+        content = self.content if content is None else content
+        upload_id = self.start(content).data['id']
+        for offset in range(0, len(content), chunk_size):
+            response = self.send(upload_id, offset, content[offset:offset + chunk_size])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return self.client.post(reverse('upload-finalize', args=[upload_id]))
+
+    def test_chunks_are_stored_under_content_hash(self):
+        """Test a file sent in chunks is stored whole under the hash of its block hashes"""
+        response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        blocks = [self.content[i:i + 16] for i in range(0, len(self.content), 16)]
+        digest = content_hash([hashlib.sha256(block).hexdigest() for block in blocks])
+        self.assertEqual((response.data['status'], response.data['content_hash']), ('COMPLETED', digest))
+        upload = Upload.objects.get(id=response.data['id'])
+        self.assertEqual(upload.file.name, f'uploads/{self.user.id}/{digest}')
+        with upload.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'uploads', 'partial', str(upload.id))))
+
+    def test_wrong_offset_and_misaligned_chunk_are_rejected(self):
+        """Test a chunk must start at the received count and cover whole blocks"""
+        upload_id = self.start().data['id']
+        response = self.send(upload_id, 16, self.content[16:32])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['received'], 0)
+        response = self.send(upload_id, 0, self.content[:20])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('upload-finalize', args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_interrupted_chunk_resumes_from_last_whole_block(self):
+        """Test only the complete blocks of a cut-off chunk are kept"""
+        upload = Upload.objects.create(user=self.user, file_name='statement.csv', size=len(self.content))
+        # The connection drops 40 bytes into a 48-byte chunk
+        upload = write_chunk(upload, 0, BytesIO(self.content[:40]), 48)
+        self.assertEqual((upload.received, len(upload.block_hashes)), (32, 2))
+        with self.assertRaises(UploadConflict):
+            write_chunk(upload, 40, BytesIO(self.content[40:]), len(self.content) - 40)
+        write_chunk(upload, 32, BytesIO(self.content[32:]), len(self.content) - 32)
+        response = self.client.post(reverse('upload-finalize', args=[upload.id]))
+        with Upload.objects.get(id=response.data['id']).file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_chunk_sent_twice_does_not_overwrite(self):
+        """Test a second chunk at an offset already written is a conflict and leaves the bytes alone"""
+        upload = Upload.objects.create(user=self.user, file_name='statement.csv', size=len(self.content))
+        stale = Upload.objects.get(id=upload.id)
+        write_chunk(upload, 0, BytesIO(self.content[:32]), 32)
+        with self.assertRaises(UploadConflict) as raised:
+            write_chunk(stale, 0, BytesIO(b'x' * 32), 32)
+        self.assertEqual(raised.exception.received, 32)
+        write_chunk(upload, 32, BytesIO(self.content[32:]), len(self.content) - 32)
+        response = self.client.post(reverse('upload-finalize', args=[upload.id]))
+        with Upload.objects.get(id=response.data['id']).file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_identical_uploads_are_stored_once(self):
+        """Test uploading the same content again returns the stored upload"""
+        first = self.upload()
+        second = self.upload(chunk_size=16)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(Upload.objects.count(), 1)
+        # A client that hashed the file first skips sending it
+        response = self.start(content_hash=first.data['content_hash'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], first.data['id'])
+
+    def test_import_reads_upload_in_place(self):
+        """Test an import job started from an upload uses its stored file without copying it"""
+        upload = self.upload().data
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.list_url, {
+                'upload_id': upload['id'],
+                'column_mapping': {'date': 'Date', 'description': 'Description', 'amount': 'Amount'},
+                'default_values': {'account': 'Checking'},
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        job = ImportJob.objects.get(id=response.data['id'])
+        self.assertEqual((job.status, job.successful_records, job.file_name), ('COMPLETED', 2, 'statement.csv'))
+        self.assertEqual(job.file.name, f'uploads/{self.user.id}/{upload["content_hash"]}')
+
+        # Deleting the job keeps the file the upload still holds, and vice versa
+        self.client.delete(reverse('import-job-detail', args=[job.id]))
+        self.assertTrue(os.path.exists(job.file.path))
+        job = ImportJob.objects.create(user=self.user, file_name='statement.csv', file_type='CSV', file=job.file.name)
+        self.client.delete(reverse('upload-detail', args=[upload['id']]))
+        self.assertTrue(os.path.exists(job.file.path))
+
+    def test_import_rejects_unfinished_upload(self):
+        """Test an import needs a completed upload and not a file as well"""
+        upload_id = self.start().data['id']
+        response = self.client.post(self.list_url, {
+            'upload_id': upload_id, 'column_mapping': {'date': 'Date', 'amount': 'Amount'},
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('upload_id', response.data)
+
+    def test_stale_uploads_expire(self):
+        """Test unfinished uploads are deleted with their partial file once stale"""
+        upload_id = self.start().data['id']
+        self.send(upload_id, 0, self.content[:16])
+        partial = os.path.join(self.media_root, 'uploads', 'partial', str(upload_id))
+        self.assertTrue(os.path.exists(partial))
+        self.assertEqual(expire_uploads(), 0)
+        Upload.objects.filter(id=upload_id).update(updated_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(expire_uploads(), 1)
+        self.assertFalse(Upload.objects.exists())
+        self.assertFalse(os.path.exists(partial))
+
+
+@override_settings(JOB_PROGRESS_POLL_INTERVAL=0)
+class JobProgressTests(ImportTestMixin, TestCase):
+    """Tests for cached job progress counters, the progress endpoint and its event stream"""
+
+    content = 'Date,Description,Amount\n' + ''.join(f'2024-01-{day:02d},Row {day},-{day}.00\n' for day in range(1, 21))
+    mapping = {'date': 'Date', 'description': 'Description', 'amount': 'Amount'}
+
+    def events(self, job_id, model='import-job', **headers):
+        response = self.client.get(
+            reverse(f'{model}-events', args=[job_id]), HTTP_ACCEPT='text/event-stream', **headers
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response.streaming_content
+
+    def test_counters_are_flushed_not_written_per_chunk(self):
+        """Test an import updates its row a fixed number of times however many chunks it writes"""
+        job = self.create_job(self.content, self.mapping, {'account': 'Checking'})
+        with override_settings(JOB_PROGRESS_FLUSH_INTERVAL=3600), CaptureQueriesContext(connection) as ctx:
+            run_import_job(job.id, chunk_size=2)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "files_importjob"')]
+        # Claim, final flush and status
+        self.assertEqual(len(updates), 3)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_records, job.successful_records, job.total_records),
+                         ('COMPLETED', 20, 20, 20))
+        self.assertEqual(read_progress(ImportJob, job.id, self.user.id)['successful_records'], 20)
+
+    def test_progress_is_read_from_cache_while_running(self):
+        """Test the progress endpoint runs no queries for a running job and uses the row otherwise"""
+        job = self.create_job(self.content, self.mapping, {'account': 'Checking'})
+        url = reverse('import-job-progress', args=[job.id])
+        self.assertEqual(self.client.get(url).data['status'], 'PENDING')
+
+        progress = JobProgress(job)
+        progress.start()
+        progress.add(processed_records=5, failed_records=1)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data, {
+            'status': 'PROCESSING', 'processed_records': 5, 'successful_records': 0, 'failed_records': 1,
+            'duplicate_records': 0, 'categorized_records': 0,
+        })
+        other = User.objects.create_user(email='other@example.com', username='other@example.com', password='x')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_event_stream_follows_job_until_it_ends(self):
+        """Test the event stream sends each change and closes when the job finishes"""
+        job = self.create_job(self.content, self.mapping, {'account': 'Checking'})
+        progress = JobProgress(job)
+        progress.start()
+        stream = iter(self.events(job.id))
+        self.assertTrue(next(stream).startswith(b'retry:'))
+        self.assertIn(b'"status": "PROCESSING"', next(stream))
+        progress.add(processed_records=3)
+        self.assertIn(b'"processed_records": 3', next(stream))
+        progress.finish('COMPLETED')
+        self.assertIn(b'"status": "COMPLETED"', next(stream))
+        self.assertEqual(list(stream), [])
+
+    def test_export_progress(self):
+        """Test an export counts its rendered rows and a finished job's stream ends at once"""
+        Transaction.objects.create(
+            user=self.user, account=self.account, type='EXPENSE', amount=Decimal('1.00'), currency=self.currency,
+            base_currency_amount=Decimal('1.00'), description='Snack', date=date(2024, 1, 1),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            job_id = self.client.post(reverse('export-job-list'), {'format': 'CSV'}, format='json').data['id']
+        self.assertEqual(self.client.get(reverse('export-job-progress', args=[job_id])).data,
+                         {'status': 'COMPLETED', 'total_records': 1})
+        events = [event for event in self.events(job_id, 'export-job') if b'data:' in event]
+        self.assertEqual(len(events), 1)
+
+    def test_reconnect_skips_the_snapshot_already_sent(self):
+        """Test a stream reopened with Last-Event-ID sends only changes after that snapshot"""
+        job = self.create_job(self.content, self.mapping, {'account': 'Checking'})
+        progress = JobProgress(job)
+        progress.start()
+        with override_settings(JOB_PROGRESS_STREAM_SECONDS=0):
+            first = [event for event in self.events(job.id) if b'data:' in event]
+            self.assertEqual(len(first), 1)
+            last_id = first[0].split(b'\n')[0].removeprefix(b'id: ').decode()
+            self.assertEqual([event for event in self.events(job.id, HTTP_LAST_EVENT_ID=last_id)
+                              if b'data:' in event], [])
+            progress.add(processed_records=2)
+            again = [event for event in self.events(job.id, HTTP_LAST_EVENT_ID=last_id) if b'data:' in event]
+        self.assertIn(b'"processed_records": 2', again[0])
+
+
+class JobSchedulingTests(ImportTestMixin, TestCase):
+    """Tests for fair-share scheduling of import and export jobs"""
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(email='other@example.com', username='other@example.com', password='x')
+
+    def queue(self, user, size, status='PENDING', **fields):
+        return ImportJob.objects.create(
+            user=user, file_name='statement.csv', file_type='CSV', size=size, status=status, **fields
+        ).id
+
+    def test_slots_go_round_robin_smallest_first(self):
+        """Test users take turns and each user's smallest job goes first"""
+        large = self.queue(self.user, 5000)
+        small = self.queue(self.user, 10)
+        medium = self.queue(self.user, 200)
+        other = self.queue(self.other, 9000)
+        self.assertEqual(pick_jobs(ImportJob, limit=3, user_limit=2), [small, other, medium])
+        self.assertEqual(pick_jobs(ImportJob, limit=10, user_limit=3), [small, other, medium, large])
+
+    def test_concurrency_caps(self):
+        """Test users at their cap wait while others run, and nothing starts when every slot is taken"""
+        self.queue(self.user, 1, status='PROCESSING')
+        self.queue(self.user, 1, dispatched_at=timezone.now())
+        self.queue(self.user, 1)
+        other = self.queue(self.other, 1000)
+        self.assertEqual(pick_jobs(ImportJob, limit=8, user_limit=2), [other])
+        self.assertEqual(pick_jobs(ImportJob, limit=2, user_limit=2), [])
+
+    def test_schedule_runs_queued_and_lost_jobs(self):
+        """Test scheduling starts queued jobs and hands out again those no worker picked up"""
+        mapping = {'date': 'Date', 'amount': 'Amount'}
+        queued = self.create_job('Date,Amount\n2024-01-01,-5\n', mapping, {'account': 'Checking'})
+        lost = self.create_job('Date,Amount\n2024-01-02,-6\n', mapping, {'account': 'Checking'})
+        ImportJob.objects.filter(id=lost.id).update(dispatched_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(schedule_jobs(), 2)
+        for job in (queued, lost):
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'COMPLETED')
+            self.assertIsNotNone(job.started_at)
+
+    def test_abandoned_running_job_frees_its_slot(self):
+        """Test a running job that stopped reporting progress is failed and its slot reused"""
+        abandoned = self.queue(self.user, 1, status='PROCESSING')
+        busy = self.queue(self.user, 1, status='PROCESSING')
+        waiting = self.queue(self.user, 1)
+        self.assertEqual(pick_jobs(ImportJob, user_limit=2), [])
+
+        JobProgress(ImportJob.objects.get(id=abandoned)).start()
+        ImportJob.objects.filter(id=abandoned).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(fail_stale_jobs(ImportJob), 1)
+        job = ImportJob.objects.get(id=abandoned)
+        self.assertEqual(job.status, 'FAILED')
+        self.assertTrue(job.error_message)
+        self.assertEqual(read_progress(ImportJob, abandoned, self.user.id)['status'], 'FAILED')
+        self.assertEqual(ImportJob.objects.get(id=busy).status, 'PROCESSING')
+        self.assertEqual(pick_jobs(ImportJob, user_limit=2), [waiting])
+
+    def test_queue_metrics_are_for_admins(self):
+        """Test the queue endpoint reports depth and waits to staff only"""
+        self.queue(self.user, 1)
+        self.queue(self.other, 1)
+        running = self.queue(self.other, 1, status='PROCESSING')
+        ImportJob.objects.filter(id=running).update(started_at=F('created_at') + timedelta(seconds=2))
+        url = reverse('job-queue-list')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        imports = self.client.get(url).data['imports']
+        self.assertEqual((imports['queued'], imports['waiting_users'], imports['running'], imports['started_last_hour']),
+                         (2, 2, 1, 1))
+        self.assertEqual((imports['average_wait_seconds'], imports['longest_wait_seconds']), (2, 2))
+
+
+class UserBackupTests(ImportTestMixin, TestCase):
+    """Tests for per-user backups and their restore"""
+
+    def setUp(self):
+        super().setUp()
+        self.tag = Tag.objects.create(user=self.user, name='Work')
+        self.child = Category.objects.create(user=self.user, name='Groceries', type='EXPENSE', parent=self.category)
+        ExchangeRate.objects.create(user=self.user, from_currency=self.euro, to_currency=self.currency,
+                                    rate=Decimal('1.100000'), date=date(2024, 1, 1))
+        rule = CategorizationRule.objects.create(user=self.user, name='Shop', pattern='shop', category=self.child)
+        rule.tags.add(self.tag)
+        ImportTemplate.objects.create(user=self.user, name='Bank', file_type='CSV',
+                                      column_mapping={'date': 'Date', 'amount': 'Amount'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lunch = Transaction.objects.create(
+                user=self.user, account=self.account, type='EXPENSE', amount=Decimal('12.50'), currency=self.euro,
+                base_currency_amount=Decimal('13.75'), exchange_rate=Decimal('1.1'), date=date(2024, 1, 5),
+                description='Lunch\twith "team"\\ \u00e9', category=self.child, external_id='',
+            )
+            self.lunch.tags.add(self.tag)
+            Transaction.objects.create(
+                user=self.user, account=self.account, type='INCOME', amount=Decimal('100.00'), currency=self.currency,
+                base_currency_amount=Decimal('100.00'), date=date(2024, 1, 6), description='Refund',
+                duplicate_of=self.lunch,
+            )
+        self.target = User.objects.create_user(email='copy@example.com', username='copy@example.com', password='x')
+
+    def backup(self, method=None):
+        output = BytesIO()
+        manifest = write_backup(self.user, output, method)
+        output.seek(0)
+        return output, manifest
+
+    def assert_restored(self, method=None):
+        backup, manifest = self.backup(method)
+        tables = {table['table']: table['rows'] for table in manifest['tables']}
+        self.assertEqual((tables['transactions_transaction'], tables['transactions_transaction_tags']), (2, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = restore_backup(backup, self.target, method)
+        self.assertEqual(counts, tables)
+
+        lunch = Transaction.objects.get(user=self.target, type='EXPENSE')
+        self.assertNotEqual(lunch.id, self.lunch.id)
+        self.assertEqual(
+            (lunch.description, lunch.amount, lunch.exchange_rate, lunch.external_id, lunch.currency_id),
+            (self.lunch.description, Decimal('12.50'), Decimal('1.100000'), '', self.euro.id)
+        )
+        self.assertEqual(lunch.account.user, self.target)
+        # Recomputed for the new account id, so re-imports into it find duplicates
+        self.assertEqual(lunch.fingerprint, fingerprint(
+            lunch.account_id, lunch.date, lunch.type, lunch.amount, lunch.description
+        ))
+        self.assertNotEqual(lunch.fingerprint, self.lunch.fingerprint)
+        self.assertEqual((lunch.category.name, lunch.category.parent.name), ('Groceries', 'Food'))
+        self.assertEqual(lunch.category.parent.user, self.target)
+        self.assertEqual([tag.user for tag in lunch.tags.all()], [self.target])
+        self.assertEqual(Transaction.objects.get(user=self.target, type='INCOME').duplicate_of, lunch)
+        rule = CategorizationRule.objects.get(user=self.target)
+        self.assertEqual((rule.category, rule.tags.get().name), (lunch.category, 'Work'))
+        self.assertEqual(ImportTemplate.objects.get(user=self.target).column_mapping,
+                         {'date': 'Date', 'amount': 'Amount'})
+        # Derived data comes along
+        self.assertEqual(Account.objects.get(user=self.target).current_balance, self.account.current_balance)
+        self.assertEqual(DailyTransactionSummary.objects.filter(user=self.target).count(),
+                         DailyTransactionSummary.objects.filter(user=self.user).count())
+        self.assertTrue(DescriptionSuggestion.objects.filter(user=self.target, last_transaction=lunch).exists())
+        # The source is untouched
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+
+    def test_orm_backup_and_restore(self):
+        """Test a backup read with the ORM restores under new ids for another user"""
+        self.account.refresh_from_db()
+        self.assert_restored('orm')
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY needs PostgreSQL')
+    def test_copy_backup_and_restore(self):
+        """Test a backup read with COPY restores under new ids and gets a search vector"""
+        self.account.refresh_from_db()
+        self.assert_restored('copy')
+        self.assertTrue(Transaction.objects.filter(user=self.target, search_vector__isnull=False).exists())
+
+    def test_keep_ids_and_missing_currencies(self):
+        """Test ids can be kept and currencies the database lacks are created from the backup"""
+        backup, _ = self.backup()
+        lunch_id = self.lunch.id
+        self.user.delete()
+        ExchangeRate.objects.all().delete()
+        self.euro.delete()
+        restore_backup(backup, self.target, keep_ids=True)
+        lunch = Transaction.objects.get(id=lunch_id)
+        self.assertEqual((lunch.user, lunch.currency.code), (self.target, 'EUR'))
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.base_currency, self.currency)
+
+    def test_restore_needs_empty_user(self):
+        """Test a backup is not merged into a user who already has data"""
+        backup, _ = self.backup()
+        with self.assertRaises(BackupError):
+            restore_backup(backup, self.user)
+        with self.assertRaises(BackupError):
+            restore_backup(BytesIO(b'not a zip file' * 10), self.target)
+        # Any backed-up table counts, not only accounts, categories and tags
+        DescriptionSuggestion.objects.create(user=self.target, description='Lunch', usage_count=1)
+        backup.seek(0)
+        with self.assertRaises(BackupError):
+            restore_backup(backup, self.target)
+
+    def test_kept_ids_that_exist_are_an_error(self):
+        """Test restoring with kept ids into the source database fails cleanly and loads nothing"""
+        backup, _ = self.backup()
+        with self.assertRaises(BackupError):
+            restore_backup(backup, self.target, keep_ids=True)
+        self.assertFalse(Account.objects.filter(user=self.target).exists())
@@ -0,0 +1,196 @@
+"""
+Resumable chunked uploads with content-addressed storage.
+
+A client creates an ``Upload`` with the file's name and size, then sends
+the bytes in chunks, each starting at the offset the server reports.
+Chunks are streamed from the request straight into a partial file on disk;
+the request body is never buffered whole. A chunk must start on a
+``UPLOAD_BLOCK_SIZE`` boundary and cover whole blocks unless it ends the
+file. Only complete blocks count as received, so a chunk cut off by a
+dropped connection is resumed from its last complete block.
+
+Each block's SHA-256 is computed as it is written and kept on the upload.
+The content hash is the SHA-256 of those digests joined together (the
+scheme Dropbox uses for its content hash). It can therefore be built one
+chunk at a time, across requests served by different processes.
+Finalizing moves the partial file to ``uploads/<user id>/<content hash>``
+with a rename, not a copy. If the user already stored the same content,
+the new bytes are dropped and the stored upload is returned instead.
+Import jobs read the stored file in place.
+
+Uploads are written with plain file operations, so they need the default
+storage to be on the local filesystem.
+"""
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+
+from .models import ImportJob, Upload
+
+# Bytes read from the request at a time
+READ_SIZE = 64 * 1024
+LOCK_TIMEOUT = 10 * 60
+
+
+class UploadConflict(Exception):
+    """The request does not fit the upload's state; the client should resume from ``received``."""
+
+    def __init__(self, message, received):
+        super().__init__(message)
+        self.received = received
+
+
+def partial_name(upload):
+    return f'uploads/partial/{upload.pk}'
+
+
+def content_name(user_id, digest):
+    return f'uploads/{user_id}/{digest}'
+
+
+def content_hash(block_hashes):
+    return hashlib.sha256(b''.join(bytes.fromhex(digest) for digest in block_hashes)).hexdigest()
+
+
+def start_upload(user, file_name, size, digest=None):
+    """
+    Return ``(upload, created)``. When the client already knows the content
+    hash and the user stored that content before, the stored upload is
+    returned and nothing needs to be sent.
+    """
+    if digest:
+        existing = Upload.objects.filter(user=user, status='COMPLETED', content_hash=digest).first()
+        if existing is not None:
+            return existing, False
+    return Upload.objects.create(user=user, file_name=file_name, size=size), True
+
+
+def check_offset(upload, offset):
+    if upload.status != 'UPLOADING':
+        raise UploadConflict('The upload is already complete', upload.received)
+    if offset != upload.received:
+        raise UploadConflict(f'Expected a chunk at offset {upload.received}', upload.received)
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Append ``length`` bytes read from ``stream`` at ``offset`` and return the
+    upload with its new ``received`` count. Raises ValueError for a chunk
+    that cannot be accepted at any offset and ``UploadConflict`` for one sent
+    at the wrong time.
+    """
+    block_size = settings.UPLOAD_BLOCK_SIZE
+    check_offset(upload, offset)
+    if length <= 0 or offset + length > upload.size:
+        raise ValueError('The chunk does not fit in the file')
+    if length % block_size and offset + length != upload.size:
+        raise ValueError(f'Chunks must be a multiple of {block_size} bytes unless they end the file')
+
+    lock = f'files:upload-lock:{upload.pk}'
+    if not cache.add(lock, True, timeout=LOCK_TIMEOUT):
+        raise UploadConflict('Another chunk is being written', upload.received)
+    try:
+        # Another chunk may have been written since ``upload`` was loaded
+        upload.refresh_from_db()
+        check_offset(upload, offset)
+        path = default_storage.path(partial_name(upload))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        hashes = []
+        committed = position = offset
+        end = offset + length
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as output:
+            output.seek(offset)
+            block, filled = hashlib.sha256(), 0
+            while position < end:
+                data = stream.read(min(READ_SIZE, block_size - filled, end - position))
+                if not data:
+                    # The connection dropped; the partial block is resent
+                    break
+                output.write(data)
+                block.update(data)
+                filled += len(data)
+                position += len(data)
+                if filled == block_size or position == upload.size:
+                    hashes.append(block.hexdigest())
+                    committed = position
+                    block, filled = hashlib.sha256(), 0
+        updated = Upload.objects.filter(pk=upload.pk, received=offset).update(
+            received=committed, block_hashes=upload.block_hashes + hashes, updated_at=timezone.now()
+        )
+        if not updated:
+            upload.refresh_from_db()
+            raise UploadConflict('Another chunk was written at this offset', upload.received)
+    finally:
+        cache.delete(lock)
+    upload.refresh_from_db()
+    return upload
+
+
+def finalize_upload(upload):
+    """
+    Store a fully received upload under its content hash and return it, or
+    the user's earlier upload of the same content.
+    """
+    if upload.status == 'COMPLETED':
+        return upload
+    if upload.received != upload.size:
+        raise UploadConflict(f'{upload.size - upload.received} bytes are missing', upload.received)
+    digest = content_hash(upload.block_hashes)
+    partial = default_storage.path(partial_name(upload))
+    existing = Upload.objects.filter(user=upload.user_id, status='COMPLETED', content_hash=digest).first()
+    if existing is None:
+        name = content_name(upload.user_id, digest)
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Same filesystem, so this renames rather than copies
+        os.replace(partial, path)
+        upload.status, upload.content_hash, upload.file.name = 'COMPLETED', digest, name
+        try:
+            with db_transaction.atomic():
+                upload.save(update_fields=['status', 'content_hash', 'file', 'updated_at'])
+            return upload
+        except IntegrityError:
+            # Finalized concurrently with an identical upload, whose file
+            # the rename replaced with the same bytes
+            existing = Upload.objects.get(user=upload.user_id, status='COMPLETED', content_hash=digest)
+    elif os.path.exists(partial):
+        os.remove(partial)
+    Upload.objects.filter(pk=upload.pk).delete()
+    return existing
+
+
+def file_in_use(name, job=None, upload=None):
+    """Whether a stored file is referenced by an upload or import job other than those given."""
+    uploads = Upload.objects.filter(file=name)
+    jobs = ImportJob.objects.filter(file=name)
+    if upload is not None:
+        uploads = uploads.exclude(pk=upload.pk)
+    if job is not None:
+        jobs = jobs.exclude(pk=job.pk)
+    return uploads.exists() or jobs.exists()
+
+
+def delete_upload(upload):
+    """Delete an upload and its bytes, keeping a stored file that import jobs still read."""
+    if upload.status == 'UPLOADING':
+        default_storage.delete(partial_name(upload))
+    elif upload.file and not file_in_use(upload.file.name, upload=upload):
+        upload.file.delete(save=False)
+    upload.delete()
+
+
+def expire_uploads(hours=None):
+    """Delete unfinished uploads not written to for ``hours`` (default ``UPLOAD_EXPIRY_HOURS``); returns the count."""
+    cutoff = timezone.now() - timedelta(hours=hours or settings.UPLOAD_EXPIRY_HOURS)
+    stale = Upload.objects.filter(status='UPLOADING', updated_at__lt=cutoff)
+    count = 0
+    for upload in stale.iterator():
+        delete_upload(upload)
+        count += 1
+    return count
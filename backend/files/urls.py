@@ -0,0 +1,14 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import ExportJobViewSet, ImportJobViewSet, ImportTemplateViewSet, JobQueueViewSet, UploadViewSet
+
+router = DefaultRouter()
+router.register(r'imports', ImportJobViewSet, basename='import-job')
+router.register(r'import-templates', ImportTemplateViewSet, basename='import-template')
+router.register(r'exports', ExportJobViewSet, basename='export-job')
+router.register(r'uploads', UploadViewSet, basename='upload')
+router.register(r'queue', JobQueueViewSet, basename='job-queue')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
@@ -1,3 +1,309 @@
-from django.shortcuts import render
+import json
 
-# Create your views here.
+from django.db import transaction as db_transaction
+from django.http import StreamingHttpResponse
+from rest_framework import mixins, viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from drf_spectacular.utils import extend_schema, OpenApiResponse
+from transactions.caching import get_data_version
+from .delivery import file_response
+from .exports import estimate_export_size, export_key, find_reusable_export
+from .models import ExportJob, ImportJob, ImportTemplate, Upload
+from .progress import job_progress, progress_events, read_progress
+from .scheduling import queue_stats
+from .serializers import ExportJobSerializer, ImportJobSerializer, ImportTemplateSerializer, UploadSerializer
+from .tasks import schedule_jobs
+from .uploads import UploadConflict, delete_upload, file_in_use, finalize_upload, start_upload, write_chunk
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients ask for ``text/event-stream``; errors are sent as one ``error`` event."""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f'event: error\ndata: {json.dumps(data)}\n\n'
+
+
+class JobProgressMixin:
+    """Progress endpoints for job viewsets, read from the cache while the job runs (see ``files.progress``)."""
+
+    def current_progress(self, pk):
+        model = self.get_queryset().model
+        progress = read_progress(model, pk, self.request.user.id)
+        if progress is None:
+            progress = job_progress(self.get_object())
+        return progress
+
+    @extend_schema(
+        summary="Get a job's progress",
+        description="The job's status and counters; while the job runs they are read without touching the database.",
+        responses={200: OpenApiResponse(description="{status, <counters>}")}
+    )
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        return Response(self.current_progress(pk))
+
+    @extend_schema(
+        summary="Stream a job's progress",
+        description=(
+            "Server-sent events, each carrying the same JSON as the progress endpoint, sent whenever it "
+            "changes until the job ends. The stream closes after JOB_PROGRESS_STREAM_SECONDS and the client "
+            "reconnects, sending Last-Event-ID to skip the snapshot it already has."
+        ),
+        responses={(200, 'text/event-stream'): str}
+    )
+    @action(detail=True, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def events(self, request, pk=None):
+        model = self.get_queryset().model
+        events = progress_events(
+            model, pk, request.user.id, self.current_progress(pk), request.headers.get('Last-Event-ID')
+        )
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stops nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class ImportTemplateViewSet(viewsets.ModelViewSet):
+    serializer_class = ImportTemplateSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = ImportTemplate.objects.none()  # Default queryset for schema generation
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return ImportTemplate.objects.none()
+        return ImportTemplate.objects.filter(user=self.request.user)
+
+
+class ImportJobViewSet(JobProgressMixin,
+                       mixins.CreateModelMixin,
+                       mixins.RetrieveModelMixin,
+                       mixins.ListModelMixin,
+                       mixins.DestroyModelMixin,
+                       viewsets.GenericViewSet):
+    serializer_class = ImportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    queryset = ImportJob.objects.none()  # Default queryset for schema generation
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return ImportJob.objects.none()
+        return ImportJob.objects.filter(user=self.request.user)
+
+    @extend_schema(
+        summary="Upload a file to import",
+        description=(
+            "Upload a file (multipart), or pass the upload_id of a completed chunked upload, with a "
+            "template_id and/or a column_mapping and default_values. "
+            "The import is queued and runs in the background, after the user's earlier jobs if they already "
+            "have several running; follow its progress counters and row errors."
+        ),
+        responses={201: ImportJobSerializer}
+    )
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save()
+        db_transaction.on_commit(lambda: schedule_jobs.delay())
+
+    @extend_schema(
+        summary="Delete an import job",
+        description=(
+            "Delete a finished or pending import job and its uploaded file, unless a chunked upload still "
+            "holds the file; imported transactions are kept."
+        ),
+        responses={204: None, 409: OpenApiResponse(description="The job is being processed")}
+    )
+    def destroy(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.status == 'PROCESSING':
+            return Response({'detail': 'The job is being processed'}, status=status.HTTP_409_CONFLICT)
+        if job.file and not file_in_use(job.file.name, job=job):
+            job.file.delete(save=False)
+        job.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ExportJobViewSet(JobProgressMixin,
+                       mixins.CreateModelMixin,
+                       mixins.RetrieveModelMixin,
+                       mixins.ListModelMixin,
+                       mixins.DestroyModelMixin,
+                       viewsets.GenericViewSet):
+    serializer_class = ExportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = ExportJob.objects.none()  # Default queryset for schema generation
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return ExportJob.objects.none()
+        return ExportJob.objects.filter(user=self.request.user)
+
+    @extend_schema(
+        summary="Request an export",
+        description=(
+            "Render the transactions matching filters (the transaction list's query parameters) and date_range "
+            "({start_date, end_date}) as CSV, XLSX or PDF in the background; poll the job for its download_url. "
+            "If the same export was already made and no transaction has changed since, that job is returned "
+            "with status 200 instead."
+        ),
+        responses={201: ExportJobSerializer, 200: ExportJobSerializer}
+    )
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        key = export_key(data['format'], data.get('filters'), data.get('date_range'))
+        existing = find_reusable_export(request.user, key)
+        if existing is not None:
+            return Response(self.get_serializer(existing).data, status=status.HTTP_200_OK)
+        # The row estimate lets the scheduler run small exports first
+        size = estimate_export_size(request.user, data.get('filters'), data.get('date_range'))
+        serializer.save(export_key=key, data_version=get_data_version(request.user.id), size=size)
+        db_transaction.on_commit(lambda: schedule_jobs.delay())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        summary="Download an export",
+        description=(
+            "Supports a single Range (resuming an interrupted download), If-Range, and ETag/Last-Modified "
+            "conditional requests."
+        ),
+        responses={200: OpenApiResponse(description="The exported file"),
+                   206: OpenApiResponse(description="The requested byte range"),
+                   304: OpenApiResponse(description="The client's copy is current"),
+                   409: OpenApiResponse(description="The export is not ready"),
+                   416: OpenApiResponse(description="The range lies outside the file")}
+    )
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != 'COMPLETED' or not job.file:
+            return Response({'detail': 'The export is not ready'}, status=status.HTTP_409_CONFLICT)
+        return file_response(request, job.file, job.file_name)
+
+    @extend_schema(
+        summary="Delete an export job",
+        description="Delete an export job and its file.",
+        responses={204: None, 409: OpenApiResponse(description="The job is being processed")}
+    )
+    def destroy(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.status == 'PROCESSING':
+            return Response({'detail': 'The job is being processed'}, status=status.HTTP_409_CONFLICT)
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadViewSet(mixins.CreateModelMixin,
+                    mixins.RetrieveModelMixin,
+                    mixins.ListModelMixin,
+                    mixins.DestroyModelMixin,
+                    viewsets.GenericViewSet):
+    serializer_class = UploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = Upload.objects.none()  # Default queryset for schema generation
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Upload.objects.none()
+        return Upload.objects.filter(user=self.request.user)
+
+    @extend_schema(
+        summary="Start a chunked upload",
+        description=(
+            "Create an upload from the file's name and size, then PUT its bytes to the chunk endpoint. "
+            "If content_hash (the SHA-256 of the file's block_size block SHA-256s, joined) matches a file "
+            "the user uploaded before, that upload is returned with status 200 and nothing needs to be sent."
+        ),
+        responses={201: UploadSerializer, 200: UploadSerializer}
+    )
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        upload, created = start_upload(request.user, data['file_name'], data['size'], data.get('content_hash'))
+        return Response(
+            self.get_serializer(upload).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    @extend_schema(
+        summary="Send a chunk",
+        description=(
+            "Send the raw bytes (application/octet-stream) starting at ?offset=, which must equal the upload's "
+            "received count. A chunk covers whole blocks of block_size bytes unless it ends the file. Only "
+            "complete blocks are kept, so after a dropped connection resume from the received count returned "
+            "by the upload."
+        ),
+        request={'application/octet-stream': bytes},
+        responses={200: UploadSerializer, 400: OpenApiResponse(description="The chunk cannot be accepted"),
+                   409: OpenApiResponse(description="Wrong offset or the upload is complete; carries received")}
+    )
+    @action(detail=True, methods=['put'], parser_classes=[])
+    def chunk(self, request, pk=None):
+        upload = self.get_object()
+        try:
+            offset = int(request.query_params['offset'])
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            return Response({'detail': 'An offset and a Content-Length are required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload = write_chunk(upload, offset, request.stream, length)
+        except UploadConflict as exc:
+            return Response({'detail': str(exc), 'received': exc.received}, status=status.HTTP_409_CONFLICT)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(upload).data)
+
+    @extend_schema(
+        summary="Finish an upload",
+        description=(
+            "Store a fully received upload under its content hash. If the user already stored the same file, "
+            "this upload is discarded and the earlier one is returned. Pass the returned id as upload_id "
+            "to start an import."
+        ),
+        request=None,
+        responses={200: UploadSerializer, 409: OpenApiResponse(description="Bytes are missing; carries received")}
+    )
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        try:
+            upload = finalize_upload(self.get_object())
+        except UploadConflict as exc:
+            return Response({'detail': str(exc), 'received': exc.received}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(upload).data)
+
+    @extend_schema(
+        summary="Delete an upload",
+        description="Delete an upload and its file; a file that import jobs still read is kept for them.",
+        responses={204: None}
+    )
+    def destroy(self, request, *args, **kwargs):
+        delete_upload(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class JobQueueViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(
+        summary="Job queue metrics",
+        description=(
+            "For imports and exports: jobs queued, handed to a worker and running, users waiting, the oldest "
+            "queued job's wait, and the average and longest wait of jobs started in the last hour, in seconds."
+        ),
+        responses={200: OpenApiResponse(description="{imports: {...}, exports: {...}}")}
+    )
+    def list(self, request):
+        return Response(queue_stats())
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Transaction, Tag, Category
+from .models import Transaction, Tag, Category, CategorizationRule
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
@@ -25,3 +25,12 @@ class TagAdmin(admin.ModelAdmin):
     search_fields = ('name', 'user__email')
     raw_id_fields = ('user',)
     ordering = ('name',)
+
+@admin.register(CategorizationRule)
+class CategorizationRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'match_type', 'pattern', 'category', 'priority', 'is_active')
+    list_filter = ('match_type', 'is_active')
+    search_fields = ('name', 'pattern', 'user__email')
+    raw_id_fields = ('user', 'account', 'category')
+    filter_horizontal = ('tags',)
+    ordering = ('priority', 'created_at')
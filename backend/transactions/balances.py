@@ -0,0 +1,214 @@
+"""
+Account balances derived from transactions.
+
+Income adds to the balance of its account; expenses and transfers (recorded
+on the account the money leaves) subtract from it. Archived transactions do
+not count.
+
+``Account.current_balance`` and ``base_currency_balance`` are kept current
+with ``F()`` deltas applied in the same database transaction as the write.
+Point-in-time balances start from the nearest ``BalanceCheckpoint`` on or
+before the requested date and only sum the transactions after it; existing
+checkpoints are shifted the same way whenever a transaction on or before
+their date changes.
+"""
+import calendar
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Case, F, OuterRef, Q, RowRange, Subquery, Sum, When, Window
+from django.db.models.functions import TruncMonth
+
+from accounts.models import Account, BalanceCheckpoint
+from .models import Transaction
+
+
+def signed_amount():
+    """Expression for a transaction's effect on its account's balance."""
+    return Case(When(type='INCOME', then=F('amount')), default=-F('amount'))
+
+
+def signed_base_amount():
+    return Case(When(type='INCOME', then=F('base_currency_amount')), default=-F('base_currency_amount'))
+
+
+def signed_value(values, field='amount'):
+    amount = Decimal(values[field])
+    return amount if values['type'] == 'INCOME' else -amount
+
+
+def apply_account_balance_changes(changes):
+    """Shift account balances for an iterable of ``(old_values, new_values)`` pairs."""
+    deltas = defaultdict(lambda: [Decimal('0'), Decimal('0')])
+    for old, new in changes:
+        for values, sign in ((old, -1), (new, 1)):
+            if not values or values.get('is_archived'):
+                continue
+            delta = deltas[values['account_id']]
+            delta[0] += sign * signed_value(values)
+            delta[1] += sign * signed_value(values, 'base_currency_amount')
+    # A fixed lock order keeps concurrent multi-account writes from deadlocking
+    for account_id in sorted(deltas, key=str):
+        amount, base_amount = deltas[account_id]
+        if amount or base_amount:
+            Account.objects.filter(pk=account_id).update(
+                current_balance=F('current_balance') + amount,
+                base_currency_balance=F('base_currency_balance') + base_amount,
+            )
+
+
+def reconcile_user_balances(user_id, repair=True):
+    """
+    Compare the stored balances of one user's accounts with a full recount
+    and, if ``repair`` is set, overwrite the ones that differ. Returns
+    ``(account, expected_balance, expected_base_balance)`` for every mismatch.
+    The base balance of an account that has been revalued
+    (``accounts.revaluation``) cannot be recounted and is kept as is.
+    """
+    with db_transaction.atomic():
+        # Locking the accounts makes concurrent writers wait, or wait for them
+        accounts = list(Account.objects.select_for_update().filter(user_id=user_id).order_by('pk'))
+        totals = {
+            row['account_id']: row
+            for row in Transaction.objects.filter(user_id=user_id, is_archived=False)
+            .order_by()
+            .values('account_id')
+            .annotate(net=Sum(signed_amount()), base_net=Sum(signed_base_amount()))
+        }
+        mismatches = []
+        for account in accounts:
+            row = totals.get(account.pk, {})
+            expected = account.initial_balance + (row.get('net') or Decimal('0'))
+            expected_base = account.initial_balance + (row.get('base_net') or Decimal('0'))
+            if account.last_conversion_date is not None:
+                expected_base = account.base_currency_balance
+            if account.current_balance != expected or account.base_currency_balance != expected_base:
+                mismatches.append((account, expected, expected_base))
+                if repair:
+                    Account.objects.filter(pk=account.pk).update(
+                        current_balance=expected, base_currency_balance=expected_base
+                    )
+    return mismatches
+
+
+def apply_checkpoint_changes(changes):
+    """Shift checkpoints for an iterable of ``(old_values, new_values)`` pairs."""
+    deltas = defaultdict(Decimal)
+    for old, new in changes:
+        for values, sign in ((old, -1), (new, 1)):
+            if not values or values.get('is_archived'):
+                continue
+            deltas[values['account_id'], values['date']] += sign * signed_value(values)
+    for (account_id, day), delta in deltas.items():
+        if delta:
+            BalanceCheckpoint.objects.filter(account_id=account_id, date__gte=day).update(
+                balance=F('balance') + delta
+            )
+
+
+def balances_as_of(accounts, as_of):
+    """
+    Return the accounts of ``accounts`` with a ``balance`` attribute holding
+    their balance at the end of ``as_of``. Uses two queries regardless of
+    the number of accounts.
+    """
+    checkpoints = BalanceCheckpoint.objects.filter(account=OuterRef('pk'), date__lte=as_of).order_by('-date')
+    accounts = list(accounts.annotate(
+        checkpoint_date=Subquery(checkpoints.values('date')[:1]),
+        checkpoint_balance=Subquery(checkpoints.values('balance')[:1]),
+    ))
+    if not accounts:
+        return accounts
+
+    after_checkpoint = Q()
+    for account in accounts:
+        condition = Q(account_id=account.id)
+        if account.checkpoint_date is not None:
+            condition &= Q(date__gt=account.checkpoint_date)
+        after_checkpoint |= condition
+    tails = dict(
+        Transaction.objects.filter(after_checkpoint, is_archived=False, date__lte=as_of)
+        .order_by()
+        .values('account_id')
+        .annotate(net=Sum(signed_amount()))
+        .values_list('account_id', 'net')
+    )
+    for account in accounts:
+        account.balance = (
+            account.initial_balance
+            + (account.checkpoint_balance or Decimal('0'))
+            + (tails.get(account.id) or Decimal('0'))
+        )
+    return accounts
+
+
+def running_balances(account, transactions):
+    """
+    Map the ids of ``transactions`` (e.g. one page of a list) that belong to
+    ``account`` to the account balance right after each of them. The running
+    sum is taken with a window function over every counted transaction of
+    the account between the earliest and latest dates involved, so it stays
+    correct when the list itself is filtered.
+    """
+    rows = [t for t in transactions if t.account_id == account.id and not t.is_archived]
+    if not rows:
+        return {}
+    first = min(t.date for t in rows)
+    last = max(t.date for t in rows)
+    opening = balances_as_of(Account.objects.filter(pk=account.pk), first - timedelta(days=1))[0].balance
+
+    # Chronological order, the reverse of the list's (-date, -created_at, id)
+    window = Window(
+        Sum(signed_amount()),
+        order_by=[F('date').asc(), F('created_at').asc(), F('id').desc()],
+        frame=RowRange(start=None, end=0),
+    )
+    running = (
+        Transaction.objects.filter(account=account, is_archived=False, date__range=(first, last))
+        .order_by()
+        .annotate(running=window)
+        .values_list('id', 'running')
+    )
+    wanted = {t.id for t in rows}
+    return {pk: opening + total for pk, total in running if pk in wanted}
+
+
+def month_end(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def create_account_checkpoints(account_id, through):
+    """
+    Add a checkpoint at the end of every month with activity that ends on or
+    before ``through`` and is later than the account's latest checkpoint.
+    Returns the number of checkpoints created.
+    """
+    with db_transaction.atomic():
+        # Serialises with concurrent checkpoint creation for the same account
+        Account.objects.select_for_update().filter(pk=account_id).first()
+        latest = BalanceCheckpoint.objects.filter(account_id=account_id).order_by('-date').first()
+        if month_end(through) != through:
+            through = through.replace(day=1) - timedelta(days=1)
+
+        rows = Transaction.objects.filter(account_id=account_id, is_archived=False, date__lte=through)
+        balance = Decimal('0')
+        if latest is not None:
+            rows = rows.filter(date__gt=latest.date)
+            balance = latest.balance
+        months = (
+            rows.order_by()
+            .annotate(month=TruncMonth('date'))
+            .values('month')
+            .annotate(net=Sum(signed_amount()))
+            .order_by('month')
+        )
+        checkpoints = []
+        for row in months:
+            balance += row['net']
+            checkpoints.append(
+                BalanceCheckpoint(account_id=account_id, date=month_end(row['month']), balance=balance)
+            )
+        BalanceCheckpoint.objects.bulk_create(checkpoints)
+    return len(checkpoints)
@@ -0,0 +1,241 @@
+"""
+Batched create/update/delete of transactions.
+
+Every operation in a batch is validated up front, all referenced accounts,
+currencies, categories, tags and existing transactions are loaded with one
+set-based query per model, and the writes are issued with ``bulk_create`` /
+``bulk_update`` inside a single database transaction.
+"""
+from dataclasses import dataclass, field
+from uuid import UUID
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from accounts.models import Account, Currency
+from accounts.rates import RateResolver
+from .models import Transaction, Category, Tag
+from .serializers import BulkOperationSerializer, BulkTransactionItemSerializer
+from .derived import transactions_changed
+from .fingerprints import apply_fingerprint
+from .recurring import schedule
+
+MAX_BULK_OPERATIONS = 1000
+
+# Write-only serializer fields that map onto foreign keys
+REFERENCE_FIELDS = {
+    'account_id': 'account',
+    'currency_id': 'currency',
+    'category_id': 'category',
+}
+
+
+@dataclass
+class BulkItem:
+    index: int
+    op: str
+    id: UUID = None
+    data: dict = field(default_factory=dict)
+
+
+@dataclass
+class BulkReferences:
+    accounts: dict = field(default_factory=dict)
+    currencies: dict = field(default_factory=dict)
+    categories: dict = field(default_factory=dict)
+    tag_ids: set = field(default_factory=set)
+    transactions: dict = field(default_factory=dict)
+
+
+class BulkTransactionWriter:
+    """
+    Applies a list of ``{"op": "create"|"update"|"delete", "id": ..., "data": {...}}``
+    operations for one user. Either every operation is applied or, if any of
+    them is invalid, nothing is written and ``errors`` lists the problems by
+    operation index.
+    """
+    max_operations = MAX_BULK_OPERATIONS
+
+    def __init__(self, user):
+        self.user = user
+        self.errors = []
+
+    def add_error(self, index, errors):
+        self.errors.append({'index': index, 'errors': errors})
+
+    def execute(self, operations):
+        # Keep going after shape errors so every bad item is reported at once
+        items = self.validate_operations(operations)
+        with db_transaction.atomic():
+            references = self.load_references(items)
+            self.check_references(items, references)
+            if self.errors:
+                return None
+            return self.write(items, references)
+
+    def validate_operations(self, operations):
+        if not isinstance(operations, list):
+            self.add_error(None, {'non_field_errors': ['Expected a list of operations']})
+            return []
+        if len(operations) > self.max_operations:
+            self.add_error(None, {
+                'non_field_errors': [f'A batch may contain at most {self.max_operations} operations']
+            })
+            return []
+
+        items = []
+        seen_ids = set()
+        for index, raw in enumerate(operations):
+            operation = BulkOperationSerializer(data=raw)
+            if not operation.is_valid():
+                self.add_error(index, operation.errors)
+                continue
+            op = operation.validated_data['op']
+            transaction_id = operation.validated_data.get('id')
+            if op == 'create' and transaction_id:
+                self.add_error(index, {'id': ['id cannot be set when creating a transaction']})
+                continue
+            if transaction_id:
+                if transaction_id in seen_ids:
+                    self.add_error(index, {'id': ['Transaction appears more than once in this batch']})
+                    continue
+                seen_ids.add(transaction_id)
+
+            data = {}
+            if op != 'delete':
+                payload = BulkTransactionItemSerializer(
+                    data=operation.validated_data['data'],
+                    partial=(op == 'update')
+                )
+                if not payload.is_valid():
+                    self.add_error(index, payload.errors)
+                    continue
+                data = payload.validated_data
+            items.append(BulkItem(index=index, op=op, id=transaction_id, data=data))
+        return items
+
+    def load_references(self, items):
+        account_ids, currency_ids, category_ids, tag_ids, transaction_ids = set(), set(), set(), set(), set()
+        for item in items:
+            if item.id:
+                transaction_ids.add(item.id)
+            if item.data.get('account_id'):
+                account_ids.add(item.data['account_id'])
+            if item.data.get('currency_id'):
+                currency_ids.add(item.data['currency_id'])
+            if item.data.get('category_id'):
+                category_ids.add(item.data['category_id'])
+            tag_ids.update(item.data.get('tag_ids') or [])
+
+        references = BulkReferences()
+        if account_ids:
+            references.accounts = Account.objects.filter(user=self.user).in_bulk(account_ids)
+        if currency_ids:
+            references.currencies = Currency.objects.in_bulk(currency_ids)
+        if category_ids:
+            references.categories = Category.objects.filter(user=self.user).in_bulk(category_ids)
+        if tag_ids:
+            references.tag_ids = set(
+                Tag.objects.filter(user=self.user, id__in=tag_ids).values_list('id', flat=True)
+            )
+        if transaction_ids:
+            references.transactions = (
+                Transaction.objects.select_for_update().filter(user=self.user).in_bulk(transaction_ids)
+            )
+        return references
+
+    def check_references(self, items, references):
+        for item in items:
+            errors = {}
+            if item.op != 'create' and item.id not in references.transactions:
+                errors['id'] = ['Transaction not found']
+            data = item.data
+            if data.get('account_id') and data['account_id'] not in references.accounts:
+                errors['account_id'] = ['Account not found']
+            if data.get('currency_id') and data['currency_id'] not in references.currencies:
+                errors['currency_id'] = ['Currency not found']
+            if data.get('category_id') and data['category_id'] not in references.categories:
+                errors['category_id'] = ['Category not found']
+            if set(data.get('tag_ids') or []) - references.tag_ids:
+                errors['tag_ids'] = ['One or more tags not found']
+            if errors:
+                self.add_error(item.index, errors)
+
+    def apply_data(self, instance, data, references):
+        """Copy validated payload fields onto ``instance``; returns the model fields touched."""
+        lookups = {
+            'account_id': references.accounts,
+            'currency_id': references.currencies,
+            'category_id': references.categories,
+        }
+        changed = set()
+        for name, value in data.items():
+            if name == 'tag_ids':
+                continue
+            if name in REFERENCE_FIELDS:
+                value = lookups[name][value] if value else None
+                name = REFERENCE_FIELDS[name]
+            setattr(instance, name, value)
+            changed.add(name)
+        return changed
+
+    def write(self, items, references):
+        now = timezone.now()
+        to_create, to_update, to_delete = [], [], []
+        update_fields = {'updated_at', 'next_occurrence', 'exchange_rate', 'base_currency_amount', 'fingerprint'}
+        tags_by_transaction = {}
+        results = []
+
+        for item in items:
+            if item.op == 'delete':
+                to_delete.append(item.id)
+            elif item.op == 'create':
+                instance = Transaction(user=self.user)
+                self.apply_data(instance, item.data, references)
+                schedule(instance)
+                apply_fingerprint(instance)
+                to_create.append(instance)
+                item.id = instance.id
+            else:
+                instance = references.transactions[item.id]
+                update_fields |= self.apply_data(instance, item.data, references)
+                schedule(instance)
+                apply_fingerprint(instance)
+                instance.updated_at = now
+                to_update.append(instance)
+            if item.data.get('tag_ids') is not None:
+                tags_by_transaction[item.id] = item.data['tag_ids']
+            results.append({'index': item.index, 'op': item.op, 'id': item.id})
+
+        # Rates for every currency in the batch come from one lookup
+        resolver = RateResolver(self.user)
+        resolver.prefetch(
+            (instance.currency_id, resolver.base_currency_id)
+            for instance in to_create + to_update if resolver.base_currency_id
+        )
+        for instance in to_create + to_update:
+            instance.apply_exchange_rate(resolver)
+
+        if to_create:
+            Transaction.objects.bulk_create(to_create)
+        if to_update:
+            Transaction.objects.bulk_update(to_update, sorted(update_fields))
+        # bulk_create/bulk_update send no signals, so maintain derived data here
+        transactions_changed(
+            [(None, instance.current_values) for instance in to_create] +
+            [(instance.loaded_values, instance.current_values) for instance in to_update]
+        )
+        for instance in to_create + to_update:
+            instance.snapshot_loaded_values()
+        if tags_by_transaction:
+            through = Transaction.tags.through
+            through.objects.filter(transaction_id__in=list(tags_by_transaction)).delete()
+            through.objects.bulk_create([
+                through(transaction_id=transaction_id, tag_id=tag_id)
+                for transaction_id, tag_ids in tags_by_transaction.items()
+                for tag_id in set(tag_ids)
+            ])
+        if to_delete:
+            # Queryset deletes send post_delete per row, which updates derived data
+            Transaction.objects.filter(user=self.user, id__in=to_delete).delete()
+        return results
@@ -0,0 +1,45 @@
+"""
+Per-user data versions for caching derived transaction data.
+
+Every transaction write bumps the owner's version once the database
+transaction commits; cache keys embed the version, so stale entries are
+never read again and simply expire.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+
+
+def data_version_key(user_id):
+    return f'transactions:data-version:{user_id}'
+
+
+def get_data_version(user_id):
+    key = data_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter never repeats an old value
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(user_id):
+    key = data_version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_data_version_on_commit(user_id):
+    db_transaction.on_commit(lambda: bump_data_version(user_id))
+
+
+def versioned_key(prefix, user_id, params):
+    """Cache key for ``params`` (a JSON-serialisable dict) at the user's current data version."""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f'{prefix}:{user_id}:{get_data_version(user_id)}:{digest}'
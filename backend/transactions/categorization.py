@@ -0,0 +1,208 @@
+"""
+Automatic categorization of transactions from their descriptions.
+
+Two sources are tried in turn:
+
+* The user's ``CategorizationRule``s, in priority order. The first active
+  rule whose conditions hold supplies the category and tags.
+* A token index learned from the user's own history. It covers the
+  ``CATEGORIZATION_HISTORY_SIZE`` most recent transactions that carry a
+  category or tags. For every token of a normalized description (tokens
+  with digits are references or dates and are skipped), the index counts
+  how many transactions of each type contained it and how those were
+  labelled. A label's score is the share of a token's transactions that
+  carried it, averaged over the description's known tokens and weighted
+  by their inverse document frequency. Labels scoring at least
+  ``CATEGORIZATION_MIN_CONFIDENCE`` are assigned.
+
+The index is a plain dict cached under the user's data version, so it is
+built with two queries and reused until the user's transactions change.
+``Categorizer.classify`` handles a whole batch in one pass: each distinct
+description is tokenized and scored once, and the batch runs no queries.
+"""
+import math
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+
+from .caching import versioned_key
+from .fingerprints import normalize_description
+from .models import CategorizationRule, Category, Tag, Transaction
+
+INDEX_CACHE_PREFIX = 'transactions:categorizer'
+DIGIT = re.compile(r'\d')
+
+
+def tokenize(description):
+    """The distinct words of a description that can tell categories apart."""
+    return {
+        token for token in normalize_description(description).split()
+        if len(token) > 1 and not DIGIT.search(token)
+    }
+
+
+def build_index(user_id, history_size=None):
+    """
+    ``{type: {'count': n, 'tokens': {token: [document_count, {category_id: n}, {tag_id: n}]}}}``
+    learned from the user's most recent labelled transactions.
+    """
+    history_size = history_size or settings.CATEGORIZATION_HISTORY_SIZE
+    tagged = Transaction.tags.through.objects.filter(transaction_id=OuterRef('pk'))
+    rows = list(
+        Transaction.objects.filter(Q(category__isnull=False) | Exists(tagged), user_id=user_id,
+                                   duplicate_of__isnull=True, is_recurring=False)
+        .order_by('-date', '-created_at')
+        .values_list('id', 'type', 'description', 'category_id')[:history_size]
+    )
+    tags = defaultdict(list)
+    for transaction_id, tag_id in Transaction.tags.through.objects.filter(
+        transaction_id__in=[row[0] for row in rows]
+    ).values_list('transaction_id', 'tag_id'):
+        tags[transaction_id].append(str(tag_id))
+
+    index = {}
+    for transaction_id, transaction_type, description, category_id in rows:
+        by_type = index.setdefault(transaction_type, {'count': 0, 'tokens': {}})
+        by_type['count'] += 1
+        for token in tokenize(description):
+            entry = by_type['tokens'].setdefault(token, [0, {}, {}])
+            entry[0] += 1
+            if category_id:
+                entry[1][str(category_id)] = entry[1].get(str(category_id), 0) + 1
+            for tag_id in tags.get(transaction_id, ()):
+                entry[2][tag_id] = entry[2].get(tag_id, 0) + 1
+    return index
+
+
+def get_index(user_id):
+    """The user's index, from the cache while their transactions are unchanged."""
+    key = versioned_key(INDEX_CACHE_PREFIX, user_id, {'history': settings.CATEGORIZATION_HISTORY_SIZE})
+    index = cache.get(key)
+    if index is None:
+        index = build_index(user_id)
+        cache.set(key, index, timeout=settings.CATEGORIZATION_CACHE_TIMEOUT)
+    return index
+
+
+def score(by_type, tokens):
+    """``(category scores, tag scores)`` for one description's tokens."""
+    category_scores = defaultdict(float)
+    tag_scores = defaultdict(float)
+    total_weight = 0.0
+    for token in tokens:
+        entry = by_type['tokens'].get(token)
+        if entry is None:
+            continue
+        documents, categories, tags = entry
+        weight = math.log(1 + by_type['count'] / documents)
+        total_weight += weight
+        for category_id, count in categories.items():
+            category_scores[category_id] += weight * count / documents
+        for tag_id, count in tags.items():
+            tag_scores[tag_id] += weight * count / documents
+    if not total_weight:
+        return {}, {}
+    return (
+        {key: value / total_weight for key, value in category_scores.items()},
+        {key: value / total_weight for key, value in tag_scores.items()},
+    )
+
+
+class Categorizer:
+    """
+    Suggests categories and tags for a user's transactions. Loading takes
+    one query each for the rules, the user's active categories and tags,
+    and the index when it is not cached; ``classify`` runs none.
+    """
+
+    def __init__(self, user, min_confidence=None):
+        self.user = user
+        self.min_confidence = min_confidence if min_confidence is not None \
+            else settings.CATEGORIZATION_MIN_CONFIDENCE
+        self.rules = [
+            (rule, self.matcher(rule))
+            for rule in CategorizationRule.objects.filter(user=user, is_active=True)
+            .select_related('category').prefetch_related('tags')
+        ]
+        # Labels are only handed out while they exist and are active; the
+        # index may predate a deletion
+        self.categories = {
+            str(pk): category_type
+            for pk, category_type in Category.objects.filter(user=user, is_active=True).order_by().values_list('id', 'type')
+        }
+        self.tags = {
+            str(pk) for pk in Tag.objects.filter(user=user, is_active=True).order_by().values_list('id', flat=True)
+        }
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = get_index(self.user.id)
+        return self._index
+
+    @staticmethod
+    def matcher(rule):
+        if rule.match_type == 'REGEX':
+            return re.compile(rule.pattern, re.IGNORECASE).search
+        pattern = normalize_description(rule.pattern)
+        if rule.match_type == 'EXACT':
+            return lambda description: description == pattern
+        if rule.match_type == 'STARTS_WITH':
+            return lambda description: description.startswith(pattern)
+        return lambda description: pattern in description
+
+    def apply_rules(self, transaction):
+        normalized = normalize_description(transaction.description)
+        for rule, matches in self.rules:
+            if rule.transaction_type and rule.transaction_type != transaction.type:
+                continue
+            # A category only fits transactions of its own type
+            if rule.category and rule.category.type != transaction.type:
+                continue
+            if rule.account_id and rule.account_id != transaction.account_id:
+                continue
+            if rule.min_amount is not None and transaction.amount < rule.min_amount:
+                continue
+            if rule.max_amount is not None and transaction.amount > rule.max_amount:
+                continue
+            if matches(transaction.description if rule.match_type == 'REGEX' else normalized):
+                return rule.category_id, [tag.id for tag in rule.tags.all()]
+        return None
+
+    def predict(self, transaction_type, description):
+        by_type = self.index.get(transaction_type)
+        if by_type is None:
+            return None, []
+        category_scores, tag_scores = score(by_type, tokenize(description))
+        category_id = None
+        candidates = [
+            (value, key) for key, value in category_scores.items()
+            if value >= self.min_confidence and self.categories.get(key) == transaction_type
+        ]
+        if candidates:
+            category_id = max(candidates)[1]
+        tag_ids = sorted(key for key, value in tag_scores.items() if value >= self.min_confidence and key in self.tags)
+        return category_id, tag_ids
+
+    def classify(self, transactions):
+        """
+        ``(category_id, tag_ids)`` for each transaction (anything with
+        ``description``, ``type``, ``account_id`` and ``amount``), or None
+        where neither a rule nor the index has a suggestion.
+        """
+        predictions = {}
+        results = []
+        for transaction in transactions:
+            result = self.apply_rules(transaction)
+            if result is None:
+                key = (transaction.type, normalize_description(transaction.description))
+                if key not in predictions:
+                    predictions[key] = self.predict(*key)
+                category_id, tag_ids = predictions[key]
+                result = (category_id, tag_ids) if category_id or tag_ids else None
+            results.append(result)
+        return results
@@ -0,0 +1,25 @@
+"""
+Derived data kept in step with transaction writes.
+
+Every write path (model saves and deletes via signals, the bulk writer)
+reports what it changed as ``(old_values, new_values)`` pairs of
+``Transaction.TRACKED_FIELDS`` values; ``None`` stands for a row that did
+not exist before or no longer exists after the write.
+"""
+from . import balances, rollups, suggestions
+from .caching import bump_data_version_on_commit
+
+
+def transactions_changed(changes):
+    changes = list(changes)
+    if not changes:
+        return
+    # Deleting a transaction first nulls DescriptionSuggestion.last_transaction,
+    # so suggestions come first to keep one row lock order for every write
+    suggestions.apply_description_changes(changes)
+    rollups.apply_transaction_changes(changes)
+    balances.apply_account_balance_changes(changes)
+    balances.apply_checkpoint_changes(changes)
+    user_ids = {values['user_id'] for pair in changes for values in pair if values}
+    for user_id in user_ids:
+        bump_data_version_on_commit(user_id)
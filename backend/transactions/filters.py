@@ -0,0 +1,56 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F
+from rest_framework import filters
+
+# Must match the configuration used by the search trigger (migration 0006)
+SEARCH_CONFIG = 'simple'
+SEARCH_TERM_RE = re.compile(r'\w+')
+
+
+def uses_full_text_search(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def search_query(term):
+    """A prefix match on every word of ``term``, or None if it has no words."""
+    words = SEARCH_TERM_RE.findall(term)
+    if not words:
+        return None
+    raw = ' & '.join(f'{word}:*' for word in words)
+    return SearchQuery(raw, search_type='raw', config=SEARCH_CONFIG)
+
+
+class TransactionSearchFilter(filters.SearchFilter):
+    """
+    Ranked full-text search over ``Transaction.search_vector`` on PostgreSQL.
+    Every word of the search term must match as a prefix, so partially typed
+    words still find results. Other databases fall back to the default
+    ``icontains`` search over ``search_fields``.
+    """
+    rank_annotation = 'search_rank'
+
+    def get_search_query(self, request):
+        return search_query(' '.join(self.get_search_terms(request)))
+
+    def filter_queryset(self, request, queryset, view):
+        if not uses_full_text_search(queryset):
+            return super().filter_queryset(request, queryset, view)
+        query = self.get_search_query(request)
+        if query is None:
+            return queryset
+        return queryset.filter(search_vector=query).annotate(
+            **{self.rank_annotation: SearchRank(F('search_vector'), query)}
+        )
+
+
+class TransactionOrderingFilter(filters.OrderingFilter):
+    """Orders ranked search results by relevance unless an explicit ordering is requested."""
+
+    def filter_queryset(self, request, queryset, view):
+        rank = TransactionSearchFilter.rank_annotation
+        if rank in queryset.query.annotations and not request.query_params.get(self.ordering_param):
+            return queryset.order_by(f'-{rank}', *(self.get_default_ordering(view) or []))
+        return super().filter_queryset(request, queryset, view)
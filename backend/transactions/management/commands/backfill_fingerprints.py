@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from transactions.fingerprints import backfill_fingerprints
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Fill in duplicate-detection fingerprints for transactions written before they were maintained.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            action='append',
+            dest='emails',
+            help='Only fingerprint transactions of the user with this email address (can be repeated).',
+        )
+        parser.add_argument(
+            '--recompute',
+            action='store_true',
+            help='Recompute every fingerprint, e.g. after the normalization changed.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Transactions updated per query.')
+
+    def handle(self, *args, **options):
+        user_ids = [None]
+        if options['emails']:
+            user_ids = list(User.objects.filter(email__in=options['emails']).values_list('id', flat=True))
+        updated = sum(
+            backfill_fingerprints(user_id, recompute=options['recompute'], batch_size=max(1, options['batch_size']))
+            for user_id in user_ids
+        )
+        if options['verbosity'] >= 1:
+            self.stdout.write(f'Fingerprinted {updated} transactions')
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from accounts.models import Account
+from transactions.balances import create_account_checkpoints
+
+
+class Command(BaseCommand):
+    help = 'Add month-end balance checkpoints for every account up to the last complete month.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            action='append',
+            dest='emails',
+            help='Only checkpoint accounts of the user with this email address (can be repeated).',
+        )
+        parser.add_argument(
+            '--through',
+            help='Checkpoint months ending on or before this date (YYYY-MM-DD). Defaults to today.',
+        )
+
+    def handle(self, *args, **options):
+        through = timezone.localdate()
+        if options['through']:
+            through = parse_date(options['through'])
+            if through is None:
+                raise CommandError('--through must be a date in YYYY-MM-DD format')
+
+        accounts = Account.objects.order_by('created_at')
+        if options['emails']:
+            accounts = accounts.filter(user__email__in=options['emails'])
+        account_ids = list(accounts.values_list('id', flat=True))
+        created = sum(create_account_checkpoints(account_id, through) for account_id in account_ids)
+
+        if options['verbosity'] >= 1:
+            self.stdout.write(f"Created {created} checkpoints for {len(account_ids)} accounts")
@@ -0,0 +1,57 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+from transactions.rollups import rebuild_user_rollups
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily transaction rollup table from raw transactions, one user per worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            action='append',
+            dest='emails',
+            help='Only rebuild rollups for the user with this email address (can be repeated).',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of users rebuilt in parallel. Defaults to the number of CPUs.',
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('email')
+        if options['emails']:
+            users = users.filter(email__in=options['emails'])
+        user_ids = list(users.values_list('id', flat=True))
+        workers = max(1, options['workers'])
+
+        started = time.monotonic()
+        if workers == 1:
+            results = map(rebuild_user_rollups, user_ids)
+            rows = sum(results)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                rows = sum(executor.map(self.rebuild_in_thread, user_ids))
+
+        if options['verbosity'] >= 1:
+            self.stdout.write(
+                f"Rebuilt {rows} rollup rows for {len(user_ids)} users "
+                f"in {time.monotonic() - started:.2f}s"
+            )
+
+    def rebuild_in_thread(self, user_id):
+        try:
+            return rebuild_user_rollups(user_id)
+        finally:
+            # Each worker thread opens its own connection
+            connections.close_all()
@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+from transactions.balances import reconcile_user_balances
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Verify stored account balances against their transactions and repair any that drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            action='append',
+            dest='emails',
+            help='Only reconcile accounts of the user with this email address (can be repeated).',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of users reconciled in parallel. Defaults to the number of CPUs.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report mismatched balances without changing them.',
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('email')
+        if options['emails']:
+            users = users.filter(email__in=options['emails'])
+        user_ids = list(users.values_list('id', flat=True))
+        workers = max(1, options['workers'])
+        self.repair = not options['dry_run']
+
+        if workers == 1:
+            results = list(map(self.reconcile, user_ids))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self.reconcile_in_thread, user_ids))
+
+        mismatches = [mismatch for result in results for mismatch in result]
+        if options['verbosity'] >= 1:
+            for account, expected, expected_base in mismatches:
+                self.stdout.write(
+                    f"{account.user_id} {account.name}: current_balance {account.current_balance} -> {expected}, "
+                    f"base_currency_balance {account.base_currency_balance} -> {expected_base}"
+                )
+            action = 'Repaired' if self.repair else 'Found'
+            self.stdout.write(f"{action} {len(mismatches)} mismatched accounts for {len(user_ids)} users")
+
+    def reconcile(self, user_id):
+        return reconcile_user_balances(user_id, repair=self.repair)
+
+    def reconcile_in_thread(self, user_id):
+        try:
+            return self.reconcile(user_id)
+        finally:
+            # Each worker thread opens its own connection
+            connections.close_all()
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rollups(apps, schema_editor):
+    Transaction = apps.get_model('transactions', 'Transaction')
+    DailyTransactionSummary = apps.get_model('transactions', 'DailyTransactionSummary')
+    rows = (
+        Transaction.objects.filter(is_archived=False)
+        .order_by()
+        .values('user_id', 'account_id', 'category_id', 'type', 'currency_id', 'date')
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+    DailyTransactionSummary.objects.bulk_create(
+        (DailyTransactionSummary(**row) for row in rows.iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+        ('transactions', '0004_transaction_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTransactionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('INCOME', 'Income'), ('EXPENSE', 'Expense'), ('TRANSFER', 'Transfer')], max_length=10)),
+                ('date', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('count', models.IntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_transaction_summaries', to='accounts.account')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_transaction_summaries', to='transactions.category')),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='daily_transaction_summaries', to='accounts.currency')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_transaction_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['user', 'date'], name='transaction_user_id_2b8641_idx'), models.Index(fields=['account', 'date'], name='transaction_account_272aaf_idx')],
+                'unique_together': {('user', 'account', 'category', 'type', 'currency', 'date')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:11
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The search vector is only maintained on PostgreSQL; other backends keep
+# using the plain ``icontains`` search.
+CREATE_SEARCH_SQL = """
+CREATE FUNCTION transactions_transaction_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(
+            (SELECT name FROM transactions_category WHERE id = NEW.category_id), ''
+        )), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER transactions_transaction_search_vector_trigger
+BEFORE INSERT OR UPDATE OF description, category_id ON transactions_transaction
+FOR EACH ROW EXECUTE FUNCTION transactions_transaction_search_vector_update();
+
+CREATE FUNCTION transactions_category_name_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE transactions_transaction SET category_id = category_id WHERE category_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER transactions_category_name_trigger
+AFTER UPDATE OF name ON transactions_category
+FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+EXECUTE FUNCTION transactions_category_name_update();
+
+UPDATE transactions_transaction SET description = description;
+
+CREATE INDEX transaction_search_vector_idx ON transactions_transaction USING gin (search_vector);
+"""
+
+DROP_SEARCH_SQL = """
+DROP INDEX IF EXISTS transaction_search_vector_idx;
+DROP TRIGGER IF EXISTS transactions_category_name_trigger ON transactions_category;
+DROP FUNCTION IF EXISTS transactions_category_name_update();
+DROP TRIGGER IF EXISTS transactions_transaction_search_vector_trigger ON transactions_transaction;
+DROP FUNCTION IF EXISTS transactions_transaction_search_vector_update();
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_SQL)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0005_dailytransactionsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
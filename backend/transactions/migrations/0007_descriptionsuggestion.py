@@ -0,0 +1,73 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+
+
+def populate_suggestions(apps, schema_editor):
+    Transaction = apps.get_model('transactions', 'Transaction')
+    DescriptionSuggestion = apps.get_model('transactions', 'DescriptionSuggestion')
+    latest = Transaction.objects.filter(
+        user_id=OuterRef('user_id'), description=OuterRef('description')
+    ).order_by('-date', '-created_at').values('id')[:1]
+    rows = (
+        Transaction.objects.order_by()
+        .values('user_id', 'description')
+        .annotate(usage_count=Count('id'), last_used=Max('date'), last_transaction_id=Subquery(latest))
+    )
+    DescriptionSuggestion.objects.bulk_create(
+        (DescriptionSuggestion(**row) for row in rows.iterator()),
+        batch_size=1000
+    )
+
+
+def create_trigram_index(apps, schema_editor):
+    # pg_trgm ships with PostgreSQL contrib; without it suggestions fall back
+    # to substring matching
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX description_suggestion_trgm_idx ON transactions_descriptionsuggestion '
+        'USING gin (description gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS description_suggestion_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_transaction_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DescriptionSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.CharField(max_length=200)),
+                ('usage_count', models.PositiveIntegerField(default=0)),
+                ('last_used', models.DateField(null=True)),
+                ('last_transaction', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='transactions.transaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='description_suggestions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-usage_count', 'description'],
+                'indexes': [models.Index(fields=['user', '-usage_count'], name='transaction_user_id_196f26_idx')],
+                'unique_together': {('user', 'description')},
+            },
+        ),
+        migrations.RunPython(populate_suggestions, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:20
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Case, F, Sum, When
+
+
+def recount_balances(apps, schema_editor):
+    # Balances were never updated by transaction writes before; start the
+    # incremental maintenance from a full recount
+    Account = apps.get_model('accounts', 'Account')
+    Transaction = apps.get_model('transactions', 'Transaction')
+    totals = {
+        row['account_id']: row
+        for row in Transaction.objects.filter(is_archived=False)
+        .order_by()
+        .values('account_id')
+        .annotate(
+            net=Sum(Case(When(type='INCOME', then=F('amount')), default=-F('amount'))),
+            base_net=Sum(Case(
+                When(type='INCOME', then=F('base_currency_amount')), default=-F('base_currency_amount')
+            )),
+        )
+    }
+    accounts = list(Account.objects.all())
+    for account in accounts:
+        row = totals.get(account.pk, {})
+        account.current_balance = account.initial_balance + (row.get('net') or Decimal('0'))
+        account.base_currency_balance = account.initial_balance + (row.get('base_net') or Decimal('0'))
+    Account.objects.bulk_update(accounts, ['current_balance', 'base_currency_balance'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_balancecheckpoint'),
+        ('transactions', '0007_descriptionsuggestion'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:24
+
+from datetime import datetime, time
+
+import django.db.models.deletion
+from dateutil.rrule import rrulestr
+from django.conf import settings
+from django.db import migrations, models
+
+
+def schedule_templates(apps, schema_editor):
+    # Existing templates start generating after their own date; rules that
+    # do not parse are left unscheduled
+    Transaction = apps.get_model('transactions', 'Transaction')
+    templates = []
+    for template in Transaction.objects.filter(is_recurring=True).exclude(recurring_rule=None).iterator():
+        rule = template.recurring_rule
+        if not isinstance(rule, dict) or not isinstance(rule.get('rrule'), str):
+            continue
+        start = datetime.combine(template.date, time.min)
+        try:
+            moment = rrulestr(rule['rrule'], dtstart=start).after(start)
+        except (ValueError, TypeError):
+            continue
+        if moment:
+            template.next_occurrence = moment.date()
+            templates.append(template)
+    Transaction.objects.bulk_update(templates, ['next_occurrence'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_balancecheckpoint'),
+        ('transactions', '0008_recount_account_balances'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='next_occurrence',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='recurring_parent',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='transactions.transaction'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('is_recurring', True)), fields=['next_occurrence'], name='txn_recurring_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('recurring_parent__isnull', False)), fields=('recurring_parent', 'date'), name='txn_unique_occurrence'),
+        ),
+        migrations.RunPython(schedule_templates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.14 on 2026-10-17 00:55
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_balancecheckpoint'),
+        ('transactions', '0010_transaction_fingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorizationRule',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=100)),
+                ('match_type', models.CharField(choices=[('CONTAINS', 'Contains'), ('STARTS_WITH', 'Starts with'), ('EXACT', 'Exact'), ('REGEX', 'Regular expression')], default='CONTAINS', max_length=11)),
+                ('pattern', models.CharField(max_length=200)),
+                ('transaction_type', models.CharField(blank=True, choices=[('INCOME', 'Income'), ('EXPENSE', 'Expense'), ('TRANSFER', 'Transfer')], max_length=10, null=True)),
+                ('min_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('max_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('priority', models.PositiveIntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='categorization_rules', to='accounts.account')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='categorization_rules', to='transactions.category')),
+                ('tags', models.ManyToManyField(blank=True, related_name='categorization_rules', to='transactions.tag')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='categorization_rules', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['priority', 'created_at'],
+                'indexes': [models.Index(fields=['user', 'is_active', 'priority'], name='transaction_user_id_37d89a_idx')],
+            },
+        ),
+    ]
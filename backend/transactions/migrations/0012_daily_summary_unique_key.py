@@ -0,0 +1,49 @@
+# Generated by Django 5.0.14 on 2026-10-17 12:10
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+KEY_FIELDS = ('user_id', 'account_id', 'category_id', 'type', 'currency_id', 'date')
+
+
+def merge_uncategorized_rows(apps, schema_editor):
+    # The old unique_together let uncategorized keys have several rows;
+    # fold them into one before the constraint forbids it
+    DailyTransactionSummary = apps.get_model('transactions', 'DailyTransactionSummary')
+    duplicates = (
+        DailyTransactionSummary.objects.filter(category__isnull=True)
+        .order_by()
+        .values(*KEY_FIELDS)
+        .annotate(rows=Count('id'), sum_total=Sum('total'), sum_count=Sum('count'))
+        .filter(rows__gt=1)
+    )
+    for key in duplicates:
+        rows = DailyTransactionSummary.objects.filter(**{name: key[name] for name in KEY_FIELDS})
+        keep = rows.order_by('pk').first()
+        rows.exclude(pk=keep.pk).delete()
+        if key['sum_count'] > 0:
+            rows.update(total=key['sum_total'], count=key['sum_count'])
+        else:
+            rows.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0011_categorizationrule'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_uncategorized_rows, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='dailytransactionsummary',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='dailytransactionsummary',
+            constraint=models.UniqueConstraint(
+                fields=('user', 'account', 'category', 'type', 'currency', 'date'),
+                name='daily_summary_unique_key', nulls_distinct=False
+            ),
+        ),
+    ]
@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction as db_transaction
 from django.core.validators import MinValueValidator
+from django.contrib.postgres.search import SearchVectorField
 from users.base import UUIDModel
 
 class Transaction(UUIDModel):
@@ -22,7 +23,26 @@ class Transaction(UUIDModel):
     tags = models.ManyToManyField('Tag', related_name='transactions', blank=True)
     is_recurring = models.BooleanField(default=False)
     recurring_rule = models.JSONField(null=True, blank=True)  # For storing recurrence rules
+    # Set on recurring templates by ``transactions.recurring``; the first occurrence not yet generated
+    next_occurrence = models.DateField(null=True, blank=True, editable=False)
+    recurring_parent = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='occurrences'
+    )
     is_archived = models.BooleanField(default=False)
+    # Id of the transaction on the bank statement it was imported from
+    external_id = models.CharField(max_length=100, null=True, blank=True)
+    # Kept current on every write, see ``transactions.fingerprints``
+    fingerprint = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    import_job = models.ForeignKey(
+        'files.ImportJob', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='transactions'
+    )
+    # Set on imported rows that were kept although they match an existing transaction
+    duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='duplicates'
+    )
+    # Maintained by a database trigger on PostgreSQL (see migration 0006)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ['-date', '-created_at']
@@ -30,11 +50,75 @@ class Transaction(UUIDModel):
             models.Index(fields=['user', 'date']),
             models.Index(fields=['account', 'type']),
             models.Index(fields=['category']),
+            # Keyset pagination seeks on the default ordering plus id
+            models.Index(fields=['user', '-date', '-created_at', 'id'], name='txn_user_keyset_idx'),
+            models.Index(fields=['account', '-date', '-created_at', 'id'], name='txn_account_keyset_idx'),
+            # Only recurring templates are scanned for due occurrences
+            models.Index(
+                fields=['next_occurrence'], name='txn_recurring_due_idx', condition=models.Q(is_recurring=True)
+            ),
+            # Duplicate detection looks up a whole import chunk at once
+            models.Index(fields=['user', 'fingerprint'], name='txn_fingerprint_idx'),
+            models.Index(
+                fields=['account', 'external_id'], name='txn_external_id_idx',
+                condition=models.Q(external_id__isnull=False)
+            ),
+        ]
+        constraints = [
+            # Makes occurrence generation idempotent
+            models.UniqueConstraint(
+                fields=['recurring_parent', 'date'], name='txn_unique_occurrence',
+                condition=models.Q(recurring_parent__isnull=False)
+            ),
         ]
 
     def __str__(self):
         return f"{self.get_type_display()} - {self.amount} {self.currency.code} - {self.date}"
 
+    # Fields whose stored values derived data (rollups, balances) depends on
+    TRACKED_FIELDS = (
+        'id', 'user_id', 'account_id', 'category_id', 'type', 'currency_id', 'date', 'amount', 'is_archived',
+        'description', 'base_currency_amount', 'is_recurring', 'recurring_rule',
+    )
+
+    def save(self, *args, **kwargs):
+        # Signal handlers update derived data; keep them in the row's transaction
+        with db_transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with db_transaction.atomic(using=kwargs.get('using')):
+            return super().delete(*args, **kwargs)
+
+    def apply_exchange_rate(self, resolver):
+        """Set ``exchange_rate`` and ``base_currency_amount`` using an ``accounts.rates.RateResolver``."""
+        self.exchange_rate, self.base_currency_amount = resolver.to_base(self.amount, self.currency_id, self.date)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_loaded_values()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.snapshot_loaded_values()
+
+    def snapshot_loaded_values(self):
+        """Remember the tracked field values as they are stored in the database."""
+        self._loaded_values = {
+            name: self.__dict__[name] for name in self.TRACKED_FIELDS if name in self.__dict__
+        }
+
+    @property
+    def loaded_values(self):
+        """Tracked values as last read from or written to the database, or None if unsaved."""
+        return getattr(self, '_loaded_values', None)
+
+    @property
+    def current_values(self):
+        return {name: getattr(self, name) for name in self.TRACKED_FIELDS}
+
 class Category(UUIDModel):
     CATEGORY_TYPES = [
         ('INCOME', 'Income'),
@@ -77,3 +161,98 @@ class Tag(UUIDModel):
 
     def __str__(self):
         return self.name
+
+class CategorizationRule(UUIDModel):
+    """
+    A user-defined rule assigning a category and tags to imported
+    transactions whose description matches. Rules are tried in priority
+    order before the learned categorizer (see ``transactions.categorization``).
+    """
+    MATCH_TYPES = [
+        ('CONTAINS', 'Contains'),
+        ('STARTS_WITH', 'Starts with'),
+        ('EXACT', 'Exact'),
+        ('REGEX', 'Regular expression'),
+    ]
+
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='categorization_rules')
+    name = models.CharField(max_length=100)
+    match_type = models.CharField(max_length=11, choices=MATCH_TYPES, default='CONTAINS')
+    pattern = models.CharField(max_length=200)
+    # Optional conditions besides the description
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES, null=True, blank=True)
+    account = models.ForeignKey('accounts.Account', on_delete=models.CASCADE, null=True, blank=True,
+                                related_name='categorization_rules')
+    min_amount = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    max_amount = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    category = models.ForeignKey('Category', on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='categorization_rules')
+    tags = models.ManyToManyField('Tag', related_name='categorization_rules', blank=True)
+    priority = models.PositiveIntegerField(default=0)  # Lower runs first
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['priority', 'created_at']
+        indexes = [
+            models.Index(fields=['user', 'is_active', 'priority']),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class DailyTransactionSummary(models.Model):
+    """
+    Totals of non-archived transactions per (user, account, category, type,
+    currency, day). Maintained incrementally by ``transactions.rollups`` on
+    every transaction write so statistics never have to scan raw rows.
+    """
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='daily_transaction_summaries')
+    account = models.ForeignKey('accounts.Account', on_delete=models.CASCADE, related_name='daily_transaction_summaries')
+    category = models.ForeignKey('Category', on_delete=models.SET_NULL, null=True, related_name='daily_transaction_summaries')
+    type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    currency = models.ForeignKey('accounts.Currency', on_delete=models.PROTECT, related_name='daily_transaction_summaries')
+    date = models.DateField()
+    total = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['user', 'date']),
+            models.Index(fields=['account', 'date']),
+        ]
+        constraints = [
+            # One row per key, uncategorized rows included
+            models.UniqueConstraint(
+                fields=['user', 'account', 'category', 'type', 'currency', 'date'],
+                name='daily_summary_unique_key', nulls_distinct=False
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.type} {self.total} ({self.count})"
+
+
+class DescriptionSuggestion(models.Model):
+    """
+    One row per distinct description a user has entered, with how often it
+    is used and the latest transaction using it (for its category and tags).
+    Maintained by ``transactions.suggestions`` and searched with a trigram
+    index on PostgreSQL.
+    """
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='description_suggestions')
+    description = models.CharField(max_length=200)
+    usage_count = models.PositiveIntegerField(default=0)
+    last_used = models.DateField(null=True)
+    last_transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, related_name='+')
+
+    class Meta:
+        unique_together = ['user', 'description']
+        ordering = ['-usage_count', 'description']
+        indexes = [
+            models.Index(fields=['user', '-usage_count']),
+        ]
+
+    def __str__(self):
+        return f"{self.description} ({self.usage_count})"
@@ -0,0 +1,184 @@
+import json
+import uuid
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a composite ordering.
+
+    Unlike ``PageNumberPagination`` this never issues a ``COUNT(*)`` and never
+    uses ``OFFSET``: each page is fetched with a ``WHERE (key) < (cursor)``
+    predicate that an index on the ordering columns can answer directly, so
+    the cost of a page does not depend on how deep the client has scrolled.
+    Cursors are opaque base64 tokens holding the key of the boundary row.
+    """
+    ordering = ()
+    # Parsers used to turn cursor values back into python objects, by field.
+    field_parsers = {}
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        position, reverse = self.decode_cursor(request)
+        ordering = self.get_ordering(reverse)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(position, reverse))
+
+        # Fetch one extra row to know whether there is another page.
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        return self.page
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, reverse=False):
+        if not reverse:
+            return list(self.ordering)
+        return [
+            field[1:] if field.startswith('-') else '-' + field
+            for field in self.ordering
+        ]
+
+    def get_seek_filter(self, position, reverse=False):
+        """
+        Build the row-value comparison ``(a, b, c) > (x, y, z)`` as nested
+        ``Q`` objects, honouring each field's direction.
+        """
+        seek = Q()
+        equal = Q()
+        for field in self.get_ordering(reverse):
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            lookup = 'lt' if descending else 'gt'
+            seek |= equal & Q(**{f'{name}__{lookup}': position[name]})
+            equal &= Q(**{name: position[name]})
+        return seek
+
+    def get_position(self, instance):
+        return {
+            field.lstrip('-'): getattr(instance, field.lstrip('-'))
+            for field in self.ordering
+        }
+
+    def encode_cursor(self, position, reverse=False):
+        tokens = {name: str(value) for name, value in position.items()}
+        if reverse:
+            tokens['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(tokens).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            tokens = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            if not isinstance(tokens, dict):
+                raise ValueError(tokens)
+            reverse = bool(tokens.pop('r', False))
+            position = {}
+            for field in self.ordering:
+                name = field.lstrip('-')
+                parser = self.field_parsers.get(name, str)
+                position[name] = parser(tokens[name])
+                if position[name] is None:
+                    raise ValueError(name)
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class TransactionCursorPagination(KeysetPagination):
+    """Keyset pagination following the default transaction ordering."""
+    ordering = ('-date', '-created_at', 'id')
+    field_parsers = {
+        'date': parse_date,
+        'created_at': parse_datetime,
+        'id': uuid.UUID,
+    }
@@ -0,0 +1,174 @@
+"""
+Expansion of recurring transactions.
+
+A transaction with ``is_recurring`` set is a template: it is itself the
+first occurrence, and its ``recurring_rule`` holds an RFC 5545 recurrence
+rule, e.g. ``{"rrule": "FREQ=MONTHLY;BYMONTHDAY=1;COUNT=12"}``, anchored at
+the template's date. ``next_occurrence`` points at the first occurrence not
+generated yet, so finding due work only touches recurring rows through a
+partial index. Generated occurrences are ordinary transactions linked back
+through ``recurring_parent``; a unique constraint on (parent, date) keeps
+reruns from duplicating them.
+"""
+import heapq
+from datetime import datetime, time
+from itertools import islice
+
+from dateutil.rrule import rrulestr
+from django.db import transaction as db_transaction
+
+from accounts.rates import RateResolver
+
+from .derived import transactions_changed
+from .fingerprints import apply_fingerprint
+from .models import Transaction
+
+# Occurrences generated for one template per pass; a template that is
+# further behind is picked up again by the next pass of the same run
+MAX_OCCURRENCES_PER_PASS = 500
+TEMPLATES_PER_PASS = 200
+
+# Fields copied from a template onto each occurrence
+COPIED_FIELDS = (
+    'user_id', 'account_id', 'type', 'amount', 'currency_id', 'base_currency_amount', 'exchange_rate',
+    'description', 'category_id',
+)
+
+
+def build_rule(recurring_rule, start):
+    """Return the dateutil rule for a ``recurring_rule`` value; raises ValueError if it is invalid."""
+    if not isinstance(recurring_rule, dict) or not isinstance(recurring_rule.get('rrule'), str):
+        raise ValueError('recurring_rule must be an object with an "rrule" string')
+    try:
+        return rrulestr(recurring_rule['rrule'], dtstart=datetime.combine(start, time.min))
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f'Invalid rrule: {exc}') from exc
+
+
+def occurrences(template, start):
+    """Yield the template's occurrence dates on or after ``start``."""
+    rule = build_rule(template.recurring_rule, template.date)
+    for moment in rule.xafter(datetime.combine(start, time.min), inc=True):
+        yield moment.date()
+
+
+def first_occurrence(template):
+    """The first occurrence after the template's own date, or None."""
+    if not template.is_recurring or not template.recurring_rule:
+        return None
+    rule = build_rule(template.recurring_rule, template.date)
+    moment = rule.after(datetime.combine(template.date, time.min))
+    return moment.date() if moment else None
+
+
+def schedule(template):
+    """
+    Set ``next_occurrence`` for a template that is new or whose rule, date or
+    recurring flag changed; other edits keep the generation progress.
+    """
+    loaded = template.loaded_values
+    if loaded and all(loaded.get(name) == getattr(template, name)
+                      for name in ('date', 'is_recurring', 'recurring_rule')):
+        return
+    template.next_occurrence = first_occurrence(template)
+
+
+def materialize_due(until, user_id=None):
+    """
+    Create every occurrence dated on or before ``until`` that has not been
+    generated yet, for all users or one. Templates are claimed with
+    ``SKIP LOCKED`` so parallel runs split the work. Returns the number of
+    transactions created.
+    """
+    created = 0
+    while True:
+        with db_transaction.atomic():
+            templates = Transaction.objects.filter(
+                is_recurring=True, next_occurrence__lte=until, is_archived=False
+            )
+            if user_id is not None:
+                templates = templates.filter(user_id=user_id)
+            templates = list(
+                templates.select_for_update(skip_locked=True, of=('self',))
+                .select_related('user')
+                .order_by('next_occurrence')
+                .prefetch_related('tags')[:TEMPLATES_PER_PASS]
+            )
+            if not templates:
+                return created
+            created += materialize(templates, until)
+
+
+def materialize(templates, until):
+    dates_by_template = {}
+    for template in templates:
+        dates = []
+        start, template.next_occurrence = template.next_occurrence, None
+        for day in occurrences(template, start):
+            if day > until or len(dates) == MAX_OCCURRENCES_PER_PASS:
+                template.next_occurrence = day
+                break
+            dates.append(day)
+        dates_by_template[template.id] = dates
+
+    existing = set(
+        Transaction.objects.filter(recurring_parent__in=[t.id for t in templates])
+        .values_list('recurring_parent_id', 'date')
+    )
+    new = []
+    tags = []
+    for template in templates:
+        for day in dates_by_template[template.id]:
+            if (template.id, day) in existing:
+                continue
+            occurrence = Transaction(
+                date=day, recurring_parent_id=template.id,
+                **{name: getattr(template, name) for name in COPIED_FIELDS}
+            )
+            apply_fingerprint(occurrence)
+            new.append(occurrence)
+            tags.extend((occurrence.id, tag.id) for tag in template.tags.all())
+
+    # Each occurrence is converted at its own date
+    resolvers = {}
+    for template in templates:
+        if template.user_id not in resolvers:
+            resolvers[template.user_id] = RateResolver(template.user)
+    for resolver in resolvers.values():
+        resolver.prefetch(
+            (template.currency_id, resolver.base_currency_id)
+            for template in templates
+            if template.user_id == resolver.user_id and resolver.base_currency_id
+        )
+    for occurrence in new:
+        occurrence.apply_exchange_rate(resolvers[occurrence.user_id])
+
+    Transaction.objects.bulk_create(new, batch_size=1000)
+    Transaction.objects.bulk_update(templates, ['next_occurrence'])
+    transactions_changed([(None, occurrence.current_values) for occurrence in new])
+    if tags:
+        through = Transaction.tags.through
+        through.objects.bulk_create(
+            [through(transaction_id=transaction_id, tag_id=tag_id) for transaction_id, tag_id in tags],
+            batch_size=1000
+        )
+    return len(new)
+
+
+def preview_occurrences(user, count, after=None):
+    """
+    The next ``count`` occurrences that would be generated for ``user``,
+    across all templates in date order, without writing anything. Returns
+    ``(template, date)`` pairs.
+    """
+    templates = Transaction.objects.filter(
+        user=user, is_recurring=True, next_occurrence__isnull=False, is_archived=False
+    ).select_related('currency', 'account', 'category')
+
+    def stream(template):
+        start = template.next_occurrence if after is None else max(template.next_occurrence, after)
+        for day in occurrences(template, start):
+            yield day, str(template.id), template
+
+    merged = heapq.merge(*(stream(template) for template in templates), key=lambda item: item[:2])
+    return [(template, day) for day, _, template in islice(merged, count)]
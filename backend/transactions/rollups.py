@@ -0,0 +1,99 @@
+"""
+Incremental maintenance of ``DailyTransactionSummary``.
+
+Writes describe what changed as ``(old, new)`` pairs of tracked transaction
+values (``None`` for "did not exist"). The pairs are folded into one delta per
+rollup key and applied with ``F()`` expressions, so concurrent writers never
+lose an update.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Sum
+
+from .models import DailyTransactionSummary, Transaction
+
+ROLLUP_KEY_FIELDS = ('user_id', 'account_id', 'category_id', 'type', 'currency_id', 'date')
+
+
+def contribution(values):
+    """Return ``(key, amount)`` for a transaction state, or None if it is not counted."""
+    if not values or values.get('is_archived'):
+        return None
+    return tuple(values[name] for name in ROLLUP_KEY_FIELDS), values['amount']
+
+
+def collect_deltas(changes):
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for old, new in changes:
+        for values, sign in ((old, -1), (new, 1)):
+            counted = contribution(values)
+            if counted is None:
+                continue
+            key, amount = counted
+            deltas[key][0] += sign * Decimal(amount)
+            deltas[key][1] += sign
+    return deltas
+
+
+def apply_deltas(deltas):
+    for key, (amount, count) in deltas.items():
+        if not amount and not count:
+            continue
+        filters = dict(zip(ROLLUP_KEY_FIELDS, key))
+        pk = DailyTransactionSummary.objects.filter(**filters).order_by('pk').values_list('pk', flat=True).first()
+        rows = DailyTransactionSummary.objects.filter(pk=pk)
+        updated = pk is not None and rows.update(total=F('total') + amount, count=F('count') + count)
+        if not updated:
+            # Nothing to subtract from (e.g. the account is being deleted)
+            if count <= 0:
+                continue
+            try:
+                with db_transaction.atomic():
+                    DailyTransactionSummary.objects.create(total=amount, count=count, **filters)
+            except IntegrityError:
+                # Another writer created the row first
+                DailyTransactionSummary.objects.filter(**filters).update(
+                    total=F('total') + amount, count=F('count') + count
+                )
+        elif count < 0:
+            rows.filter(count__lte=0).delete()
+
+
+def apply_transaction_changes(changes):
+    """Update the rollup for an iterable of ``(old_values, new_values)`` pairs."""
+    apply_deltas(collect_deltas(changes))
+
+
+def merge_category_rollups(category):
+    """
+    Move a category's rows onto the matching uncategorized rows, as its
+    transactions lose their category when it is deleted.
+    """
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    rows = DailyTransactionSummary.objects.filter(category=category).values_list(*ROLLUP_KEY_FIELDS, 'total', 'count')
+    for *key, total, count in rows:
+        uncategorized = list(key)
+        uncategorized[ROLLUP_KEY_FIELDS.index('category_id')] = None
+        for target, sign in ((tuple(key), -1), (tuple(uncategorized), 1)):
+            deltas[target][0] += sign * total
+            deltas[target][1] += sign * count
+    apply_deltas(deltas)
+
+
+def rebuild_user_rollups(user_id):
+    """Recompute every rollup row of one user from raw transactions; returns the row count."""
+    with db_transaction.atomic():
+        DailyTransactionSummary.objects.filter(user_id=user_id).delete()
+        rows = (
+            Transaction.objects.filter(user_id=user_id, is_archived=False)
+            .order_by()
+            .values(*ROLLUP_KEY_FIELDS)
+            .annotate(total=Sum('amount'), count=Count('id'))
+        )
+        summaries = DailyTransactionSummary.objects.bulk_create(
+            (DailyTransactionSummary(**row) for row in rows),
+            batch_size=1000
+        )
+    return len(summaries)
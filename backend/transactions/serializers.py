@@ -1,6 +1,10 @@
+from datetime import date
+import re
 from rest_framework import serializers
-from .models import Transaction, Category, Tag
+from .models import Transaction, Category, Tag, DescriptionSuggestion, CategorizationRule
+from .recurring import build_rule
 from accounts.models import Account, Currency
+from accounts.rates import RateResolver
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -35,16 +39,19 @@ class TransactionSerializer(serializers.ModelSerializer):
     currency_id = serializers.UUIDField(write_only=True, required=True)
     account = serializers.SerializerMethodField()
     account_id = serializers.UUIDField(write_only=True, required=True)
+    running_balance = serializers.SerializerMethodField()
 
     class Meta:
         model = Transaction
         fields = [
             'id', 'type', 'amount', 'currency', 'currency_id', 'base_currency_amount',
             'exchange_rate', 'description', 'date', 'category', 'category_id',
-            'tags', 'tag_ids', 'is_recurring', 'recurring_rule', 'is_archived',
-            'account', 'account_id', 'created_at', 'updated_at'
+            'tags', 'tag_ids', 'is_recurring', 'recurring_rule', 'next_occurrence', 'is_archived',
+            'external_id', 'account', 'account_id', 'running_balance', 'created_at', 'updated_at'
+        ]
+        read_only_fields = [
+            'id', 'created_at', 'updated_at', 'base_currency_amount', 'exchange_rate', 'next_occurrence'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'base_currency_amount', 'exchange_rate']
 
     def get_currency(self, obj):
         return {
@@ -61,6 +68,11 @@ class TransactionSerializer(serializers.ModelSerializer):
             'type': obj.account.type
         }
 
+    def get_running_balance(self, obj):
+        # Only filled in for account-filtered lists
+        balance = self.context.get('running_balances', {}).get(obj.id)
+        return None if balance is None else f'{balance:.2f}'
+
     def validate_account_id(self, value):
         try:
             Account.objects.get(id=value, user=self.context['request'].user)
@@ -90,12 +102,22 @@ class TransactionSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError("One or more tags not found")
         return value
 
+    def validate_recurring_rule(self, value):
+        if value is not None:
+            try:
+                build_rule(value, date.today())
+            except ValueError as exc:
+                raise serializers.ValidationError(str(exc))
+        return value
+
     def validate(self, data):
         # Ensure required fields are present
         required_fields = ['type', 'amount', 'currency_id', 'description', 'date', 'account_id']
         for field in required_fields:
             if field not in data or data[field] in [None, '']:
                 raise serializers.ValidationError({field: f"{field} is required"})
+        if data.get('is_recurring') and not data.get('recurring_rule'):
+            raise serializers.ValidationError({'recurring_rule': "recurring_rule is required for recurring transactions"})
         return data
 
     def create(self, validated_data):
@@ -123,14 +145,12 @@ class TransactionSerializer(serializers.ModelSerializer):
         if category_id:
             validated_data['category'] = Category.objects.get(id=category_id)
         
-        # Set base_currency_amount and exchange_rate defaults if not provided
-        if 'base_currency_amount' not in validated_data or validated_data.get('base_currency_amount') is None:
-            validated_data['base_currency_amount'] = validated_data['amount']
-        if 'exchange_rate' not in validated_data or validated_data.get('exchange_rate') is None:
-            validated_data['exchange_rate'] = 1
+        # Convert to the user's base currency at the transaction date
+        transaction = Transaction(**validated_data)
+        transaction.apply_exchange_rate(RateResolver(validated_data['user']))
         
         # Create transaction
-        transaction = Transaction.objects.create(**validated_data)
+        transaction.save(force_insert=True)
         
         # Add tags if provided
         if tag_ids:
@@ -154,6 +174,7 @@ class TransactionSerializer(serializers.ModelSerializer):
         # Update other fields
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
+        instance.apply_exchange_rate(RateResolver(self.context['request'].user))
         
         instance.save()
         
@@ -161,4 +182,158 @@ class TransactionSerializer(serializers.ModelSerializer):
         if tag_ids is not None:
             instance.tags.set(tag_ids)
         
-        return instance 
\ No newline at end of file
+        return instance 
+
+class BulkTransactionItemSerializer(TransactionSerializer):
+    """
+    Field-level validation for the payload of one bulk operation.
+
+    References (account, currency, category, tags) are checked for the whole
+    batch at once in ``transactions.bulk``, so the per-row lookups done by
+    ``TransactionSerializer`` are skipped here.
+    """
+
+    def validate_account_id(self, value):
+        return value
+
+    def validate_currency_id(self, value):
+        return value
+
+    def validate_category_id(self, value):
+        return value
+
+    def validate_tag_ids(self, value):
+        return value
+
+    def validate(self, data):
+        # Updates only carry the fields that change
+        if self.partial:
+            return data
+        return super().validate(data)
+
+
+class BulkOperationSerializer(serializers.Serializer):
+    OPERATIONS = ['create', 'update', 'delete']
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    id = serializers.UUIDField(required=False)
+    data = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] in ('update', 'delete') and not attrs.get('id'):
+            raise serializers.ValidationError({'id': f"id is required for {attrs['op']}"})
+        if attrs['op'] in ('create', 'update') and 'data' not in attrs:
+            raise serializers.ValidationError({'data': f"data is required for {attrs['op']}"})
+        return attrs
+
+
+class RecurringBackfillSerializer(serializers.Serializer):
+    until = serializers.DateField(required=False)
+
+
+class RecurringOccurrenceSerializer(serializers.Serializer):
+    """One upcoming occurrence of a recurring transaction: ``{"template": ..., "date": ...}``."""
+    template_id = serializers.UUIDField(source='template.id')
+    date = serializers.DateField()
+    type = serializers.CharField(source='template.type')
+    amount = serializers.DecimalField(source='template.amount', max_digits=15, decimal_places=2)
+    description = serializers.CharField(source='template.description')
+    currency = serializers.CharField(source='template.currency.code')
+    account = serializers.CharField(source='template.account.name')
+    category = serializers.CharField(source='template.category.name', default=None)
+
+
+class DescriptionSuggestionSerializer(serializers.ModelSerializer):
+    category = serializers.SerializerMethodField()
+    tags = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DescriptionSuggestion
+        fields = ['description', 'usage_count', 'last_used', 'category', 'tags']
+
+    def get_category(self, obj):
+        transaction = obj.last_transaction
+        if transaction is None or transaction.category is None:
+            return None
+        return CategorySerializer(transaction.category).data
+
+    def get_tags(self, obj):
+        if obj.last_transaction is None:
+            return []
+        return TagSerializer(obj.last_transaction.tags.all(), many=True).data
+
+
+class CategorizationRuleSerializer(serializers.ModelSerializer):
+    category = CategorySerializer(read_only=True)
+    category_id = serializers.UUIDField(write_only=True, required=False, allow_null=True)
+    tags = TagSerializer(many=True, read_only=True)
+    tag_ids = serializers.ListField(child=serializers.UUIDField(), write_only=True, required=False)
+    account_id = serializers.UUIDField(required=False, allow_null=True)
+
+    class Meta:
+        model = CategorizationRule
+        fields = [
+            'id', 'name', 'match_type', 'pattern', 'transaction_type', 'account_id', 'min_amount', 'max_amount',
+            'category', 'category_id', 'tags', 'tag_ids', 'priority', 'is_active', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+    def validate_account_id(self, value):
+        if value and not Account.objects.filter(id=value, user=self.context['request'].user).exists():
+            raise serializers.ValidationError("Account not found")
+        return value
+
+    def validate_category_id(self, value):
+        if value and not Category.objects.filter(id=value, user=self.context['request'].user).exists():
+            raise serializers.ValidationError("Category not found")
+        return value
+
+    def validate_tag_ids(self, value):
+        if value:
+            tags = Tag.objects.filter(id__in=value, user=self.context['request'].user)
+            if len(tags) != len(set(value)):
+                raise serializers.ValidationError("One or more tags not found")
+        return value
+
+    def validate(self, data):
+        match_type = data.get('match_type', getattr(self.instance, 'match_type', 'CONTAINS'))
+        pattern = data.get('pattern', getattr(self.instance, 'pattern', ''))
+        if match_type == 'REGEX':
+            try:
+                re.compile(pattern)
+            except re.error as exc:
+                raise serializers.ValidationError({'pattern': f"Invalid regular expression: {exc}"})
+        elif not pattern.strip():
+            raise serializers.ValidationError({'pattern': "pattern is required"})
+        min_amount = data.get('min_amount', getattr(self.instance, 'min_amount', None))
+        max_amount = data.get('max_amount', getattr(self.instance, 'max_amount', None))
+        if min_amount is not None and max_amount is not None and min_amount > max_amount:
+            raise serializers.ValidationError({'max_amount': "max_amount must not be less than min_amount"})
+
+        category_id = data.get('category_id', getattr(self.instance, 'category_id', None))
+        tag_ids = data.get('tag_ids', None if self.instance is None else [tag.id for tag in self.instance.tags.all()])
+        if not category_id and not tag_ids:
+            raise serializers.ValidationError("A rule must assign a category or tags")
+        transaction_type = data.get('transaction_type', getattr(self.instance, 'transaction_type', None))
+        if category_id and transaction_type:
+            category = Category.objects.filter(id=category_id).first()
+            if category and category.type != transaction_type:
+                raise serializers.ValidationError(
+                    {'category_id': f"The category is for {category.get_type_display().lower()} transactions"}
+                )
+        return data
+
+    def create(self, validated_data):
+        tag_ids = validated_data.pop('tag_ids', [])
+        validated_data['user'] = self.context['request'].user
+        rule = super().create(validated_data)
+        if tag_ids:
+            rule.tags.set(tag_ids)
+        return rule
+
+    def update(self, instance, validated_data):
+        tag_ids = validated_data.pop('tag_ids', None)
+        rule = super().update(instance, validated_data)
+        if tag_ids is not None:
+            rule.tags.set(tag_ids)
+        return rule
@@ -0,0 +1,46 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import Transaction, Category, Tag
+from .caching import bump_data_version_on_commit
+from .derived import transactions_changed
+from .fingerprints import apply_fingerprint
+from .recurring import schedule
+from .rollups import merge_category_rollups
+
+
+@receiver(pre_save, sender=Transaction)
+def transaction_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule(instance)
+        apply_fingerprint(instance)
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else instance.loaded_values
+    transactions_changed([(old, instance.current_values)])
+    instance.snapshot_loaded_values()
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, **kwargs):
+    transactions_changed([(instance.loaded_values or instance.current_values, None)])
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    merge_category_rollups(instance)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    # Category names appear in cached statistics
+    bump_data_version_on_commit(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    # Tag names appear in reusable exports
+    bump_data_version_on_commit(instance.user_id)
@@ -0,0 +1,105 @@
+"""
+Incremental maintenance and lookup of ``DescriptionSuggestion``.
+
+Like ``transactions.rollups`` this consumes ``(old, new)`` pairs of tracked
+transaction values and applies one ``F()``-based update per description.
+When the latest transaction of a description is deleted, or moves to
+another description or an earlier date, the next latest one takes its place.
+"""
+from collections import defaultdict
+from functools import lru_cache
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import IntegrityError, connections, transaction as db_transaction
+from django.db.models import Case, F, Q, Subquery, Value, When
+
+from .models import DescriptionSuggestion, Transaction
+
+
+def apply_description_changes(changes):
+    """Update suggestions for an iterable of ``(old_values, new_values)`` pairs."""
+    counts = defaultdict(int)
+    latest = {}
+    # Transactions that may no longer be the latest of their old description
+    departed = defaultdict(list)
+    for old, new in changes:
+        if old:
+            key = (old['user_id'], old['description'])
+            counts[key] -= 1
+            if not new or (new['user_id'], new['description']) != key or new['date'] < old['date']:
+                departed[key].append(old['id'])
+        if new:
+            key = (new['user_id'], new['description'])
+            counts[key] += 1
+            if key not in latest or new['date'] >= latest[key]['date']:
+                latest[key] = new
+
+    for key, delta in counts.items():
+        user_id, description = key
+        rows = DescriptionSuggestion.objects.filter(user_id=user_id, description=description)
+        update = {'usage_count': F('usage_count') + delta}
+        newest = latest.get(key)
+        if newest:
+            is_newer = Q(last_used__isnull=True) | Q(last_used__lte=newest['date'])
+            update['last_used'] = Case(When(is_newer, then=Value(newest['date'])), default=F('last_used'))
+            update['last_transaction_id'] = Case(
+                When(is_newer, then=Value(newest['id'])), default=F('last_transaction_id')
+            )
+        updated = rows.update(**update)
+        if not updated and delta > 0:
+            fields = {
+                'usage_count': delta,
+                'last_used': newest['date'],
+                'last_transaction_id': newest['id'],
+            }
+            try:
+                with db_transaction.atomic():
+                    DescriptionSuggestion.objects.create(user_id=user_id, description=description, **fields)
+            except IntegrityError:
+                rows.update(**update)
+        elif delta < 0:
+            rows.filter(usage_count__lte=0).delete()
+        if departed.get(key):
+            refresh_latest(rows, user_id, description, departed[key])
+
+
+def refresh_latest(rows, user_id, description, departed_ids):
+    """Point suggestions whose latest transaction departed (or was deleted) at the newest remaining one."""
+    newest = Transaction.objects.filter(user_id=user_id, description=description).order_by('-date', '-created_at')
+    rows.filter(Q(last_transaction__isnull=True) | Q(last_transaction_id__in=departed_ids)).update(
+        last_transaction_id=Subquery(newest.values('id')[:1]),
+        last_used=Subquery(newest.values('date')[:1]),
+    )
+
+
+@lru_cache(maxsize=None)
+def has_trigram_support(alias):
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def suggest_descriptions(user, term, limit=10):
+    """
+    Return up to ``limit`` suggestions for ``term``: substring matches and, on
+    PostgreSQL with pg_trgm, fuzzy word matches ranked by similarity, then by
+    how often the description was used.
+    """
+    queryset = DescriptionSuggestion.objects.filter(user=user).select_related(
+        'last_transaction__category'
+    ).prefetch_related('last_transaction__tags')
+    term = term.strip()
+    if not term:
+        return queryset.order_by('-usage_count', 'description')[:limit]
+
+    if has_trigram_support(queryset.db):
+        return queryset.annotate(
+            similarity=TrigramWordSimilarity(term, 'description')
+        ).filter(
+            Q(description__icontains=term) | Q(description__trigram_word_similar=term)
+        ).order_by('-similarity', '-usage_count', 'description')[:limit]
+
+    return queryset.filter(description__icontains=term).order_by('-usage_count', 'description')[:limit]
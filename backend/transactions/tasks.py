@@ -0,0 +1,12 @@
+from celery import shared_task
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .recurring import materialize_due
+
+
+@shared_task
+def generate_recurring_transactions(until=None, user_id=None):
+    """Generate recurring occurrences due up to ``until`` (ISO date, default today); returns the count."""
+    until = parse_date(until) if until else timezone.localdate()
+    return materialize_due(until, user_id=user_id)
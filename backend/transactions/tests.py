@@ -1,3 +1,1007 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.management import call_command
+from django.db.models import Sum
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
+import csv
+from base64 import urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import skipUnless
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from accounts.models import Currency, Account, BalanceCheckpoint, ExchangeRate
+from .models import Transaction, Category, Tag, DailyTransactionSummary, DescriptionSuggestion, CategorizationRule
+from .categorization import Categorizer, tokenize
+from .filters import TransactionSearchFilter
+from .fingerprints import fingerprint, normalize_description
+from .tasks import generate_recurring_transactions
 
-# Create your tests here.
+User = get_user_model()
+
+
+class TransactionTestMixin:
+    """Shared fixtures for transaction API tests"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='test@example.com',
+            password='TestPass123!'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        self.user.base_currency = self.currency
+        self.user.save()
+        self.account = self.create_account('Checking')
+        self.category = Category.objects.create(user=self.user, name='Food', type='EXPENSE')
+        self.tag = Tag.objects.create(user=self.user, name='Groceries')
+        self.list_url = reverse('transaction-list')
+
+    def create_account(self, name, currency=None, balance=Decimal('0.00'), user=None):
+        return Account.objects.create(
+            user=user or self.user,
+            name=name,
+            type='BANK',
+            currency=currency or self.currency,
+            initial_balance=balance,
+            current_balance=balance,
+            base_currency_balance=balance,
+        )
+
+    def create_transaction(self, **kwargs):
+        amount = kwargs.pop('amount', Decimal('10.00'))
+        defaults = {
+            'user': self.user,
+            'account': self.account,
+            'type': 'EXPENSE',
+            'amount': amount,
+            'currency': self.currency,
+            'base_currency_amount': amount,
+            'exchange_rate': 1,
+            'description': 'Coffee',
+            'date': date(2024, 1, 1),
+            'category': self.category,
+        }
+        defaults.update(kwargs)
+        return Transaction.objects.create(**defaults)
+
+
+class TransactionCursorPaginationTests(TransactionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Several transactions share a date so the tie-breakers are exercised
+        self.transactions = [
+            self.create_transaction(date=date(2024, 1, 1) + timedelta(days=i // 3), description=f'Item {i}')
+            for i in range(10)
+        ]
+        self.expected = [
+            str(t.id) for t in Transaction.objects.filter(user=self.user).order_by('-date', '-created_at', 'id')
+        ]
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(item['id'] for item in response.data['results'])
+            last = response.data
+            url = response.data['next']
+        return seen, last
+
+    def test_cursor_pagination_walks_all_rows_in_order(self):
+        """Test following next links returns every transaction exactly once"""
+        seen, last_page = self.walk(f'{self.list_url}?pagination=cursor&page_size=3')
+        self.assertEqual(seen, self.expected)
+        self.assertIsNotNone(last_page['previous'])
+
+    def test_cursor_pagination_previous_link(self):
+        """Test following a previous link returns the preceding page"""
+        first = self.client.get(f'{self.list_url}?pagination=cursor&page_size=4').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(
+            [item['id'] for item in back['results']],
+            [item['id'] for item in first['results']]
+        )
+        self.assertIsNone(back['previous'])
+
+    def test_cursor_pagination_respects_filters(self):
+        """Test cursor pagination applies the queryset filters"""
+        other_account = self.create_account('Savings')
+        self.create_transaction(account=other_account, date=date(2024, 2, 1))
+        seen, _ = self.walk(
+            f'{self.list_url}?pagination=cursor&page_size=2&account_id={self.account.id}&start_date=2024-01-02'
+        )
+        expected = [
+            str(t.id) for t in Transaction.objects.filter(
+                account=self.account, date__gte='2024-01-02'
+            ).order_by('-date', '-created_at', 'id')
+        ]
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        response = self.client.get(f'{self.list_url}?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        # Valid JSON that is not an object
+        for value in (b'[1]', b'42', b'"r"'):
+            response = self.client.get(self.list_url, {'cursor': urlsafe_b64encode(value).decode()})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_pagination_is_default(self):
+        """Test the list keeps page-number pagination without the cursor mode"""
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 10)
+
+
+class TransactionQueryBudgetTests(TransactionTestMixin, TestCase):
+    """Listing endpoints must run a fixed number of queries regardless of page size"""
+
+    # endpoint name -> maximum number of queries for one request
+    QUERY_BUDGETS = {
+        'transaction-list': 3,  # count, page, tags prefetch
+        'category-list': 2,
+        'tag-list': 2,
+    }
+
+    def setUp(self):
+        super().setUp()
+        for i in range(20):
+            account = self.create_account(f'Account {i}')
+            category = Category.objects.create(user=self.user, name=f'Category {i}', type='EXPENSE')
+            transaction = self.create_transaction(account=account, category=category)
+            transaction.tags.set([self.tag, Tag.objects.create(user=self.user, name=f'Tag {i}')])
+
+    def test_list_query_budgets(self):
+        """Test each list endpoint stays within its query budget"""
+        for name, budget in self.QUERY_BUDGETS.items():
+            with self.subTest(endpoint=name):
+                with self.assertNumQueries(budget):
+                    response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cursor_list_query_budget(self):
+        """Test the cursor-paginated list skips the count query"""
+        with self.assertNumQueries(2):
+            response = self.client.get(f'{self.list_url}?pagination=cursor')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(len(response.data['results'][0]['tags']), 2)
+
+    def test_detail_query_budget(self):
+        """Test retrieving one transaction loads its relations up front"""
+        transaction = Transaction.objects.filter(user=self.user).first()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('transaction-detail', args=[transaction.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TransactionBulkTests(TransactionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.bulk_url = reverse('transaction-bulk')
+
+    def payload(self, **overrides):
+        data = {
+            'type': 'EXPENSE',
+            'amount': '12.50',
+            'currency_id': str(self.currency.id),
+            'account_id': str(self.account.id),
+            'description': 'Lunch',
+            'date': '2024-03-01',
+        }
+        data.update(overrides)
+        return data
+
+    def test_bulk_create_update_delete(self):
+        """Test a mixed batch is applied in one request"""
+        existing = self.create_transaction()
+        doomed = self.create_transaction()
+        operations = [
+            {'op': 'create', 'data': self.payload(tag_ids=[str(self.tag.id)], category_id=str(self.category.id))},
+            {'op': 'create', 'data': self.payload(description='Dinner')},
+            {'op': 'update', 'id': str(existing.id), 'data': {'amount': '99.00', 'tag_ids': [str(self.tag.id)]}},
+            {'op': 'delete', 'id': str(doomed.id)},
+        ]
+        response = self.client.post(self.bulk_url, operations, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['op'] for r in response.data['results']], ['create', 'create', 'update', 'delete'])
+
+        created = Transaction.objects.get(id=response.data['results'][0]['id'])
+        self.assertEqual(created.category, self.category)
+        self.assertEqual(list(created.tags.all()), [self.tag])
+        self.assertEqual(created.base_currency_amount, Decimal('12.50'))
+        existing.refresh_from_db()
+        self.assertEqual(existing.amount, Decimal('99.00'))
+        self.assertEqual(list(existing.tags.all()), [self.tag])
+        self.assertFalse(Transaction.objects.filter(id=doomed.id).exists())
+
+    def test_bulk_reports_errors_per_item_and_writes_nothing(self):
+        """Test an invalid operation rolls back the whole batch"""
+        other_user = User.objects.create_user(
+            email='other@example.com', username='other@example.com', password='TestPass123!'
+        )
+        foreign_account = self.create_account('Foreign', user=other_user)
+        operations = [
+            {'op': 'create', 'data': self.payload()},
+            {'op': 'create', 'data': self.payload(account_id=str(foreign_account.id))},
+            {'op': 'update', 'id': '00000000-0000-0000-0000-000000000000', 'data': {'amount': '1.00'}},
+            {'op': 'create', 'data': self.payload(amount='-5')},
+        ]
+        response = self.client.post(self.bulk_url, operations, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = {error['index']: error['errors'] for error in response.data['errors']}
+        self.assertEqual(set(errors), {1, 2, 3})
+        self.assertIn('account_id', errors[1])
+        self.assertIn('id', errors[2])
+        self.assertIn('amount', errors[3])
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_bulk_query_count_is_independent_of_batch_size(self):
+        """Test references are validated with set-based lookups"""
+        def run(size):
+            operations = [
+                {'op': 'create', 'data': self.payload(tag_ids=[str(self.tag.id)], category_id=str(self.category.id))}
+                for _ in range(size)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.bulk_url, operations, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        run(1)  # creates the rollup and suggestion rows
+        # SQLite caps a statement at 999 parameters, so keep one INSERT under it
+        self.assertEqual(run(5), run(40))
+        self.assertEqual(Transaction.objects.filter(tags=self.tag).count(), 46)
+
+class TransactionRollupTests(TransactionTestMixin, TestCase):
+    def rollup(self):
+        return set(
+            DailyTransactionSummary.objects.values_list(
+                'account_id', 'category_id', 'type', 'currency_id', 'date', 'total', 'count'
+            )
+        )
+
+    def expected_rollup(self):
+        rows = Transaction.objects.filter(is_archived=False).values(
+            'account_id', 'category_id', 'type', 'currency_id', 'date'
+        ).annotate(total=Sum('amount'))
+        return set(
+            (r['account_id'], r['category_id'], r['type'], r['currency_id'], r['date'], r['total'],
+             Transaction.objects.filter(
+                 is_archived=False, account_id=r['account_id'], category_id=r['category_id'],
+                 type=r['type'], date=r['date']
+             ).count())
+            for r in rows
+        )
+
+    def test_rollup_follows_writes(self):
+        """Test creates, edits, archives and deletes keep the rollup in sync"""
+        savings = self.create_account('Savings')
+        first = self.create_transaction(amount=Decimal('10.00'))
+        second = self.create_transaction(amount=Decimal('5.00'))
+        self.create_transaction(amount=Decimal('7.00'), type='INCOME', date=date(2024, 1, 2), category=None)
+        self.assertEqual(self.rollup(), self.expected_rollup())
+
+        response = self.client.put(
+            reverse('transaction-detail', args=[first.id]),
+            {
+                'type': 'INCOME', 'amount': '20.00', 'currency_id': str(self.currency.id),
+                'account_id': str(savings.id), 'description': 'Refund', 'date': '2024-01-01',
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.rollup(), self.expected_rollup())
+
+        second.is_archived = True
+        second.save()
+        self.assertEqual(self.rollup(), self.expected_rollup())
+
+        response = self.client.delete(reverse('transaction-detail', args=[first.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.rollup(), self.expected_rollup())
+
+    def test_rollup_follows_bulk_writes(self):
+        """Test the bulk endpoint maintains the rollup"""
+        existing = self.create_transaction(amount=Decimal('10.00'))
+        doomed = self.create_transaction(amount=Decimal('3.00'))
+        operations = [
+            {'op': 'create', 'data': {
+                'type': 'EXPENSE', 'amount': '4.00', 'currency_id': str(self.currency.id),
+                'account_id': str(self.account.id), 'description': 'Tea', 'date': '2024-01-01',
+            }},
+            {'op': 'update', 'id': str(existing.id), 'data': {'amount': '1.00', 'date': '2024-01-05'}},
+            {'op': 'delete', 'id': str(doomed.id)},
+        ]
+        response = self.client.post(reverse('transaction-bulk'), operations, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.rollup(), self.expected_rollup())
+
+    def test_rollup_survives_category_delete(self):
+        """Test deleting a category merges its rows into the uncategorized ones"""
+        uncategorized = self.create_transaction(amount=Decimal('10.00'), category=None)
+        self.create_transaction(amount=Decimal('20.00'))
+        self.category.delete()
+        self.assertEqual(DailyTransactionSummary.objects.count(), 1)
+        self.assertEqual(self.rollup(), self.expected_rollup())
+
+        uncategorized.refresh_from_db()
+        uncategorized.amount = Decimal('15.00')
+        uncategorized.save()
+        self.assertEqual(self.rollup(), self.expected_rollup())
+
+        uncategorized.delete()
+        self.assertEqual(self.rollup(), self.expected_rollup())
+        self.assertEqual(DailyTransactionSummary.objects.get().total, Decimal('20.00'))
+
+    def test_stats_and_monthly_use_rollup(self):
+        """Test stats match the raw transactions and read only the rollup"""
+        self.create_transaction(amount=Decimal('10.00'))
+        self.create_transaction(amount=Decimal('30.00'), type='INCOME', date=date(2024, 2, 3))
+        self.create_transaction(amount=Decimal('99.00'), is_archived=True)
+
+        response = self.client.get(reverse('transaction-stats'))
+        self.assertEqual(response.data['total_income'], Decimal('30.00'))
+        self.assertEqual(response.data['total_expenses'], Decimal('10.00'))
+        self.assertEqual(response.data['net_amount'], Decimal('20.00'))
+
+        response = self.client.get(reverse('transaction-monthly'), {'start_date': '2024-02-01'})
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['total_income'], Decimal('30.00'))
+
+    def test_rebuild_command(self):
+        """Test the rebuild command recreates the rollup from raw rows"""
+        self.create_transaction(amount=Decimal('10.00'))
+        self.create_transaction(amount=Decimal('15.00'), category=None)
+        expected = self.rollup()
+        DailyTransactionSummary.objects.all().delete()
+        call_command('rebuild_transaction_rollups', workers=1, verbosity=0)
+        self.assertEqual(self.rollup(), expected)
+
+
+class TransactionStatsCacheTests(TransactionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.stats_url = reverse('transaction-stats')
+        self.create_transaction(amount=Decimal('10.00'))
+
+    def test_stats_single_query_then_cached(self):
+        """Test stats run one aggregate query and repeated requests hit the cache"""
+        with self.assertNumQueries(1):
+            first = self.client.get(self.stats_url, {'start_date': '2024-01-01'})
+        with self.assertNumQueries(0):
+            second = self.client.get(self.stats_url, {'start_date': '2024-01-01'})
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first.data['top_categories'], [{'category__name': 'Food', 'total': Decimal('10.00')}])
+
+    def test_transaction_write_invalidates_cached_stats(self):
+        """Test a committed transaction write bumps the data version"""
+        self.assertEqual(self.client.get(self.stats_url).data['total_expenses'], Decimal('10.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_transaction(amount=Decimal('5.00'))
+        self.assertEqual(self.client.get(self.stats_url).data['total_expenses'], Decimal('15.00'))
+
+    def test_filters_are_part_of_the_cache_key(self):
+        """Test different filters are cached separately"""
+        self.create_transaction(amount=Decimal('7.00'), date=date(2024, 6, 1))
+        self.assertEqual(self.client.get(self.stats_url).data['total_expenses'], Decimal('17.00'))
+        response = self.client.get(self.stats_url, {'start_date': '2024-06-01'})
+        self.assertEqual(response.data['total_expenses'], Decimal('7.00'))
+
+
+class TransactionSearchTests(TransactionTestMixin, TestCase):
+    def test_search_falls_back_to_icontains(self):
+        """Test description search keeps working without full-text support"""
+        self.create_transaction(description='Weekly groceries')
+        self.create_transaction(description='Rent')
+        response = self.client.get(self.list_url, {'search': 'grocer'})
+        self.assertEqual([item['description'] for item in response.data['results']], ['Weekly groceries'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search requires PostgreSQL')
+    def test_full_text_search_is_ranked(self):
+        """Test description matches outrank category name matches on PostgreSQL"""
+        by_category = self.create_transaction(description='Corner shop')
+        by_description = self.create_transaction(description='Food market', category=None)
+        self.create_transaction(description='Rent', category=None)
+        response = self.client.get(self.list_url, {'search': 'foo'})
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [str(by_description.id), str(by_category.id)]
+        )
+
+    def test_search_query_matches_word_prefixes(self):
+        """Test the full-text query requires every word as a prefix"""
+        request = Request(APIRequestFactory().get(self.list_url, {'search': "weekly groc'eries!"}))
+        query = TransactionSearchFilter().get_search_query(request)
+        self.assertEqual(query.source_expressions[-1].value, "weekly:* & groc:* & eries:*")
+
+
+class DescriptionAutocompleteTests(TransactionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.autocomplete_url = reverse('transaction-autocomplete')
+
+    def test_suggestions_follow_writes(self):
+        """Test usage counts and last-used category/tags track transaction writes"""
+        first = self.create_transaction(description='Uber ride', date=date(2024, 1, 1), category=None)
+        latest = self.create_transaction(description='Uber ride', date=date(2024, 2, 1))
+        latest.tags.set([self.tag])
+        self.create_transaction(description='Rent')
+
+        response = self.client.get(self.autocomplete_url, {'q': 'ube'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        suggestion = response.data[0]
+        self.assertEqual(suggestion['description'], 'Uber ride')
+        self.assertEqual(suggestion['usage_count'], 2)
+        self.assertEqual(suggestion['category']['name'], 'Food')
+        self.assertEqual([tag['name'] for tag in suggestion['tags']], ['Groceries'])
+
+        first.description = 'Uber eats'
+        first.save()
+        latest.delete()
+        descriptions = {
+            item['description']: item['usage_count']
+            for item in self.client.get(self.autocomplete_url, {'q': 'uber'}).data
+        }
+        self.assertEqual(descriptions, {'Uber eats': 1})
+
+    def test_deleting_latest_falls_back_to_previous(self):
+        """Test deleting the latest transaction of a description suggests the previous one's category and tags"""
+        previous = self.create_transaction(description='Taxi', date=date(2024, 1, 1), category=None)
+        latest = self.create_transaction(description='Taxi', date=date(2024, 2, 1))
+        latest.tags.set([self.tag])
+        latest.delete()
+
+        suggestion = DescriptionSuggestion.objects.get(description='Taxi')
+        self.assertEqual((suggestion.usage_count, suggestion.last_transaction_id), (1, previous.id))
+        self.assertEqual(suggestion.last_used, date(2024, 1, 1))
+        data = self.client.get(self.autocomplete_url, {'q': 'taxi'}).data[0]
+        self.assertEqual((data['category'], data['tags']), (None, []))
+
+    def test_suggestions_are_ranked_and_limited(self):
+        """Test the most used descriptions come first and the limit applies"""
+        for _ in range(3):
+            self.create_transaction(description='Coffee shop')
+        self.create_transaction(description='Coffee beans')
+        self.create_transaction(description='Coffee grinder')
+        response = self.client.get(self.autocomplete_url, {'q': 'coffee', 'limit': 2})
+        self.assertEqual(response.data[0]['description'], 'Coffee shop')
+        self.assertEqual(len(response.data), 2)
+
+    def test_suggestion_query_budget(self):
+        """Test autocomplete runs a fixed number of queries"""
+        for i in range(10):
+            transaction = self.create_transaction(description=f'Shop {i}')
+            transaction.tags.set([self.tag])
+        self.client.get(self.autocomplete_url, {'q': 'warm-up'})
+        with self.assertNumQueries(2):
+            response = self.client.get(self.autocomplete_url, {'q': 'shop'})
+        self.assertEqual(len(response.data), 10)
+
+
+class AccountBalanceTests(TransactionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account('Savings', balance=Decimal('100.00'))
+        self.balances_url = reverse('account-balances')
+        self.create_transaction(type='INCOME', amount=Decimal('50.00'), date=date(2024, 1, 10))
+        self.create_transaction(amount=Decimal('20.00'), date=date(2024, 1, 20))
+        self.create_transaction(amount=Decimal('5.00'), date=date(2024, 2, 5))
+        self.create_transaction(amount=Decimal('7.00'), date=date(2024, 2, 6), is_archived=True)
+
+    def get_balances(self, as_of):
+        response = self.client.get(self.balances_url, {'as_of': as_of})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {item['name']: item['balance'] for item in response.data['accounts']}
+
+    def test_running_balance_on_account_list(self):
+        """Test the account-filtered list carries the balance after each transaction"""
+        response = self.client.get(self.list_url, {'account_id': self.account.id})
+        balances = [item['running_balance'] for item in response.data['results']]
+        self.assertEqual(balances, [None, '125.00', '130.00', '150.00'])
+
+        response = self.client.get(self.list_url, {'account_id': self.account.id, 'type': 'EXPENSE'})
+        balances = [item['running_balance'] for item in response.data['results']]
+        self.assertEqual(balances, [None, '125.00', '130.00'])
+
+        response = self.client.get(self.list_url)
+        self.assertTrue(all(item['running_balance'] is None for item in response.data['results']))
+
+    def test_balances_as_of(self):
+        """Test point-in-time balances for every account of the user"""
+        self.assertEqual(self.get_balances('2023-12-31'), {'Checking': '0.00', 'Savings': '100.00'})
+        self.assertEqual(self.get_balances('2024-01-31')['Savings'], '130.00')
+        self.assertEqual(self.get_balances('2024-02-29')['Savings'], '125.00')
+        response = self.client.get(self.balances_url, {'as_of': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_checkpoints_match_full_scan(self):
+        """Test balances read through checkpoints equal a full scan and follow later writes"""
+        call_command('create_balance_checkpoints', through='2024-03-15', verbosity=0)
+        checkpoints = BalanceCheckpoint.objects.filter(account=self.account).order_by('date')
+        self.assertEqual(
+            [(c.date, c.balance) for c in checkpoints],
+            [(date(2024, 1, 31), Decimal('30.00')), (date(2024, 2, 29), Decimal('25.00'))]
+        )
+
+        transaction = self.create_transaction(amount=Decimal('10.00'), date=date(2024, 1, 15))
+        self.assertEqual(self.get_balances('2024-03-01')['Savings'], '115.00')
+        transaction.is_archived = True
+        transaction.save()
+        self.assertEqual(self.get_balances('2024-01-31')['Savings'], '130.00')
+        response = self.client.get(self.list_url, {'account_id': self.account.id})
+        self.assertEqual(response.data['results'][1]['running_balance'], '125.00')
+
+        # A second run only adds months after the latest checkpoint
+        call_command('create_balance_checkpoints', through='2024-03-31', verbosity=0)
+        self.assertEqual(checkpoints.count(), 2)
+
+    def test_balances_query_budget(self):
+        """Test as-of balances take a fixed number of queries regardless of account count"""
+        for i in range(5):
+            self.create_account(f'Account {i}')
+        with self.assertNumQueries(2):
+            self.client.get(self.balances_url, {'as_of': '2024-02-01'})
+
+
+class AccountBalanceMaintenanceTests(TransactionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account('Wallet', balance=Decimal('100.00'))
+        self.savings = self.create_account('Savings', balance=Decimal('50.00'))
+
+    def assertBalances(self, expected):
+        for account, balance in expected.items():
+            account.refresh_from_db()
+            self.assertEqual((account.current_balance, account.base_currency_balance), (balance, balance))
+
+    def payload(self, **overrides):
+        data = {
+            'type': 'EXPENSE',
+            'amount': '30.00',
+            'currency_id': str(self.currency.id),
+            'account_id': str(self.account.id),
+            'description': 'Groceries',
+            'date': '2024-01-05',
+        }
+        data.update(overrides)
+        return data
+
+    def test_writes_move_account_balances(self):
+        """Test creates, updates, archives and deletes shift the affected balances"""
+        response = self.client.post(self.list_url, self.payload(), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        detail_url = reverse('transaction-detail', args=[response.data['id']])
+        self.assertBalances({self.account: Decimal('70.00'), self.savings: Decimal('50.00')})
+
+        self.client.put(detail_url, self.payload(type='INCOME', account_id=str(self.savings.id)), format='json')
+        self.assertBalances({self.account: Decimal('100.00'), self.savings: Decimal('80.00')})
+
+        self.client.put(detail_url, self.payload(
+            type='INCOME', account_id=str(self.savings.id), is_archived=True
+        ), format='json')
+        self.assertBalances({self.savings: Decimal('50.00')})
+
+        self.client.put(detail_url, self.payload(account_id=str(self.savings.id), is_archived=False), format='json')
+        self.assertBalances({self.savings: Decimal('20.00')})
+        self.client.delete(detail_url)
+        self.assertBalances({self.account: Decimal('100.00'), self.savings: Decimal('50.00')})
+
+    def test_bulk_writes_move_account_balances(self):
+        """Test bulk operations apply one delta per affected account"""
+        doomed = self.create_transaction(amount=Decimal('40.00'))
+        operations = [
+            {'op': 'create', 'data': self.payload()},
+            {'op': 'create', 'data': self.payload(type='INCOME', amount='5.00', account_id=str(self.savings.id))},
+            {'op': 'delete', 'id': str(doomed.id)},
+        ]
+        response = self.client.post(reverse('transaction-bulk'), operations, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertBalances({self.account: Decimal('70.00'), self.savings: Decimal('55.00')})
+
+    def test_initial_balance_change_shifts_balances(self):
+        """Test editing the initial balance keeps the transactions' effect"""
+        self.create_transaction(amount=Decimal('30.00'))
+        response = self.client.patch(
+            reverse('account-detail', args=[self.account.id]), {'initial_balance': '150.00'}, format='json'
+        )
+        self.assertEqual(response.data['current_balance'], '120.00')
+        self.assertBalances({self.account: Decimal('120.00')})
+
+    def test_reconcile_balances_repairs_drift(self):
+        """Test the reconcile command reports drifted balances and repairs them"""
+        self.create_transaction(amount=Decimal('30.00'))
+        Account.objects.filter(pk=self.account.pk).update(current_balance=Decimal('0.00'))
+
+        call_command('reconcile_balances', dry_run=True, workers=1, verbosity=0)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.current_balance, Decimal('0.00'))
+
+        call_command('reconcile_balances', workers=1, verbosity=0)
+        self.assertBalances({self.account: Decimal('70.00'), self.savings: Decimal('50.00')})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Row locking needs PostgreSQL')
+class ConcurrentBalanceTests(TransactionTestMixin, TransactionTestCase):
+    def test_parallel_writes_keep_balance_exact(self):
+        """Test balances stay exact when many writers hit the same account at once"""
+        self.account.initial_balance = self.account.current_balance = Decimal('0.00')
+        self.account.save()
+
+        def write(i):
+            try:
+                transaction = self.create_transaction(type='INCOME', amount=Decimal('2.00'))
+                transaction.amount = Decimal('3.00')
+                transaction.save()
+                if i % 2:
+                    transaction.delete()
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(write, range(40)))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.current_balance, Decimal('60.00'))
+
+
+class RecurringTransactionTests(TransactionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.template = self.create_transaction(
+            description='Rent', amount=Decimal('500.00'), date=date(2024, 1, 1),
+            is_recurring=True, recurring_rule={'rrule': 'FREQ=MONTHLY'}
+        )
+        self.template.tags.set([self.tag])
+
+    def occurrence_dates(self, template=None):
+        return sorted((template or self.template).occurrences.values_list('date', flat=True))
+
+    def test_generation_is_idempotent(self):
+        """Test due occurrences are created once, with the template's tags and balance effect"""
+        self.assertEqual(self.template.next_occurrence, date(2024, 2, 1))
+        result = generate_recurring_transactions.delay(until='2024-04-15')
+        self.assertEqual(result.get(), 3)
+        self.assertEqual(self.occurrence_dates(), [date(2024, 2, 1), date(2024, 3, 1), date(2024, 4, 1)])
+        occurrence = self.template.occurrences.get(date=date(2024, 3, 1))
+        self.assertEqual(list(occurrence.tags.all()), [self.tag])
+        self.assertFalse(occurrence.is_recurring)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.current_balance, Decimal('-2000.00'))
+
+        self.assertEqual(generate_recurring_transactions.delay(until='2024-04-15').get(), 0)
+        self.template.refresh_from_db()
+        self.assertEqual(self.template.next_occurrence, date(2024, 5, 1))
+
+    def test_deleted_occurrences_stay_deleted(self):
+        """Test editing a template keeps generation progress, so deleted occurrences do not come back"""
+        generate_recurring_transactions.delay(until='2024-03-01')
+        self.template.occurrences.get(date=date(2024, 2, 1)).delete()
+        self.template.refresh_from_db()
+        self.template.description = 'Flat rent'
+        self.template.save()
+        generate_recurring_transactions.delay(until='2024-04-01')
+        self.assertEqual(self.occurrence_dates(), [date(2024, 3, 1), date(2024, 4, 1)])
+        self.assertEqual(
+            self.template.occurrences.get(date=date(2024, 4, 1)).description, 'Flat rent'
+        )
+
+    def test_finite_rules_stop(self):
+        """Test a rule with a count is unscheduled once it is exhausted"""
+        template = self.create_transaction(
+            date=date(2024, 1, 10), is_recurring=True, recurring_rule={'rrule': 'FREQ=WEEKLY;COUNT=3'}
+        )
+        generate_recurring_transactions.delay(until='2024-12-31')
+        self.assertEqual(self.occurrence_dates(template), [date(2024, 1, 17), date(2024, 1, 24)])
+        template.refresh_from_db()
+        self.assertIsNone(template.next_occurrence)
+
+    def test_preview_does_not_write(self):
+        """Test the preview merges templates in date order without creating anything"""
+        self.create_transaction(
+            description='Gym', date=date(2024, 1, 15), is_recurring=True,
+            recurring_rule={'rrule': 'FREQ=MONTHLY'}
+        )
+        response = self.client.get(reverse('transaction-recurring'), {'count': 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item['description'], item['date']) for item in response.data],
+            [('Rent', '2024-02-01'), ('Gym', '2024-02-15'), ('Rent', '2024-03-01'), ('Gym', '2024-03-15')]
+        )
+        self.assertFalse(Transaction.objects.filter(recurring_parent__isnull=False).exists())
+
+    def test_backfill_only_touches_the_user(self):
+        """Test the backfill endpoint generates occurrences for the requesting user only"""
+        other = User.objects.create_user(email='other@example.com', username='other@example.com', password='x')
+        other_account = self.create_account('Other', user=other)
+        category = Category.objects.create(user=other, name='Bills', type='EXPENSE')
+        other_template = self.create_transaction(
+            user=other, account=other_account, category=category,
+            is_recurring=True, recurring_rule={'rrule': 'FREQ=DAILY'}
+        )
+        response = self.client.post(reverse('transaction-recurring-backfill'), {'until': '2024-02-01'}, format='json')
+        self.assertEqual(response.data, {'created': 1})
+        self.assertFalse(other_template.occurrences.exists())
+
+    def test_backfill_rejects_malformed_input(self):
+        """Test a bad date or a body that is not an object is a 400, not a server error"""
+        url = reverse('transaction-recurring-backfill')
+        for body in (['2024-02-01'], 42, {'until': '01/02/2024'}):
+            response = self.client.post(url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f'{url}?until=someday')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_rule_is_rejected(self):
+        """Test creating a recurring transaction with a malformed rule fails validation"""
+        response = self.client.post(self.list_url, {
+            'type': 'EXPENSE', 'amount': '10.00', 'currency_id': str(self.currency.id),
+            'account_id': str(self.account.id), 'description': 'Bad', 'date': '2024-01-01',
+            'is_recurring': True, 'recurring_rule': {'rrule': 'FREQ=SOMETIMES'},
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('recurring_rule', response.data)
+
+
+class TransactionConversionTests(TransactionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.eur = Currency.objects.create(code='EUR', name='Euro', symbol='E')
+        ExchangeRate.objects.create(
+            user=self.user, from_currency=self.eur, to_currency=self.currency,
+            rate=Decimal('1.100000'), date=date(2024, 1, 1)
+        )
+
+    def payload(self, **overrides):
+        data = {
+            'type': 'EXPENSE',
+            'amount': '10.00',
+            'currency_id': str(self.eur.id),
+            'account_id': str(self.account.id),
+            'description': 'Croissant',
+            'date': '2024-01-15',
+        }
+        data.update(overrides)
+        return data
+
+    def test_create_and_update_convert_to_base_currency(self):
+        """Test the base amount follows the rate for the transaction date"""
+        response = self.client.post(self.list_url, self.payload(), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Decimal(response.data['base_currency_amount']), Decimal('11.00'))
+        self.assertEqual(Decimal(response.data['exchange_rate']), Decimal('1.1'))
+
+        detail_url = reverse('transaction-detail', args=[response.data['id']])
+        response = self.client.put(detail_url, self.payload(date='2023-12-01'), format='json')
+        self.assertIsNone(response.data['exchange_rate'])
+        self.assertEqual(Decimal(response.data['base_currency_amount']), Decimal('10.00'))
+
+        response = self.client.put(detail_url, self.payload(currency_id=str(self.currency.id)), format='json')
+        self.assertEqual(Decimal(response.data['exchange_rate']), Decimal('1'))
+
+    def test_bulk_conversion_adds_no_per_row_queries(self):
+        """Test bulk writes resolve rates once per batch"""
+        def run(size):
+            operations = [{'op': 'create', 'data': self.payload()} for _ in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(reverse('transaction-bulk'), operations, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        run(1)  # creates the rollup and suggestion rows
+        # SQLite caps a statement at 999 parameters, so keep one INSERT under it
+        self.assertEqual(run(5), run(40))
+        self.assertEqual(
+            set(Transaction.objects.values_list('base_currency_amount', flat=True)), {Decimal('11.00')}
+        )
+
+
+
+class TransactionFingerprintTests(TransactionTestMixin, TestCase):
+    """Tests for duplicate-detection fingerprints"""
+
+    def test_fingerprint_ignores_case_spacing_and_punctuation(self):
+        """Test descriptions are normalized before hashing"""
+        self.assertEqual(normalize_description('  CORNER-Store,  Deli '), 'corner store deli')
+        self.assertEqual(
+            fingerprint(self.account.id, date(2024, 1, 1), 'EXPENSE', Decimal('5'), 'Corner store deli'),
+            fingerprint(self.account.id, date(2024, 1, 1), 'EXPENSE', Decimal('5.00'), 'CORNER-STORE DELI!'),
+        )
+        self.assertNotEqual(
+            fingerprint(self.account.id, date(2024, 1, 1), 'EXPENSE', Decimal('5'), 'Deli'),
+            fingerprint(self.account.id, date(2024, 1, 1), 'INCOME', Decimal('5'), 'Deli'),
+        )
+
+    def test_fingerprint_is_kept_current(self):
+        """Test saves and bulk writes keep the fingerprint in step with the row"""
+        transaction = self.create_transaction()
+        self.assertEqual(
+            transaction.fingerprint,
+            fingerprint(self.account.id, date(2024, 1, 1), 'EXPENSE', Decimal('10.00'), 'Coffee'),
+        )
+        transaction.description = 'Tea'
+        transaction.save()
+        transaction.refresh_from_db()
+        self.assertEqual(
+            transaction.fingerprint, fingerprint(self.account.id, date(2024, 1, 1), 'EXPENSE', Decimal('10.00'), 'Tea')
+        )
+
+        response = self.client.post(reverse('transaction-bulk'), [
+            {'op': 'update', 'id': str(transaction.id), 'data': {'amount': '3.00'}},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        transaction.refresh_from_db()
+        self.assertEqual(
+            transaction.fingerprint, fingerprint(self.account.id, date(2024, 1, 1), 'EXPENSE', Decimal('3.00'), 'Tea')
+        )
+
+    def test_backfill_command(self):
+        """Test the backfill command fingerprints rows written without one"""
+        transaction = self.create_transaction()
+        Transaction.objects.update(fingerprint=None)
+        call_command('backfill_fingerprints', verbosity=0)
+        transaction.refresh_from_db()
+        self.assertEqual(
+            transaction.fingerprint,
+            fingerprint(self.account.id, date(2024, 1, 1), 'EXPENSE', Decimal('10.00'), 'Coffee'),
+        )
+
+
+class CategorizationTests(TransactionTestMixin, TestCase):
+    """Tests for rule- and history-based categorization"""
+
+    def setUp(self):
+        super().setUp()
+        self.transport = Category.objects.create(user=self.user, name='Transport', type='EXPENSE')
+        self.salary = Category.objects.create(user=self.user, name='Salary', type='INCOME')
+        for i in range(3):
+            transaction = self.create_transaction(description=f'STARBUCKS #{i}00 SEATTLE')
+            transaction.tags.add(self.tag)
+        self.create_transaction(description='Uber trip', category=self.transport)
+        self.create_transaction(description='Uber eats', category=self.category)
+        self.create_transaction(description='ACME payroll', type='INCOME', category=self.salary)
+
+    def row(self, description, type='EXPENSE', amount=Decimal('5.00')):
+        return Transaction(description=description, type=type, amount=amount, account_id=self.account.id)
+
+    def test_tokenize_skips_references(self):
+        """Test tokens are normalized words without digits"""
+        self.assertEqual(tokenize('POS 1234 Starbucks-Store 03/12 #A1'), {'pos', 'starbucks', 'store'})
+
+    def test_learns_from_history(self):
+        """Test confident suggestions come from the user's own labelled transactions"""
+        results = Categorizer(self.user).classify([
+            self.row('Starbucks Portland 0042'),
+            self.row('uber'),
+            self.row('Something new'),
+            self.row('ACME payroll March', type='INCOME'),
+            self.row('ACME payroll March'),
+        ])
+        self.assertEqual(results[0], (str(self.category.id), [str(self.tag.id)]))
+        # "uber" was seen with two categories, so neither is confident enough
+        self.assertIsNone(results[1])
+        self.assertIsNone(results[2])
+        self.assertEqual(results[3], (str(self.salary.id), []))
+        # A category is only suggested for transactions of its type
+        self.assertIsNone(results[4])
+
+    def test_rules_come_before_history(self):
+        """Test the first matching rule in priority order decides"""
+        rule = CategorizationRule.objects.create(
+            user=self.user, name='Uber', pattern='UBER', category=self.transport, priority=2
+        )
+        rule.tags.add(self.tag)
+        CategorizationRule.objects.create(
+            user=self.user, name='Coffee', match_type='REGEX', pattern=r'^starbucks\b', category=self.transport,
+            min_amount=Decimal('50'), priority=1
+        )
+        results = Categorizer(self.user).classify([self.row('Uber eats'), self.row('Starbucks Seattle')])
+        self.assertEqual(results[0], (self.transport.id, [self.tag.id]))
+        # The regex rule needs at least 50, so history decides
+        self.assertEqual(results[1], (str(self.category.id), [str(self.tag.id)]))
+
+    def test_index_is_cached_until_transactions_change(self):
+        """Test the learned index is built once and rebuilt after a committed write"""
+        categorizer = Categorizer(self.user)
+        with self.assertNumQueries(2):
+            categorizer.classify([self.row('Starbucks')])
+        categorizer = Categorizer(self.user)
+        with self.assertNumQueries(0):
+            categorizer.index
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_transaction(description='Metro card', category=self.transport)
+        self.assertIn('metro', Categorizer(self.user).index['EXPENSE']['tokens'])
+
+    def test_deleted_categories_are_not_suggested(self):
+        """Test a cached index never hands out a category that no longer exists"""
+        Categorizer(self.user).index
+        self.salary.delete()
+        self.assertEqual(Categorizer(self.user).classify([self.row('ACME payroll', type='INCOME')]), [None])
+
+    def test_rule_api(self):
+        """Test rules are created per user and validated"""
+        url = reverse('categorization-rule-list')
+        response = self.client.post(url, {
+            'name': 'Rent', 'match_type': 'STARTS_WITH', 'pattern': 'rent', 'category_id': str(self.category.id),
+            'tag_ids': [str(self.tag.id)],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['tags'][0]['name'], 'Groceries')
+        rule = CategorizationRule.objects.get()
+        self.assertEqual(rule.user, self.user)
+
+        for payload in (
+            {'name': 'Bad', 'match_type': 'REGEX', 'pattern': '(', 'category_id': str(self.category.id)},
+            {'name': 'Empty', 'pattern': 'x'},
+            {'name': 'Wrong type', 'pattern': 'x', 'transaction_type': 'INCOME', 'category_id': str(self.category.id)},
+        ):
+            response = self.client.post(url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, payload)
+
+
+class TransactionExportTests(TransactionTestMixin, TestCase):
+    """Tests for the streaming CSV export"""
+
+    def setUp(self):
+        super().setUp()
+        self.export_url = reverse('transaction-export')
+        self.coffee = self.create_transaction(description='Coffee, large', external_id='S1')
+        self.coffee.tags.add(self.tag, Tag.objects.create(user=self.user, name='Cafe'))
+        self.create_transaction(description='Salary', type='INCOME', amount=Decimal('100.00'), category=None,
+                                date=date(2024, 2, 1))
+        other = User.objects.create_user(email='other@example.com', username='other@example.com', password='x')
+        self.create_transaction(user=other, account=self.create_account('Other', user=other))
+
+    def export(self, params=None):
+        response = self.client.get(self.export_url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.DictReader(StringIO(content)))
+
+    def test_export_streams_rows(self):
+        """Test the export lists the user's transactions newest first with their related names"""
+        rows = self.export()
+        self.assertEqual([row['Description'] for row in rows], ['Salary', 'Coffee, large'])
+        self.assertEqual(rows[1], {
+            'Date': '2024-01-01', 'Type': 'EXPENSE', 'Amount': '10.00', 'Currency': 'USD', 'Base Amount': '10.00',
+            'Exchange Rate': '1.000000', 'Description': 'Coffee, large', 'Account': 'Checking', 'Category': 'Food',
+            'Tags': 'Cafe; Groceries', 'Reference': 'S1', 'Id': str(self.coffee.id),
+        })
+        self.assertEqual(rows[0]['Category'], '')
+
+    def test_export_uses_list_filters(self):
+        """Test the list filters, search and ordering apply to the export"""
+        self.assertEqual([row['Description'] for row in self.export({'type': 'INCOME'})], ['Salary'])
+        self.assertEqual([row['Description'] for row in self.export({'end_date': '2024-01-31'})], ['Coffee, large'])
+        self.assertEqual([row['Description'] for row in self.export({'tag_ids': [str(self.tag.id)]})],
+                         ['Coffee, large'])
+        self.assertEqual([row['Description'] for row in self.export({'search': 'coffee'})], ['Coffee, large'])
+        self.assertEqual(
+            [row['Description'] for row in self.export({'search': 'coffee', 'tag_ids': [str(self.tag.id)]})],
+            ['Coffee, large']
+        )
+        self.assertEqual([row['Description'] for row in self.export({'ordering': 'amount'})],
+                         ['Coffee, large', 'Salary'])
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_export_queries_per_chunk(self):
+        """Test rows are read in chunks with one tag query per chunk"""
+        for i in range(4):
+            self.create_transaction(description=f'Row {i}')
+        with CaptureQueriesContext(connection) as ctx:
+            rows = self.export()
+        self.assertEqual(len(rows), 6)
+        tag_queries = [q for q in ctx.captured_queries if 'transactions_transaction_tags' in q['sql']]
+        self.assertEqual(len(tag_queries), 3)
+        self.assertLessEqual(len(ctx.captured_queries), 5)
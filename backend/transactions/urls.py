@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TransactionViewSet, CategoryViewSet, TagViewSet
+from .views import TransactionViewSet, CategoryViewSet, TagViewSet, CategorizationRuleViewSet
 
 router = DefaultRouter()
 router.register(r'transactions', TransactionViewSet, basename='transaction')
 router.register(r'categories', CategoryViewSet, basename='category')
 router.register(r'tags', TagViewSet, basename='tag')
+router.register(r'categorization-rules', CategorizationRuleViewSet, basename='categorization-rule')
 
 urlpatterns = [
     path('', include(router.urls)),
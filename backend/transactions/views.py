@@ -1,31 +1,66 @@
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.utils import timezone
 from django.db.models import Sum, Q
+from django.db.models.functions import Coalesce, TruncMonth
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-from .models import Transaction, Category, Tag
-from .serializers import TransactionSerializer, CategorySerializer, TagSerializer
+from .models import Transaction, Category, Tag, DailyTransactionSummary, CategorizationRule
+from .serializers import (
+    TransactionSerializer, CategorySerializer, TagSerializer, BulkOperationSerializer,
+    DescriptionSuggestionSerializer, RecurringOccurrenceSerializer, RecurringBackfillSerializer,
+    CategorizationRuleSerializer
+)
+from .bulk import BulkTransactionWriter
+from .pagination import TransactionCursorPagination
+from .caching import versioned_key
+from .filters import TransactionSearchFilter, TransactionOrderingFilter
+from .suggestions import suggest_descriptions
+from .balances import running_balances
+from .recurring import materialize_due, preview_occurrences
+from files.exports import csv_stream
 
 # Create your views here.
 
 class TransactionViewSet(viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, TransactionSearchFilter, TransactionOrderingFilter]
     filterset_fields = ['type', 'category', 'is_recurring', 'is_archived']
     search_fields = ['description']
     ordering_fields = ['date', 'amount', 'created_at']
     ordering = ['-date', '-created_at']
 
+    @property
+    def paginator(self):
+        """
+        Use keyset pagination when the client asks for it with
+        ``pagination=cursor`` (or follows a cursor link); otherwise keep the
+        default page-number pagination.
+        """
+        if not hasattr(self, '_paginator'):
+            request = getattr(self, 'request', None)
+            params = request.query_params if request is not None else {}
+            if params.get('pagination') == 'cursor' or 'cursor' in params:
+                self._paginator = TransactionCursorPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
                 name='account_id',
                 type=str,
-                description='Filter transactions by account ID'
+                description='Filter transactions by account ID; also fills in running_balance'
             ),
             OpenApiParameter(
                 name='start_date',
@@ -55,21 +90,62 @@ class TransactionViewSet(viewsets.ModelViewSet):
             OpenApiParameter(
                 name='search',
                 type=str,
-                description='Search in transaction description'
+                description='Search in transaction description (ranked full-text search on PostgreSQL)'
             ),
             OpenApiParameter(
                 name='ordering',
                 type=str,
                 description='Order results by field (date, amount, created_at)'
             ),
+            OpenApiParameter(
+                name='pagination',
+                type=str,
+                description='Set to "cursor" for keyset pagination ordered by (-date, -created_at, id); ignores ordering'
+            ),
+            OpenApiParameter(
+                name='cursor',
+                type=str,
+                description='Opaque cursor from the next/previous link of a cursor-paginated response'
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = list(page if page is not None else queryset)
+        context = self.get_serializer_context()
+        context['running_balances'] = self.get_running_balances(rows)
+        serializer = self.get_serializer_class()(rows, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    @db_transaction.atomic
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    @db_transaction.atomic
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
+
+    def get_running_balances(self, rows):
+        """Balance after each listed transaction, when the list is filtered by account."""
+        account_id = self.request.query_params.get('account_id')
+        if not account_id or not rows:
+            return {}
+        # Every listed row belongs to the filtered account
+        return running_balances(rows[0].account, rows)
 
     def get_queryset(self):
-        queryset = Transaction.objects.filter(user=self.request.user)
+        queryset = Transaction.objects.filter(user=self.request.user).select_related(
+            'currency', 'account', 'category'
+        ).prefetch_related('tags')
         
+        if self.action in ('update', 'partial_update', 'destroy'):
+            # Balance deltas are computed from the loaded row, so hold it
+            # until the write commits
+            queryset = queryset.select_for_update(of=('self',))
+
         # Filter by account if account_id is provided
         account_id = self.request.query_params.get('account_id')
         if account_id:
@@ -107,32 +183,215 @@ class TransactionViewSet(viewsets.ModelViewSet):
     )
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        queryset = self.get_queryset()
-        
-        # Get date range from query params or default to last 30 days
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        
+        return Response(self.get_cached_stats('transactions:stats', self.compute_stats))
+
+    def compute_stats(self):
+        queryset, amount_field = self.get_stats_source()
+
+        # One grouped pass: per-category totals split by type, from which the
+        # overall income/expense totals are summed
+        by_category = queryset.values('category__name').annotate(
+            category_total=Sum(amount_field),
+            income_total=Coalesce(Sum(amount_field, filter=Q(type='INCOME')), Decimal('0')),
+            expense_total=Coalesce(Sum(amount_field, filter=Q(type='EXPENSE')), Decimal('0')),
+        ).order_by('-category_total')
+        rows = list(by_category)
+
+        income = sum((row['income_total'] for row in rows), Decimal('0'))
+        expenses = sum((row['expense_total'] for row in rows), Decimal('0'))
+        return {
+            'total_income': income,
+            'total_expenses': expenses,
+            'net_amount': income - expenses,
+            'top_categories': [
+                {'category__name': row['category__name'], 'total': row['category_total']}
+                for row in rows[:5]
+            ]
+        }
+
+    def get_cached_stats(self, prefix, compute):
+        """
+        Return ``compute()`` through the cache, keyed by user, the filters in
+        use and the user's data version (bumped on every transaction write).
+        """
+        params = {
+            name: self.request.query_params.get(name)
+            for name in ('account_id', 'start_date', 'end_date')
+        }
+        params['tag_ids'] = sorted(self.request.query_params.getlist('tag_ids'))
+        key = versioned_key(prefix, self.request.user.id, params)
+        result = cache.get(key)
+        if result is None:
+            result = compute()
+            cache.set(key, result, timeout=settings.STATS_CACHE_TIMEOUT)
+        return result
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='start_date',
+                type=str,
+                description='Get monthly totals from this date (YYYY-MM-DD)'
+            ),
+            OpenApiParameter(
+                name='end_date',
+                type=str,
+                description='Get monthly totals until this date (YYYY-MM-DD)'
+            ),
+        ],
+        description='Get income, expense and net totals per calendar month'
+    )
+    @action(detail=False, methods=['get'])
+    def monthly(self, request):
+        return Response(self.get_cached_stats('transactions:monthly', self.compute_monthly))
+
+    def compute_monthly(self):
+        queryset, amount_field = self.get_stats_source()
+        months = queryset.annotate(month=TruncMonth('date')).values('month').annotate(
+            income_total=Coalesce(Sum(amount_field, filter=Q(type='INCOME')), Decimal('0')),
+            expense_total=Coalesce(Sum(amount_field, filter=Q(type='EXPENSE')), Decimal('0')),
+        ).order_by('month')
+        return [
+            {
+                'month': row['month'],
+                'total_income': row['income_total'],
+                'total_expenses': row['expense_total'],
+                'net_amount': row['income_total'] - row['expense_total'],
+            }
+            for row in months
+        ]
+
+    def get_stats_source(self):
+        """
+        Queryset and amount field statistics are computed from: the daily
+        rollup table, unless a filter the rollup is not keyed on (tags) is in
+        use. Archived transactions are not counted either way.
+        """
+        if self.request.query_params.getlist('tag_ids'):
+            return self.get_queryset().filter(is_archived=False), 'amount'
+
+        queryset = DailyTransactionSummary.objects.filter(user=self.request.user)
+        account_id = self.request.query_params.get('account_id')
+        if account_id:
+            queryset = queryset.filter(account_id=account_id)
+        start_date = self.request.query_params.get('start_date')
+        end_date = self.request.query_params.get('end_date')
         if start_date:
             queryset = queryset.filter(date__gte=start_date)
         if end_date:
             queryset = queryset.filter(date__lte=end_date)
-        
-        # Calculate total income and expenses
-        income = queryset.filter(type='INCOME').aggregate(total=Sum('amount'))['total'] or 0
-        expenses = queryset.filter(type='EXPENSE').aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Get top categories
-        top_categories = queryset.values('category__name').annotate(
-            total=Sum('amount')
-        ).order_by('-total')[:5]
-        
-        return Response({
-            'total_income': income,
-            'total_expenses': expenses,
-            'net_amount': income - expenses,
-            'top_categories': top_categories
-        })
+        return queryset, 'total'
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='account_id', type=str, description='Filter transactions by account ID'),
+            OpenApiParameter(name='start_date', type=str, description='Export transactions from this date (YYYY-MM-DD)'),
+            OpenApiParameter(name='end_date', type=str, description='Export transactions until this date (YYYY-MM-DD)'),
+            OpenApiParameter(name='type', type=str, description='Filter by transaction type (INCOME, EXPENSE, TRANSFER)'),
+            OpenApiParameter(name='category', type=str, description='Filter by category ID'),
+            OpenApiParameter(name='tag_ids', type=str, description='Filter by tag IDs (can be multiple)'),
+            OpenApiParameter(name='search', type=str, description='Search in transaction description'),
+            OpenApiParameter(name='ordering', type=str, description='Order rows by field (date, amount, created_at)'),
+        ],
+        responses={(200, 'text/csv'): str},
+        description=(
+            'Download every transaction matching the list filters as CSV. The file is streamed '
+            'while it is read from the database, so it is not paginated.'
+        )
+    )
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(csv_stream(queryset), content_type='text/csv; charset=utf-8')
+        file_name = f'transactions-{timezone.localdate():%Y%m%d}.csv'
+        response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+        return response
+
+    @extend_schema(
+        request=BulkOperationSerializer(many=True),
+        description=(
+            'Apply a batch of create/update/delete operations atomically. '
+            'Each operation is {"op": "create"|"update"|"delete", "id": <uuid, for update/delete>, '
+            '"data": <transaction fields, for create/update>}. If any operation is invalid nothing '
+            'is written and the response lists the errors by operation index.'
+        )
+    )
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        writer = BulkTransactionWriter(request.user)
+        results = writer.execute(request.data)
+        if writer.errors:
+            return Response({'errors': writer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='q',
+                type=str,
+                description='Partially typed description'
+            ),
+            OpenApiParameter(
+                name='limit',
+                type=int,
+                description='Maximum number of suggestions (default 10, at most 50)'
+            ),
+        ],
+        responses={200: DescriptionSuggestionSerializer(many=True)},
+        description='Suggest previously used descriptions with their usage count and last-used category and tags'
+    )
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response({'limit': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        suggestions = suggest_descriptions(request.user, request.query_params.get('q', ''), limit)
+        return Response(DescriptionSuggestionSerializer(suggestions, many=True).data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='count',
+                type=int,
+                description='Number of upcoming occurrences (default 10, at most 100)'
+            ),
+        ],
+        responses={200: RecurringOccurrenceSerializer(many=True)},
+        description='Preview the next occurrences of all recurring transactions without creating them'
+    )
+    @action(detail=False, methods=['get'])
+    def recurring(self, request):
+        try:
+            count = min(max(int(request.query_params.get('count', 10)), 1), 100)
+        except ValueError:
+            return Response({'count': 'count must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        occurrences = [
+            {'template': template, 'date': day}
+            for template, day in preview_occurrences(request.user, count)
+        ]
+        return Response(RecurringOccurrenceSerializer(occurrences, many=True).data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='until',
+                type=str,
+                description='Generate occurrences dated up to this date (YYYY-MM-DD); defaults to today'
+            ),
+        ],
+        request=RecurringBackfillSerializer,
+        description='Create every pending occurrence of the current user\'s recurring transactions'
+    )
+    @action(detail=False, methods=['post'], url_path='recurring/backfill')
+    def recurring_backfill(self, request):
+        serializer = RecurringBackfillSerializer(
+            data=request.query_params if 'until' in request.query_params else request.data
+        )
+        serializer.is_valid(raise_exception=True)
+        until = serializer.validated_data.get('until') or timezone.localdate()
+        created = materialize_due(until, user_id=request.user.id)
+        return Response({'created': created})
 
 class CategoryViewSet(viewsets.ModelViewSet):
     serializer_class = CategorySerializer
@@ -155,3 +414,16 @@ class TagViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         return Tag.objects.filter(user=self.request.user)
+
+class CategorizationRuleViewSet(viewsets.ModelViewSet):
+    serializer_class = CategorizationRuleSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    search_fields = ['name', 'pattern']
+    ordering_fields = ['priority', 'name', 'created_at']
+    ordering = ['priority', 'created_at']
+
+    def get_queryset(self):
+        return CategorizationRule.objects.filter(user=self.request.user).select_related(
+            'category'
+        ).prefetch_related('tags')
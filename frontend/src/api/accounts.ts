@@ -1,5 +1,5 @@
 import api from '../services/api';
-import type { Account, AccountFormData } from '../types/accounts';
+import type { Account, AccountBalances, AccountFormData } from '../types/accounts';
 
 const API_URL = '/accounts';
 
@@ -10,6 +10,12 @@ export const accountApi = {
     return Array.isArray(data) ? data : data.results || [];
   },
 
+  // Get the balance of every account at the end of a date (defaults to today)
+  getBalances: async (asOf?: string): Promise<AccountBalances> => {
+    const { data } = await api.get(`${API_URL}/balances/`, { params: asOf ? { as_of: asOf } : {} });
+    return data;
+  },
+
   // Get account by ID
   getAccount: async (id: string): Promise<Account> => {
     const { data } = await api.get(`${API_URL}/${id}/`);
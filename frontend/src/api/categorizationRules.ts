@@ -0,0 +1,22 @@
+import api from '../services/api';
+import type { CategorizationRule, CategorizationRuleFormData } from '../types/categorizationRule';
+
+const API_URL = '/transactions/categorization-rules/';
+
+export const categorizationRuleApi = {
+  getRules: async (): Promise<CategorizationRule[]> => {
+    const { data } = await api.get(API_URL);
+    return Array.isArray(data) ? data : data.results || [];
+  },
+  createRule: async (ruleData: CategorizationRuleFormData): Promise<CategorizationRule> => {
+    const { data } = await api.post(API_URL, ruleData);
+    return data;
+  },
+  updateRule: async (id: string, ruleData: Partial<CategorizationRuleFormData>): Promise<CategorizationRule> => {
+    const { data } = await api.patch(`${API_URL}${id}/`, ruleData);
+    return data;
+  },
+  deleteRule: async (id: string): Promise<void> => {
+    await api.delete(`${API_URL}${id}/`);
+  },
+};
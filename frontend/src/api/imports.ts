@@ -0,0 +1,154 @@
+import type {
+  ColumnMapping, ExportFilters, ExportFormat, ExportJob, ExportProgress, ImportDefaults, ImportJob, ImportProgress,
+  ImportTemplate, Upload,
+} from '../types/imports';
+import api from '../services/api';
+import { useAuthStore } from '../stores/authStore';
+
+const API_URL = '/files/';
+// Blocks sent per request
+const BLOCKS_PER_CHUNK = 2;
+
+// Follow a job's progress event stream, calling onProgress with each update
+// until the job ends. EventSource cannot send the bearer token, so the stream
+// is read with fetch. The server closes the stream every few seconds; it is
+// reopened after the advertised retry delay with Last-Event-ID, so the
+// snapshot already seen is not sent again.
+async function followProgress<T extends { status: string }>(
+  path: string, onProgress: (progress: T) => void, signal?: AbortSignal,
+): Promise<T> {
+  const decoder = new TextDecoder();
+  let last: T | undefined;
+  let lastEventId: string | undefined;
+  let retry = 1000;
+  for (;;) {
+    const headers: Record<string, string> = {
+      Accept: 'text/event-stream',
+      Authorization: `Bearer ${useAuthStore.getState().accessToken}`,
+    };
+    if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+    const response = await fetch(`${api.defaults.baseURL}${API_URL}${path}`, { headers, signal });
+    if (!response.ok || !response.body) throw new Error(`Progress stream failed: ${response.status}`);
+    const reader = response.body.getReader();
+    let buffer = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop() ?? '';
+      for (const event of events) {
+        const lines = event.split('\n');
+        const field = (name: string) => lines.find((line) => line.startsWith(`${name}: `))?.slice(name.length + 2);
+        const delay = field('retry');
+        if (delay) retry = Number(delay);
+        const data = field('data');
+        if (!data) continue;
+        lastEventId = field('id') ?? lastEventId;
+        last = JSON.parse(data) as T;
+        onProgress(last);
+      }
+    }
+    if (last && (last.status === 'COMPLETED' || last.status === 'FAILED')) return last;
+    await new Promise((resolve) => setTimeout(resolve, retry));
+  }
+}
+
+type ImportOptions = {
+  template_id?: number;
+  column_mapping?: ColumnMapping;
+  default_values?: ImportDefaults;
+};
+
+export const importApi = {
+  // Upload a file; the import runs in the background
+  uploadImport: async (file: File, options: ImportOptions = {}): Promise<ImportJob> => {
+    const form = new FormData();
+    form.append('file', file);
+    if (options.template_id) form.append('template_id', String(options.template_id));
+    if (options.column_mapping) form.append('column_mapping', JSON.stringify(options.column_mapping));
+    if (options.default_values) form.append('default_values', JSON.stringify(options.default_values));
+    const { data } = await api.post(`${API_URL}imports/`, form, {
+      headers: { 'Content-Type': 'multipart/form-data' },
+    });
+    return data;
+  },
+  // Import a completed chunked upload; the stored file is read in place
+  importUpload: async (upload_id: number, options: ImportOptions = {}): Promise<ImportJob> => {
+    const { data } = await api.post(`${API_URL}imports/`, { upload_id, ...options });
+    return data;
+  },
+  // Send a file in chunks, resuming from what the server holds after a failed request;
+  // pass the id of an earlier unfinished upload of the same file to continue it
+  uploadInChunks: async (file: File, uploadId?: number): Promise<Upload> => {
+    let upload: Upload = uploadId
+      ? (await api.get(`${API_URL}uploads/${uploadId}/`)).data
+      : (await api.post(`${API_URL}uploads/`, { file_name: file.name, size: file.size })).data;
+    while (upload.status === 'UPLOADING' && upload.received < upload.size) {
+      const end = Math.min(upload.received + upload.block_size * BLOCKS_PER_CHUNK, upload.size);
+      try {
+        ({ data: upload } = await api.put(`${API_URL}uploads/${upload.id}/chunk/`, file.slice(upload.received, end), {
+          params: { offset: upload.received },
+          headers: { 'Content-Type': 'application/octet-stream' },
+        }));
+      } catch (error: any) {
+        if (error?.response?.status !== 409) throw error;
+        upload = { ...upload, received: error.response.data.received };
+      }
+    }
+    const { data } = await api.post(`${API_URL}uploads/${upload.id}/finalize/`);
+    return data;
+  },
+  getImports: async (): Promise<ImportJob[]> => {
+    const { data } = await api.get(`${API_URL}imports/`);
+    return Array.isArray(data) ? data : data.results || [];
+  },
+  getImport: async (id: number): Promise<ImportJob> => {
+    const { data } = await api.get(`${API_URL}imports/${id}/`);
+    return data;
+  },
+  getImportProgress: async (id: number): Promise<ImportProgress> => {
+    const { data } = await api.get(`${API_URL}imports/${id}/progress/`);
+    return data;
+  },
+  followImport: (id: number, onProgress: (progress: ImportProgress) => void, signal?: AbortSignal) =>
+    followProgress<ImportProgress>(`imports/${id}/events/`, onProgress, signal),
+  deleteImport: async (id: number): Promise<void> => {
+    await api.delete(`${API_URL}imports/${id}/`);
+  },
+  getTemplates: async (): Promise<ImportTemplate[]> => {
+    const { data } = await api.get(`${API_URL}import-templates/`);
+    return Array.isArray(data) ? data : data.results || [];
+  },
+  createTemplate: async (template: Omit<ImportTemplate, 'id' | 'created_at' | 'updated_at'>): Promise<ImportTemplate> => {
+    const { data } = await api.post(`${API_URL}import-templates/`, template);
+    return data;
+  },
+  // Request an export; an unchanged earlier export is returned as is (200 instead of 201)
+  requestExport: async (format: ExportFormat, filters: ExportFilters = {},
+    date_range: { start_date?: string; end_date?: string } = {}): Promise<ExportJob> => {
+    const { data } = await api.post(`${API_URL}exports/`, { format, filters, date_range });
+    return data;
+  },
+  getExports: async (): Promise<ExportJob[]> => {
+    const { data } = await api.get(`${API_URL}exports/`);
+    return Array.isArray(data) ? data : data.results || [];
+  },
+  getExport: async (id: number): Promise<ExportJob> => {
+    const { data } = await api.get(`${API_URL}exports/${id}/`);
+    return data;
+  },
+  getExportProgress: async (id: number): Promise<ExportProgress> => {
+    const { data } = await api.get(`${API_URL}exports/${id}/progress/`);
+    return data;
+  },
+  followExport: (id: number, onProgress: (progress: ExportProgress) => void, signal?: AbortSignal) =>
+    followProgress<ExportProgress>(`exports/${id}/events/`, onProgress, signal),
+  downloadExport: async (id: number): Promise<Blob> => {
+    const { data } = await api.get(`${API_URL}exports/${id}/download/`, { responseType: 'blob' });
+    return data;
+  },
+  deleteExport: async (id: number): Promise<void> => {
+    await api.delete(`${API_URL}exports/${id}/`);
+  },
+};
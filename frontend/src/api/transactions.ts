@@ -1,5 +1,5 @@
 import api from '../services/api';
-import type { Transaction, TransactionFormData } from '../types/transaction';
+import type { DescriptionSuggestion, RecurringOccurrence, Transaction, TransactionFormData } from '../types/transaction';
 
 const API_URL = '/transactions/transactions/';
 
@@ -19,6 +19,21 @@ export const transactionApi = {
     return Array.isArray(data) ? data : data.results || [];
   },
 
+  // Download every transaction matching the filters as a CSV file
+  exportTransactions: async (params?: {
+    account_id?: string;
+    start_date?: string;
+    end_date?: string;
+    type?: 'INCOME' | 'EXPENSE' | 'TRANSFER';
+    category?: string;
+    tag_ids?: string[];
+    search?: string;
+    ordering?: string;
+  }): Promise<Blob> => {
+    const { data } = await api.get(`${API_URL}export/`, { params, responseType: 'blob' });
+    return data;
+  },
+
   // Get transaction by ID
   getTransaction: async (id: string): Promise<Transaction> => {
     const { data } = await api.get(`${API_URL}${id}/`);
@@ -55,4 +70,22 @@ export const transactionApi = {
     const { data } = await api.get(`${API_URL}stats`, { params });
     return data;
   },
+
+  // Suggest previously used descriptions for a partially typed one
+  getDescriptionSuggestions: async (params: { q: string; limit?: number }): Promise<DescriptionSuggestion[]> => {
+    const { data } = await api.get(`${API_URL}autocomplete/`, { params });
+    return data;
+  },
+
+  // Preview upcoming occurrences of recurring transactions
+  getRecurringPreview: async (count?: number): Promise<RecurringOccurrence[]> => {
+    const { data } = await api.get(`${API_URL}recurring/`, { params: count ? { count } : {} });
+    return data;
+  },
+
+  // Create every pending occurrence up to a date (defaults to today)
+  backfillRecurring: async (until?: string): Promise<{ created: number }> => {
+    const { data } = await api.post(`${API_URL}recurring/backfill/`, until ? { until } : {});
+    return data;
+  },
 }; 
\ No newline at end of file
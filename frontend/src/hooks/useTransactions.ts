@@ -69,4 +69,13 @@ export const useTransactionStats = (params?: {
     queryKey: ['transactionStats', params],
     queryFn: () => transactionApi.getTransactionStats(params),
   });
+};
+
+export const useDescriptionSuggestions = (q: string, limit?: number) => {
+  return useQuery({
+    queryKey: ['descriptionSuggestions', q, limit],
+    queryFn: () => transactionApi.getDescriptionSuggestions({ q, limit }),
+    enabled: q.trim().length > 0,
+    staleTime: 30 * 1000,
+  });
 }; 
\ No newline at end of file
@@ -23,6 +23,21 @@ export interface Account {
   updated_at: string;
 }
 
+export interface AccountBalance {
+  id: string;
+  name: string;
+  type: keyof AccountType;
+  currency: Currency;
+  balance: string;
+  base_balance: string | null;
+}
+
+export interface AccountBalances {
+  as_of: string;
+  total_base_balance: string | null;
+  accounts: AccountBalance[];
+}
+
 export interface AccountFormData {
   name: string;
   type: keyof AccountType;
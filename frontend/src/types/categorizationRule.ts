@@ -0,0 +1,36 @@
+import type { Category, CategoryType } from './category';
+import type { Tag } from './tag';
+
+export type RuleMatchType = 'CONTAINS' | 'STARTS_WITH' | 'EXACT' | 'REGEX';
+
+// Assigns a category and tags to imported transactions; lower priorities run first
+export interface CategorizationRule {
+  id: string;
+  name: string;
+  match_type: RuleMatchType;
+  pattern: string;
+  transaction_type: CategoryType | null;
+  account_id: string | null;
+  min_amount: string | null;
+  max_amount: string | null;
+  category: Category | null;
+  tags: Tag[];
+  priority: number;
+  is_active: boolean;
+  created_at: string;
+  updated_at: string;
+}
+
+export interface CategorizationRuleFormData {
+  name: string;
+  match_type: RuleMatchType;
+  pattern: string;
+  transaction_type?: CategoryType | null;
+  account_id?: string | null;
+  min_amount?: string | null;
+  max_amount?: string | null;
+  category_id?: string | null;
+  tag_ids?: string[];
+  priority?: number;
+  is_active?: boolean;
+}
@@ -0,0 +1,119 @@
+export type ImportStatus = 'PENDING' | 'PROCESSING' | 'COMPLETED' | 'FAILED';
+
+// Transaction field -> column header in the uploaded file
+export type ColumnMapping = Partial<Record<
+  'date' | 'amount' | 'debit' | 'credit' | 'type' | 'description' | 'account' | 'currency' | 'category'
+  | 'external_id',
+  string
+>>;
+
+// Values for fields no column provides, plus parse options
+export interface ImportDefaults {
+  type?: string;
+  description?: string;
+  account?: string;
+  currency?: string;
+  category?: string;
+  date_format?: string;
+  delimiter?: string;
+  decimal_separator?: string;
+  encoding?: string;
+  sheet?: string;
+  // What to do with rows matching a transaction that already exists
+  duplicates?: 'skip' | 'mark' | 'merge';
+  // Fill in missing categories from rules and past transactions (default true)
+  categorize?: boolean;
+}
+
+// Live counters of a job, from the progress endpoint and event stream
+export interface ImportProgress {
+  status: ImportStatus;
+  processed_records: number;
+  successful_records: number;
+  failed_records: number;
+  duplicate_records: number;
+  categorized_records: number;
+}
+
+export interface ExportProgress {
+  status: ImportStatus;
+  total_records: number;
+}
+
+export interface ImportRowError {
+  row: number;
+  errors: Record<string, string>;
+}
+
+export interface ImportJob {
+  id: number;
+  file_name: string;
+  file_type: string;
+  status: ImportStatus;
+  template_id: number | null;
+  column_mapping: ColumnMapping | null;
+  default_values: ImportDefaults | null;
+  total_records: number;
+  processed_records: number;
+  successful_records: number;
+  failed_records: number;
+  duplicate_records: number;
+  categorized_records: number;
+  error_message: string | null;
+  errors: ImportRowError[];
+  created_at: string;
+  updated_at: string;
+}
+
+export interface ImportTemplate {
+  id: number;
+  name: string;
+  description: string | null;
+  file_type: string;
+  column_mapping: ColumnMapping;
+  default_values: ImportDefaults | null;
+  is_default: boolean;
+  created_at: string;
+  updated_at: string;
+}
+
+export type ExportFormat = 'CSV' | 'XLSX' | 'PDF';
+
+// Same keys as the transaction list's query parameters
+export interface ExportFilters {
+  account_id?: string;
+  type?: 'INCOME' | 'EXPENSE' | 'TRANSFER';
+  category?: string;
+  tag_ids?: string[];
+  is_archived?: boolean;
+  search?: string;
+  ordering?: string;
+}
+
+export interface ExportJob {
+  id: number;
+  file_name: string;
+  format: ExportFormat;
+  status: ImportStatus;
+  filters: ExportFilters | null;
+  date_range: { start_date?: string; end_date?: string } | null;
+  total_records: number;
+  error_message: string | null;
+  download_url: string | null;
+  created_at: string;
+  updated_at: string;
+}
+
+export interface Upload {
+  id: number;
+  file_name: string;
+  size: number;
+  // Bytes stored so far; the next chunk starts here
+  received: number;
+  // Chunks are whole multiples of this, except the last
+  block_size: number;
+  content_hash: string;
+  status: 'UPLOADING' | 'COMPLETED';
+  created_at: string;
+  updated_at: string;
+}
@@ -27,7 +27,10 @@ export interface Transaction {
   tags: Tag[];
   is_recurring: boolean;
   recurring_rule: any | null;
+  next_occurrence: string | null;
   is_archived: boolean;
+  running_balance: string | null;
+  external_id: string | null;
   created_at: string;
   updated_at: string;
 }
@@ -52,4 +55,23 @@ export interface TransactionFilters {
   category?: string;
   start_date?: string;
   end_date?: string;
-} 
\ No newline at end of file
+}
+
+export interface DescriptionSuggestion {
+  description: string;
+  usage_count: number;
+  last_used: string | null;
+  category: Category | null;
+  tags: Tag[];
+}
+
+export interface RecurringOccurrence {
+  template_id: string;
+  date: string;
+  type: keyof TransactionType;
+  amount: string;
+  description: string;
+  currency: string;
+  account: string;
+  category: string | null;
+}